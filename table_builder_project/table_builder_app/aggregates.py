@@ -0,0 +1,105 @@
+from django.db.models import Avg, Count, IntegerField, Max, Min, Sum
+from django.db.models.functions import Cast
+
+from .filters import RowQueryError, get_data_type, get_model_field, parse_filters
+
+# Query parameters of the aggregate endpoint that are never treated as filters
+AGGREGATE_PARAMS = {'aggregates', 'group_by', 'format'}
+
+AGGREGATE_FUNCTIONS = {
+    'count': Count,
+    'count_distinct': Count,
+    'sum': Sum,
+    'avg': Avg,
+    'min': Min,
+    'max': Max,
+}
+
+# Data types that sum, avg, min and max apply to
+NUMERIC_DATA_TYPES = {'integer', 'boolean'}
+
+
+def parse_aggregates(dynamic_model, value):
+    """
+    Parse ``aggregates=count,sum:a,count_distinct:b`` into aggregate expressions.
+
+    Returns a dict of result name to expression, and the result names of
+    boolean ``min``/``max`` values that have to be converted back to booleans.
+    Booleans are aggregated as 0/1 integers, so that ``sum`` counts the true
+    values and ``avg`` gives their share.
+    """
+    aggregates = {}
+    boolean_results = set()
+    for part in filter(None, (part.strip() for part in value.split(','))):
+        function, _, name = part.partition(':')
+        if function not in AGGREGATE_FUNCTIONS:
+            supported = ', '.join(f'"{function}"' for function in AGGREGATE_FUNCTIONS)
+            raise RowQueryError(f'Unsupported aggregate: {function}. Supported aggregates are {supported}.')
+
+        if not name:
+            if function != 'count':
+                raise RowQueryError(f'The "{function}" aggregate needs a field, e.g. "{function}:field".')
+            aggregates['count'] = Count('pk')
+            continue
+
+        data_type = get_data_type(get_model_field(dynamic_model, name))
+        if function in ('count', 'count_distinct'):
+            expression = Count(name, distinct=function == 'count_distinct')
+        elif data_type not in NUMERIC_DATA_TYPES:
+            raise RowQueryError(f'The "{function}" aggregate only applies to integer and boolean fields.')
+        else:
+            source = Cast(name, IntegerField()) if data_type == 'boolean' else name
+            expression = AGGREGATE_FUNCTIONS[function](source)
+            if data_type == 'boolean' and function in ('min', 'max'):
+                boolean_results.add(f'{function}_{name}')
+        aggregates[f'{function}_{name}'] = expression
+
+    if not aggregates:
+        raise RowQueryError('Please provide at least one aggregate.')
+    return aggregates, boolean_results
+
+
+def parse_group_by(dynamic_model, value):
+    group_by = []
+    for name in filter(None, (part.strip() for part in value.split(','))):
+        get_model_field(dynamic_model, name)
+        if name not in group_by:
+            group_by.append(name)
+    return group_by
+
+
+class AggregateQuery:
+    """
+    Aggregates over the filtered rows of a dynamic table, optionally per group.
+
+    The aggregation runs in the database; only the results are fetched.
+    """
+
+    def __init__(self, dynamic_model, query_params):
+        self.dynamic_model = dynamic_model
+        self.condition = parse_filters(dynamic_model, query_params, reserved=AGGREGATE_PARAMS)
+        self.aggregates, self.boolean_results = parse_aggregates(
+            dynamic_model, query_params.get('aggregates', 'count')
+        )
+        self.group_by = parse_group_by(dynamic_model, query_params.get('group_by', ''))
+
+        conflicts = set(self.aggregates) & {field.name for field in dynamic_model._meta.fields}
+        if conflicts:
+            raise RowQueryError(f'Aggregate result name conflicts with a field: {", ".join(sorted(conflicts))}.')
+
+    def execute(self):
+        """
+        Return a dict of results, or a list of them per group when grouping.
+        """
+        queryset = self.dynamic_model.objects.filter(self.condition)
+        if not self.group_by:
+            return self._convert(queryset.aggregate(**self.aggregates))
+
+        groups = queryset.values(*self.group_by).annotate(**self.aggregates).order_by(*self.group_by)
+        return [self._convert(group) for group in groups]
+
+    def _convert(self, result):
+        for name in self.boolean_results:
+            if result[name] is not None:
+                result[name] = bool(result[name])
+        return result
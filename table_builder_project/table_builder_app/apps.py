@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class TableBuilderAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'table_builder_app'
+
+    def ready(self):
+        from .metrics import count_connection, install_query_timer
+        # Register the job handlers defined next to the operations they run
+        from . import bulk, deletes, online, updates  # noqa: F401
+
+        connection_created.connect(count_connection, dispatch_uid='table_builder_app.count_connection')
+        connection_created.connect(install_query_timer, dispatch_uid='table_builder_app.install_query_timer')
@@ -0,0 +1,228 @@
+import functools
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.http import JsonResponse
+from dynamic_models.models import ModelSchema
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .buffering import row_write_buffer
+from .caching import get_etag, get_not_modified_response, get_table_version, set_conditional_headers
+from .changes import change_feed_response, record_rows_added
+from .filters import RowQuery, keyset_condition
+from .pagination import get_cursor, get_keyset_params
+from .partitions import ensure_partitions, get_partitioning
+from .registry import aget_model_schema, model_registry
+from .routers import reads_from_replica
+from .search import get_table_search
+from .streaming import STREAM_CONTENT_TYPES, async_streaming_rows_response
+
+
+def check_api_permissions(request):
+    """
+    Authenticate a request with the REST framework settings used by the other views.
+
+    Returns an error response, or None if the request may proceed.
+    """
+    drf_request = Request(
+        request, authenticators=[authentication() for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    )
+    try:
+        for permission in (permission() for permission in api_settings.DEFAULT_PERMISSION_CLASSES):
+            if permission.has_permission(drf_request, None):
+                continue
+            if drf_request.authenticators and not drf_request.successful_authenticator:
+                authenticate_header = drf_request.authenticators[0].authenticate_header(drf_request)
+                if authenticate_header:
+                    response = JsonResponse(
+                        {'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED
+                    )
+                    response['WWW-Authenticate'] = authenticate_header
+                    return response
+            return JsonResponse(
+                {'detail': 'You do not have permission to perform this action.'}, status=status.HTTP_403_FORBIDDEN
+            )
+    except APIException as e:
+        return JsonResponse({'detail': e.detail}, status=e.status_code)
+
+    request.user = drf_request.user
+    return None
+
+
+def async_api_view(http_method_names):
+    """
+    Async counterpart of ``@api_view`` for plain Django async views.
+
+    Applies the same authentication and permission checks; CSRF is enforced
+    by session authentication, as for the REST framework views.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in http_method_names:
+                return JsonResponse(
+                    {'detail': f'Method "{request.method}" not allowed.'}, status=status.HTTP_405_METHOD_NOT_ALLOWED
+                )
+            error = await sync_to_async(check_api_permissions)(request)
+            if error is not None:
+                return error
+            return await view(request, *args, **kwargs)
+
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+def insert_row(model_schema, dynamic_model, row):
+    """
+    Insert a row and record it in one transaction, like the synchronous endpoint.
+    """
+    ensure_partitions(get_partitioning(model_schema), dynamic_model, [row])
+    with transaction.atomic():
+        row.save(force_insert=True)
+        record_rows_added(model_schema, dynamic_model, [row.pk])
+
+
+@async_api_view(['POST'])
+async def add_row_to_dynamic_table_async(request, id):
+    try:
+        fields_data = json.loads(request.body).get('fields')
+    except (ValueError, AttributeError):
+        fields_data = None
+    if not fields_data or not isinstance(fields_data, dict):
+        return JsonResponse(
+            {'error': 'Invalid fields data. Expected a dictionary with field names and values.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        model_schema = await aget_model_schema(id)
+    except ModelSchema.DoesNotExist:
+        return JsonResponse(
+            {'error': 'Table with the provided ID does not exist.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    try:
+        dynamic_model = await model_registry.aget_model(model_schema)
+        values, errors = (await model_registry.aget_validator(model_schema)).validate(fields_data)
+        if errors:
+            return JsonResponse(
+                {'error': 'Invalid fields data. The values do not match the table schema.', 'errors': errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Concurrent inserts can share one transaction through the write buffer, as in the synchronous view
+        if settings.ROW_WRITE_BUFFER:
+            pending = row_write_buffer.add(model_schema, dynamic_model, values)
+            if settings.ROW_WRITE_BUFFER == 'async':
+                return JsonResponse(
+                    {'message': 'New row accepted and will be added shortly.'},
+                    status=status.HTTP_202_ACCEPTED
+                )
+            # Wait outside the thread of the sync views, which must not block on the buffer
+            await sync_to_async(pending.wait, thread_sensitive=False)()
+            if pending.error is not None:
+                raise pending.error
+        else:
+            await sync_to_async(insert_row)(model_schema, dynamic_model, dynamic_model(**values))
+    except ValidationError as e:
+        return JsonResponse(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except Exception as e:
+        return JsonResponse(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    return JsonResponse(
+        {'message': 'New row added successfully!'},
+        status=status.HTTP_201_CREATED
+    )
+
+
+@reads_from_replica
+@async_api_view(['GET'])
+async def get_all_rows_in_dynamic_table_async(request, id):
+    try:
+        model_schema = await aget_model_schema(id)
+    except ModelSchema.DoesNotExist:
+        return JsonResponse(
+            {'error': 'Table with the provided ID does not exist.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    stream_format = request.GET.get('stream', 'json')
+    if stream_format not in STREAM_CONTENT_TYPES:
+        return JsonResponse(
+            {'error': f'Invalid stream format: {stream_format}. Supported formats are "json" and "ndjson".'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    table_version = get_table_version(model_schema)
+    etag = get_etag(table_version, stream_format)
+    not_modified = get_not_modified_response(request, table_version, etag)
+    if not_modified is not None:
+        return set_conditional_headers(not_modified, table_version, etag)
+
+    # Same query parameters as the synchronous rows endpoint; building the query does not touch the database
+    try:
+        dynamic_model = await model_registry.aget_model(model_schema)
+        row_query = RowQuery(dynamic_model, request.GET, get_table_search(model_schema))
+        after, limit = get_keyset_params(request.GET)
+        cursor = get_cursor(request.GET, len(row_query.ordering))
+    except ValueError as e:
+        return JsonResponse(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if after is not None and not row_query.is_default_ordering:
+        return JsonResponse(
+            {'error': 'The "after" parameter only applies to rows ordered by id. Use "cursor" together with "ordering".'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    rows = row_query.get_queryset()
+    if after is not None:
+        rows = rows.filter(pk__gt=after)
+    if cursor is not None:
+        rows = rows.filter(keyset_condition(row_query.ordering, cursor))
+    if limit is not None:
+        rows = rows[:limit]
+
+    return set_conditional_headers(async_streaming_rows_response(rows, stream_format), table_version, etag)
+
+
+@async_api_view(['GET'])
+async def dynamic_table_changes(request, id):
+    try:
+        model_schema = await aget_model_schema(id)
+    except ModelSchema.DoesNotExist:
+        return JsonResponse(
+            {'error': 'Table with the provided ID does not exist.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    # EventSource clients resume with the id of the last event they received
+    after = request.headers.get('Last-Event-ID', request.GET.get('after'))
+    if after is not None:
+        try:
+            after = int(after)
+            if after < 0:
+                raise ValueError
+        except ValueError:
+            return JsonResponse(
+                {'error': 'The "after" parameter and the Last-Event-ID header must be a change id.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    return change_feed_response(model_schema.id, after)
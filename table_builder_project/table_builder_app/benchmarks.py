@@ -0,0 +1,212 @@
+import statistics
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from dynamic_models.models import ModelSchema
+from rest_framework.test import APIClient
+
+from .bulk import bulk_insert_rows
+from .registry import get_model_schema, model_registry
+
+SCENARIOS = ('create_table', 'insert_row', 'insert_bulk', 'read_rows', 'update_schema')
+
+# Latency and query count metrics compared against a baseline
+COMPARED_METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'queries')
+
+
+class BenchmarkError(RuntimeError):
+    """
+    Raised when a request made by a benchmark does not succeed.
+    """
+
+
+class BenchmarkResult:
+    """
+    Latencies and query counts of the requests of one scenario with one set of parameters.
+    """
+
+    def __init__(self, scenario, params):
+        self.scenario = scenario
+        self.params = params
+        self.latencies = []
+        self.queries = []
+        self.rows = 0
+
+    def summary(self):
+        summary = {
+            'scenario': self.scenario,
+            'params': self.params,
+            'runs': len(self.latencies),
+            'mean_ms': round(statistics.fmean(self.latencies) * 1000, 3),
+            'queries': round(statistics.fmean(self.queries), 2),
+        }
+        for percentile in (50, 95, 99):
+            summary[f'p{percentile}_ms'] = round(get_percentile(self.latencies, percentile) * 1000, 3)
+        if self.rows:
+            summary['rows_per_second'] = round(self.rows / sum(self.latencies), 1)
+        return summary
+
+
+def get_percentile(values, percentile):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[percentile - 1]
+
+
+class BenchmarkRunner:
+    """
+    Time the API endpoints through the full request stack with a test client.
+
+    Every table gets a name unique to the run, so a run can share a database
+    with real data; cleanup() drops the tables again.
+    """
+
+    def __init__(self, repeat, field_counts, bulk_sizes, table_sizes):
+        self.repeat = repeat
+        self.field_counts = field_counts
+        self.bulk_sizes = bulk_sizes
+        self.table_sizes = table_sizes
+        self.run_id = uuid.uuid4().hex[:8]
+        self.table_ids = []
+
+        self.client = APIClient()
+        user, _ = User.objects.get_or_create(username=f'bench_{self.run_id}')
+        self.user = user
+        self.client.force_authenticate(user=user)
+
+    def run(self, scenarios=SCENARIOS):
+        results = []
+        for scenario in scenarios:
+            results += getattr(self, f'bench_{scenario}')()
+        return results
+
+    def cleanup(self):
+        for model_schema in ModelSchema.objects.filter(id__in=self.table_ids):
+            model_schema.delete()
+        self.user.delete()
+
+    def request(self, result, method, url, data=None, rows=0):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            if method == 'get':
+                response = self.client.get(url, data)
+            else:
+                response = getattr(self.client, method)(url, data, format='json')
+            elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            raise BenchmarkError(f'{method.upper()} {url} returned {response.status_code}: {response.content[:200]!r}')
+
+        result.latencies.append(elapsed)
+        result.queries.append(len(queries))
+        result.rows += rows
+        return response
+
+    def create_table(self, name, fields, result=None):
+        result = result or BenchmarkResult('setup', {})
+        self.request(result, 'post', reverse('create_dynamic_table'), {'table_name': name, 'fields': fields})
+        model_schema = ModelSchema.objects.get(name=name)
+        self.table_ids.append(model_schema.id)
+        return model_schema
+
+    def create_filled_table(self, name, row_count):
+        fields = [{'name': 'label', 'type': 'string'}, {'name': 'amount', 'type': 'integer'}, {'name': 'flag', 'type': 'boolean'}]
+        model_schema = self.create_table(name, fields)
+        dynamic_model = model_registry.get_model(get_model_schema(model_schema.id))
+        bulk_insert_rows(dynamic_model, (make_row(index) for index in range(row_count)))
+        return model_schema
+
+    def bench_create_table(self):
+        results = []
+        for field_count in self.field_counts:
+            result = BenchmarkResult('create_table', {'fields': field_count})
+            fields = [{'name': f'field{index}', 'type': ('string', 'integer', 'boolean')[index % 3]} for index in range(field_count)]
+            for run in range(self.repeat):
+                self.create_table(f'bench{self.run_id}_create_{field_count}_{run}', fields, result)
+            results.append(result)
+        return results
+
+    def bench_insert_row(self):
+        model_schema = self.create_filled_table(f'bench{self.run_id}_insert_row', 0)
+        url = reverse('add_row_to_dynamic_table', kwargs={'id': model_schema.id})
+        result = BenchmarkResult('insert_row', {})
+        for index in range(self.repeat):
+            self.request(result, 'post', url, {'fields': make_row(index)}, rows=1)
+        return [result]
+
+    def bench_insert_bulk(self):
+        results = []
+        for bulk_size in self.bulk_sizes:
+            model_schema = self.create_filled_table(f'bench{self.run_id}_insert_bulk_{bulk_size}', 0)
+            url = reverse('bulk_add_rows_to_dynamic_table', kwargs={'id': model_schema.id})
+            rows = [make_row(index) for index in range(bulk_size)]
+            result = BenchmarkResult('insert_bulk', {'rows': bulk_size})
+            for _ in range(self.repeat):
+                self.request(result, 'post', url, rows, rows=bulk_size)
+            results.append(result)
+        return results
+
+    def bench_read_rows(self):
+        results = []
+        for table_size in self.table_sizes:
+            model_schema = self.create_filled_table(f'bench{self.run_id}_read_{table_size}', table_size)
+            url = reverse('get_all_rows_in_dynamic_table', kwargs={'id': model_schema.id})
+            for params in ({}, {'limit': 100}, {'amount__gte': table_size // 2, 'limit': 100}):
+                result = BenchmarkResult('read_rows', {'table_rows': table_size, **params})
+                for _ in range(self.repeat):
+                    response = self.request(result, 'get', url, params)
+                    result.rows += len(response.data)
+                results.append(result)
+        return results
+
+    def bench_update_schema(self):
+        results = []
+        for table_size in self.table_sizes:
+            model_schema = self.create_filled_table(f'bench{self.run_id}_update_{table_size}', table_size)
+            url = reverse('update_dynamic_table', kwargs={'id': model_schema.id})
+            result = BenchmarkResult('update_schema', {'table_rows': table_size})
+            # Alternate the type of a column, which rewrites the whole table each time
+            for run in range(self.repeat):
+                amount_type = 'string' if run % 2 == 0 else 'integer'
+                fields = [{'name': 'label', 'type': 'string'}, {'name': 'amount', 'type': amount_type}, {'name': 'flag', 'type': 'boolean'}]
+                self.request(result, 'put', url, {'fields': fields}, rows=table_size)
+            results.append(result)
+        return results
+
+
+def make_row(index):
+    return {'label': f'row {index}', 'amount': index, 'flag': index % 2 == 0}
+
+
+def compare_results(summaries, baseline, threshold):
+    """
+    Compare result summaries with the ones of a baseline run.
+
+    Returns a list of ``(key, metric, baseline, current, change)`` tuples, with
+    ``change`` as a fraction, and the subset of them that got worse by more
+    than ``threshold``.
+    """
+    baseline = {summary_key(summary): summary for summary in baseline}
+    comparisons = []
+    regressions = []
+    for summary in summaries:
+        previous = baseline.get(summary_key(summary))
+        if previous is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if not previous.get(metric):
+                continue
+            change = (summary[metric] - previous[metric]) / previous[metric]
+            comparison = (summary_key(summary), metric, previous[metric], summary[metric], change)
+            comparisons.append(comparison)
+            if change > threshold:
+                regressions.append(comparison)
+    return comparisons, regressions
+
+
+def summary_key(summary):
+    params = ','.join(f'{name}={value}' for name, value in sorted(summary['params'].items()))
+    return f'{summary["scenario"]}[{params}]'
@@ -0,0 +1,181 @@
+import atexit
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .metrics import buffered_rows_failed, row_buffer_batch_rows, row_buffer_flush_duration
+from .changes import record_rows_added
+from .partitions import ensure_partitions, get_partitioning
+
+
+class PendingRow:
+    """
+    Row waiting in a RowWriteBuffer; wait() returns once it was written or failed.
+    """
+
+    def __init__(self, values):
+        self.values = values
+        self.pk = None
+        self.error = None
+        self._done = threading.Event()
+
+    def finish(self, pk=None, error=None):
+        self.pk = pk
+        self.error = error
+        if error is not None:
+            buffered_rows_failed.inc()
+        self._done.set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+
+class _Batch:
+    def __init__(self, model_schema, dynamic_model):
+        self.model_schema = model_schema
+        self.dynamic_model = dynamic_model
+        self.started = time.monotonic()
+        self.rows = []
+
+
+class RowWriteBuffer:
+    """
+    Group commit for single-row inserts.
+
+    Rows are collected per table and written by a background thread, in one
+    transaction with a multi-row ``INSERT``, as soon as
+    ``ROW_WRITE_BUFFER_MAX_ROWS`` rows are waiting or the oldest one has
+    waited ``ROW_WRITE_BUFFER_MAX_DELAY`` seconds. Many concurrent inserts
+    then share a single commit, and its flush to disk, instead of paying
+    for one each.
+    """
+
+    def __init__(self):
+        self._batches = {}
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def add(self, model_schema, dynamic_model, values):
+        """
+        Queue the validated values of a row and return its PendingRow.
+        """
+        pending = PendingRow(values)
+        with self._cond:
+            # The model class changes with the schema, so rows of different versions are never mixed
+            key = (model_schema.id, dynamic_model)
+            batch = self._batches.get(key)
+            if batch is None:
+                batch = self._batches[key] = _Batch(model_schema, dynamic_model)
+            batch.rows.append(pending)
+
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='row-write-buffer', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return pending
+
+    def flush(self):
+        """
+        Write every waiting row at once, e.g. when the process exits.
+        """
+        with self._cond:
+            batches = list(self._batches.values())
+            self._batches.clear()
+        for batch in batches:
+            self._flush(batch)
+
+    def stop(self):
+        """
+        Stop the background thread, closing its connection, and write the rows still waiting.
+        """
+        with self._cond:
+            thread, self._thread = self._thread, None
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def _run(self):
+        current = threading.current_thread()
+        try:
+            while True:
+                with self._cond:
+                    due = self._take_due_batches()
+                    while not due:
+                        if self._thread is not current:
+                            return
+                        self._cond.wait(timeout=self._get_next_deadline())
+                        due = self._take_due_batches()
+                for batch in due:
+                    self._flush(batch)
+        finally:
+            connection.close()
+
+    def _take_due_batches(self):
+        now = time.monotonic()
+        due = [
+            key for key, batch in self._batches.items()
+            if len(batch.rows) >= settings.ROW_WRITE_BUFFER_MAX_ROWS
+            or now - batch.started >= settings.ROW_WRITE_BUFFER_MAX_DELAY
+        ]
+        return [self._batches.pop(key) for key in due]
+
+    def _get_next_deadline(self):
+        if not self._batches:
+            return None
+        started = min(batch.started for batch in self._batches.values())
+        return max(started + settings.ROW_WRITE_BUFFER_MAX_DELAY - time.monotonic(), 0)
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        # The thread keeps its connection between flushes, like a request thread
+        connection.close_if_unusable_or_obsolete()
+        try:
+            write_rows(batch.model_schema, batch.dynamic_model, batch.rows)
+        except Exception as e:
+            for pending in batch.rows:
+                if not pending.wait(0):
+                    pending.finish(error=e)
+        finally:
+            labels = {'table_id': batch.model_schema.id}
+            row_buffer_batch_rows.observe(len(batch.rows), **labels)
+            row_buffer_flush_duration.observe(time.perf_counter() - start, **labels)
+
+
+def write_rows(model_schema, dynamic_model, rows):
+    """
+    Insert the rows of a batch in one transaction, or one by one if the batch fails.
+    """
+    partitioning = get_partitioning(model_schema)
+    try:
+        instances = [dynamic_model(**pending.values) for pending in rows]
+        ensure_partitions(partitioning, dynamic_model, instances)
+        with transaction.atomic():
+            dynamic_model.objects.bulk_create(instances)
+            record_rows_added(model_schema, dynamic_model, [instance.pk for instance in instances])
+    except Exception:
+        pass
+    else:
+        for pending, instance in zip(rows, instances):
+            pending.finish(pk=instance.pk)
+        return
+
+    # A single bad row must not fail the other requests of the batch
+    for pending in rows:
+        try:
+            instance = dynamic_model(**pending.values)
+            ensure_partitions(partitioning, dynamic_model, [instance])
+            with transaction.atomic():
+                instance.save(force_insert=True)
+                record_rows_added(model_schema, dynamic_model, [instance.pk])
+            pending.finish(pk=instance.pk)
+        except Exception as e:
+            pending.finish(error=e)
+
+
+row_write_buffer = RowWriteBuffer()
+
+# Accepted rows of fire-and-forget inserts are still written on a clean shutdown
+atexit.register(row_write_buffer.stop)
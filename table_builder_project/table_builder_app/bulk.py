@@ -0,0 +1,451 @@
+import io
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import DatabaseError, connection, transaction
+from rest_framework.exceptions import ParseError
+
+from .changes import record_rows_added
+from .jobs import job_handler
+from .models import Job
+from .partitions import ensure_partitions, get_partitioning
+from .registry import get_model_schema, model_registry
+from .utils import copy_from_stdin, iter_batches
+from .validation import RowValidator
+
+
+class BulkInsertResult:
+    def __init__(self):
+        self.total = 0
+        self.inserted = 0
+        self.errors = []
+
+    def add_error(self, index, errors):
+        self.errors.append({'index': index, 'errors': errors})
+
+
+def build_row(dynamic_model, validator, row):
+    """
+    Validate a single row against the table schema.
+
+    Returns an unsaved model instance and None, or None and a dict of errors
+    keyed by field name.
+    """
+    if isinstance(row, ParseError):
+        return None, {'non_field_errors': [str(row.detail)]}
+
+    values, errors = validator.validate(row)
+    if errors:
+        return None, errors
+    return dynamic_model(**values), None
+
+
+def bulk_insert_rows(dynamic_model, rows, partitioning=None, progress=None, validator=None, written=None):
+    """
+    Validate and insert rows in batches of ``BULK_INSERT_BATCH_SIZE``.
+
+    Invalid rows are reported by their index in the payload and skipped; they
+    never abort the rest of the batch. Once a payload grows past
+    ``BULK_INSERT_COPY_THRESHOLD`` rows, batches are written with
+    ``COPY FROM STDIN`` on Postgres instead of ``bulk_create``. For a
+    partitioned table, the partitions of each batch are created before it
+    is written. ``progress`` is called with the number of rows processed so
+    far after each batch. Rows are checked with ``validator``, by default a
+    RowValidator compiled for this call. ``written`` is called with the ids
+    of the inserted rows, in the transaction that inserts them.
+    """
+    validator = validator or RowValidator(dynamic_model)
+    result = BulkInsertResult()
+    known_total = len(rows) if isinstance(rows, list) else None
+    use_copy_backend = connection.vendor == 'postgresql'
+
+    for batch in iter_batches(rows, settings.BULK_INSERT_BATCH_SIZE):
+        valid = []
+        for row in batch:
+            instance, errors = build_row(dynamic_model, validator, row)
+            if errors:
+                result.add_error(result.total, errors)
+            else:
+                valid.append((result.total, instance))
+            result.total += 1
+
+        if valid:
+            payload_size = known_total if known_total is not None else result.total
+            use_copy = (
+                use_copy_backend
+                and payload_size > settings.BULK_INSERT_COPY_THRESHOLD
+                and all(instance.pk is None for _, instance in valid)
+            )
+            result.inserted += _write_batch(dynamic_model, valid, use_copy, result, partitioning, written)
+        if progress is not None:
+            progress(result.total)
+
+    return result
+
+
+def _write_batch(dynamic_model, indexed_instances, use_copy, result, partitioning, written):
+    instances = [instance for _, instance in indexed_instances]
+    try:
+        ensure_partitions(partitioning, dynamic_model, instances)
+        with transaction.atomic():
+            if use_copy:
+                copy_rows(dynamic_model, instances)
+            else:
+                dynamic_model.objects.bulk_create(instances)
+            if written is not None:
+                written([instance.pk for instance in instances])
+        return len(instances)
+    except (DatabaseError, ValidationError):
+        pass
+
+    # The batch was rejected as a whole; retry row by row to find the offenders
+    inserted = 0
+    for index, instance in indexed_instances:
+        try:
+            ensure_partitions(partitioning, dynamic_model, [instance])
+            with transaction.atomic():
+                instance.save(force_insert=True)
+                if written is not None:
+                    written([instance.pk])
+            inserted += 1
+        except ValidationError as e:
+            result.add_error(index, {'non_field_errors': e.messages})
+        except DatabaseError as e:
+            result.add_error(index, {'non_field_errors': [str(e).strip()]})
+    return inserted
+
+
+def copy_rows(dynamic_model, instances):
+    """
+    Write instances with a single ``COPY ... FROM STDIN`` statement (Postgres only).
+
+    COPY cannot return the ids of new rows, so they are taken from the id
+    sequence beforehand and set on the instances, as bulk_create() does.
+    """
+    quote_name = connection.ops.quote_name
+    table = dynamic_model._meta.db_table
+    pk = dynamic_model._meta.pk
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+            [quote_name(table), pk.column, len(instances)]
+        )
+        for instance, (pk_value,) in zip(instances, cursor.fetchall()):
+            instance.pk = pk_value
+
+    fields = dynamic_model._meta.concrete_fields
+    buffer = io.StringIO()
+    for instance in instances:
+        values = (field.get_db_prep_save(getattr(instance, field.attname), connection) for field in fields)
+        buffer.write(','.join(_copy_value(value) for value in values))
+        buffer.write('\n')
+
+    columns = ', '.join(quote_name(field.column) for field in fields)
+    sql = f'COPY {quote_name(table)} ({columns}) FROM STDIN WITH (FORMAT csv)'
+    with connection.cursor() as cursor:
+        copy_from_stdin(cursor, sql, buffer.getvalue())
+
+
+def _copy_value(value):
+    # In CSV format an unquoted empty value is NULL and a quoted one is ''
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (int, float)):
+        return str(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class BulkUpsertResult(BulkInsertResult):
+    def __init__(self):
+        super().__init__()
+        self.updated = 0
+        self.pks = []
+
+    def add_written(self, returned):
+        for pk, inserted in returned:
+            self.pks.append(pk)
+            if inserted:
+                self.inserted += 1
+            else:
+                self.updated += 1
+
+
+def get_upsert_key(model_schema, dynamic_model, name):
+    """
+    Return the fields identifying the rows of an upsert on the ``name`` field.
+
+    The key is the primary key or a field with a unique index without a
+    condition. Unique indexes of a partitioned table include its partition
+    key, which is then part of the key as well.
+    """
+    try:
+        field = dynamic_model._meta.get_field(name)
+    except FieldDoesNotExist:
+        raise ValidationError(f'Unknown key field: {name}.')
+
+    unique_fields = {
+        tuple(table_index.fields) for table_index in model_schema.table_indexes.all()
+        if table_index.unique and not table_index.condition
+    }
+    if not (field.primary_key or field.unique or (field.name,) in unique_fields):
+        raise ValidationError('The key must be "id" or a field with a unique index without a condition.')
+
+    key_fields = [field]
+    partitioning = get_partitioning(model_schema)
+    if partitioning is not None and field.primary_key and partitioning.field != field.attname:
+        key_fields.append(dynamic_model._meta.get_field(partitioning.field))
+    return key_fields
+
+
+def bulk_upsert_rows(dynamic_model, key_fields, rows, partitioning=None, validator=None, written=None):
+    """
+    Insert rows, or update the existing rows with the same key, in batches (Postgres only).
+
+    Complete rows are written with ``INSERT ... ON CONFLICT DO UPDATE``,
+    which tells inserted rows from updated ones. Rows may leave out fields to
+    keep their current values; they are written with an ``UPDATE`` and only
+    apply to existing rows. Errors are reported by row index, as for
+    bulk_insert_rows(). ``written`` is called with the ids of the rows of
+    each batch, in its transaction.
+    """
+    validator = validator or RowValidator(dynamic_model)
+    key_names = [field.attname for field in key_fields]
+    result = BulkUpsertResult()
+
+    for batch in iter_batches(rows, settings.BULK_INSERT_BATCH_SIZE):
+        valid = []
+        keys = set()
+        for row in batch:
+            index = result.total
+            result.total += 1
+            if isinstance(row, ParseError):
+                result.add_error(index, {'non_field_errors': [str(row.detail)]})
+                continue
+
+            values, errors = validator.validate(row, partial=True)
+            if not errors:
+                errors = {name: ['This field is required.'] for name in key_names if values.get(name) is None}
+            if not errors:
+                # A statement cannot update the same row twice
+                key = tuple(values[name] for name in key_names)
+                if key in keys:
+                    errors = {'non_field_errors': ['Another row of the same batch has this key.']}
+                keys.add(key)
+            if errors:
+                result.add_error(index, errors)
+            else:
+                valid.append((index, values))
+
+        if valid:
+            _upsert_batch(dynamic_model, key_fields, set(validator.required), valid, result, partitioning, written)
+
+    return result
+
+
+def _upsert_batch(dynamic_model, key_fields, required, indexed_values, result, partitioning, written):
+    # Rows with the same set of fields share a statement
+    groups = {}
+    for index, values in indexed_values:
+        groups.setdefault(frozenset(values), []).append((index, values))
+    try:
+        ensure_partitions(partitioning, dynamic_model, [dynamic_model(**values) for _, values in indexed_values])
+        with transaction.atomic():
+            returned = []
+            missing = []
+            for names, group in groups.items():
+                group_returned, group_missing = _write_group(dynamic_model, key_fields, required, names, group, partitioning)
+                returned += group_returned
+                missing += group_missing
+            _finish_upsert(dynamic_model, key_fields, returned, result, written)
+        _add_missing_errors(result, missing)
+        return
+    except (DatabaseError, ValidationError):
+        pass
+
+    # The batch was rejected as a whole; retry row by row to find the offenders
+    for index, values in indexed_values:
+        try:
+            ensure_partitions(partitioning, dynamic_model, [dynamic_model(**values)])
+            with transaction.atomic():
+                returned, missing = _write_group(
+                    dynamic_model, key_fields, required, values, [(index, values)], partitioning
+                )
+                _finish_upsert(dynamic_model, key_fields, returned, result, written)
+            _add_missing_errors(result, missing)
+        except ValidationError as e:
+            result.add_error(index, {'non_field_errors': e.messages})
+        except DatabaseError as e:
+            result.add_error(index, {'non_field_errors': [str(e).strip()]})
+
+
+def _write_group(dynamic_model, key_fields, required, names, group, partitioning=None):
+    """
+    Write rows with the same fields. Returns ``(id, inserted)`` pairs and the
+    indexes of partial rows that matched no existing row.
+    """
+    rows = [values for _, values in group]
+    if required <= set(names):
+        if partitioning is not None:
+            return insert_then_update_values(dynamic_model, key_fields, names, rows), []
+        return upsert_values(dynamic_model, key_fields, names, rows), []
+
+    pks = {tuple(key): pk for pk, *key in update_values(dynamic_model, key_fields, names, rows)}
+    returned = []
+    missing = []
+    for index, values in group:
+        pk = pks.get(tuple(values[field.attname] for field in key_fields))
+        if pk is None:
+            missing.append(index)
+        else:
+            returned.append((pk, False))
+    return returned, missing
+
+
+def _add_missing_errors(result, missing):
+    for index in missing:
+        result.add_error(index, {'non_field_errors': ['No row has this key. New rows need values for all fields.']})
+
+
+def _finish_upsert(dynamic_model, key_fields, returned, result, written):
+    if key_fields[0].primary_key and any(inserted for _, inserted in returned):
+        sync_pk_sequence(dynamic_model)
+    if written is not None:
+        written([pk for pk, _ in returned])
+    result.add_written(returned)
+
+
+def upsert_values(dynamic_model, key_fields, names, rows):
+    """
+    Write rows that all have the fields in ``names`` with one statement.
+
+    Returns ``(id, inserted)`` for every row; ``xmax`` is only zero for a
+    row version created by an insert.
+    """
+    quote_name = connection.ops.quote_name
+    fields = [field for field in dynamic_model._meta.concrete_fields if field.attname in names]
+    updated = [field for field in fields if field not in key_fields] or key_fields[:1]
+
+    columns = ', '.join(quote_name(field.column) for field in fields)
+    placeholders = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    conflict = ', '.join(quote_name(field.column) for field in key_fields)
+    assignments = ', '.join(f'{quote_name(field.column)} = EXCLUDED.{quote_name(field.column)}' for field in updated)
+    params = [field.get_db_prep_save(values[field.attname], connection) for values in rows for field in fields]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote_name(dynamic_model._meta.db_table)} ({columns}) '
+            f'VALUES {", ".join([placeholders] * len(rows))} '
+            f'ON CONFLICT ({conflict}) DO UPDATE SET {assignments} '
+            f'RETURNING {quote_name(dynamic_model._meta.pk.column)}, (xmax = 0)',
+            params
+        )
+        return cursor.fetchall()
+
+
+def insert_then_update_values(dynamic_model, key_fields, names, rows):
+    """
+    Write rows that all have the fields in ``names`` to a partitioned table.
+
+    Partitioned tables cannot return ``xmax``, so rows are inserted with
+    ``ON CONFLICT DO NOTHING`` first and the rows that were not inserted
+    are then updated. Returns ``(id, inserted)`` for every row.
+    """
+    quote_name = connection.ops.quote_name
+    fields = [field for field in dynamic_model._meta.concrete_fields if field.attname in names]
+
+    columns = ', '.join(quote_name(field.column) for field in fields)
+    placeholders = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    conflict = ', '.join(quote_name(field.column) for field in key_fields)
+    returning = ', '.join(quote_name(field.column) for field in [dynamic_model._meta.pk, *key_fields])
+    params = [field.get_db_prep_save(values[field.attname], connection) for values in rows for field in fields]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote_name(dynamic_model._meta.db_table)} ({columns}) '
+            f'VALUES {", ".join([placeholders] * len(rows))} '
+            f'ON CONFLICT ({conflict}) DO NOTHING RETURNING {returning}',
+            params
+        )
+        inserted = cursor.fetchall()
+
+    returned = [(pk, True) for pk, *_ in inserted]
+    inserted_keys = {tuple(key) for _, *key in inserted}
+    existing = [values for values in rows if tuple(values[field.attname] for field in key_fields) not in inserted_keys]
+    if existing:
+        returned += [(pk, False) for pk, *_ in update_values(dynamic_model, key_fields, names, existing)]
+    return returned
+
+
+def update_values(dynamic_model, key_fields, names, rows):
+    """
+    Update the existing rows matching the keys of rows that all have the fields in ``names``.
+
+    Returns the id and the key of every updated row.
+    """
+    quote_name = connection.ops.quote_name
+    table = quote_name(dynamic_model._meta.db_table)
+    fields = [field for field in dynamic_model._meta.concrete_fields if field.attname in names]
+    updated = [field for field in fields if field not in key_fields] or key_fields[:1]
+
+    # Typed placeholders, as VALUES would otherwise be text
+    placeholders = '(' + ', '.join(f'CAST(%s AS {field.db_type(connection)})' for field in fields) + ')'
+    columns = ', '.join(quote_name(field.column) for field in fields)
+    assignments = ', '.join(f'{quote_name(field.column)} = v.{quote_name(field.column)}' for field in updated)
+    condition = ' AND '.join(f'{table}.{quote_name(field.column)} = v.{quote_name(field.column)}' for field in key_fields)
+    returning = ', '.join(f'{table}.{quote_name(field.column)}' for field in [dynamic_model._meta.pk, *key_fields])
+    params = [field.get_db_prep_save(values[field.attname], connection) for values in rows for field in fields]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET {assignments} FROM (VALUES {", ".join([placeholders] * len(rows))}) AS v ({columns}) '
+            f'WHERE {condition} RETURNING {returning}',
+            params
+        )
+        return cursor.fetchall()
+
+
+def sync_pk_sequence(dynamic_model):
+    """
+    Move the id sequence past ids that were inserted explicitly, so that new rows do not reuse them.
+    """
+    table = connection.ops.quote_name(dynamic_model._meta.db_table)
+    column = dynamic_model._meta.pk.column
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT setval(pg_get_serial_sequence(%s, %s), max_id) '
+            f'FROM (SELECT MAX({connection.ops.quote_name(column)}) AS max_id FROM {table}) AS ids '
+            f'WHERE max_id > COALESCE(pg_sequence_last_value(pg_get_serial_sequence(%s, %s)::regclass), 0)',
+            [table, column, table, column]
+        )
+
+
+def get_job_payload(rows):
+    """
+    Return the JSON payload of a bulk insert job for rows of a request.
+
+    Rows the parser could not read are kept as their error message, so that
+    the job reports them at their index like the synchronous endpoint does.
+    """
+    rows = list(rows)
+    parse_errors = {}
+    for index, row in enumerate(rows):
+        if isinstance(row, ParseError):
+            parse_errors[str(index)] = str(row.detail)
+            rows[index] = None
+    return {'rows': rows, 'parse_errors': parse_errors}
+
+
+@job_handler(Job.BULK_INSERT)
+def run_bulk_insert_job(job):
+    rows = job.payload['rows']
+    for index, message in job.payload.get('parse_errors', {}).items():
+        rows[int(index)] = ParseError(message)
+
+    model_schema = get_model_schema(job.model_schema_id)
+    dynamic_model = model_registry.get_model(model_schema)
+    job.report_progress(0, len(rows))
+    result = bulk_insert_rows(
+        dynamic_model, rows, partitioning=get_partitioning(model_schema), progress=job.report_progress,
+        validator=model_registry.get_validator(model_schema),
+        written=lambda pks: record_rows_added(model_schema, dynamic_model, pks)
+    )
+    return {'total': result.total, 'inserted': result.inserted, 'errors': result.errors}
@@ -0,0 +1,59 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .models import TableVersion
+
+
+def get_table_version(model_schema):
+    try:
+        return model_schema.table_version
+    except TableVersion.DoesNotExist:
+        return TableVersion(model_schema=model_schema)
+
+
+def get_etag(table_version, representation):
+    """
+    Entity tag of a representation of a table, derived from its change token.
+    """
+    return f'"{table_version.change_token}.{representation}"'
+
+
+def get_not_modified_response(request, table_version, etag):
+    """
+    Return a ``304 Not Modified`` response if the client's copy is still current, else None.
+    """
+    return get_conditional_response(
+        request, etag=etag, last_modified=int(table_version.modified_at.timestamp())
+    )
+
+
+def set_conditional_headers(response, table_version, etag):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(table_version.modified_at.timestamp())
+    response['Vary'] = 'Accept'
+    return response
+
+
+def get_page_cache():
+    """
+    Return the cache holding serialized row pages, or None if the page cache is disabled.
+    """
+    if not settings.ROWS_CACHE_ALIAS:
+        return None
+    return caches[settings.ROWS_CACHE_ALIAS]
+
+
+def get_page_cache_key(model_schema, table_version, representation, query_params):
+    """
+    Key of a cached page.
+
+    The change token is part of the key, so pages of a table that changed are
+    never served again and age out of the cache instead of being invalidated.
+    """
+    params = sorted((key, value) for key in query_params for value in query_params.getlist(key))
+    digest = hashlib.md5(repr(params).encode(), usedforsecurity=False).hexdigest()
+    return f'rows:{model_schema.id}:{table_version.change_token}:{representation}:{digest}'
@@ -0,0 +1,364 @@
+import asyncio
+import collections
+import select
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max, Q
+from django.http import StreamingHttpResponse
+from dynamic_models.models import ModelSchema
+from rest_framework.utils.encoders import JSONEncoder
+
+from .filters import get_data_type
+from .models import CHANGE_CHANNEL, TableChange, TableVersion
+from .online import dual_write_rows
+from .registry import get_model_schema, model_registry
+from .schema import FIELD_TYPES_BY_DATA_TYPE
+from .utils import is_psycopg3, iter_batches
+
+# Changes read from the log per query when a feed resumes or catches up
+CATCH_UP_BATCH_SIZE = 100
+
+# Rows fetched per query when the rows of changes are read
+ROWS_BATCH_SIZE = 1000
+
+
+def record_rows_added(model_schema, dynamic_model, pks):
+    """
+    Bookkeeping after rows were inserted: fill the shadow columns of a running
+    column migration, log the change and bump the change token of the table.
+    """
+    dual_write_rows(model_schema, dynamic_model, pks)
+    TableChange.record(model_schema, TableChange.INSERT, pks)
+    TableVersion.bump_data_version(model_schema)
+
+
+def record_rows_upserted(model_schema, dynamic_model, pks):
+    """
+    Bookkeeping after rows were inserted or updated by an upsert; updated rows
+    need their shadow columns refreshed as much as new ones.
+    """
+    dual_write_rows(model_schema, dynamic_model, pks)
+    TableChange.record(model_schema, TableChange.UPSERT, pks)
+    TableVersion.bump_data_version(model_schema)
+
+
+def get_change_events(changes):
+    """
+    Encode changes as server-sent events, with the current values of their rows.
+
+    Returns ``(table id, change id, event)`` tuples ordered by change id. Rows
+    deleted since the change are left out; changes of deleted tables are
+    skipped.
+    """
+    changes_by_table = {}
+    for change in changes:
+        changes_by_table.setdefault(change.model_schema_id, []).append(change)
+
+    encode = JSONEncoder().encode
+    events = []
+    for table_id, table_changes in changes_by_table.items():
+        try:
+            model_schema = get_model_schema(table_id)
+        except ModelSchema.DoesNotExist:
+            continue
+        dynamic_model = model_registry.get_model(model_schema)
+        pk_name = dynamic_model._meta.pk.attname
+
+        # The rows of all changes are read together, from the primary that announced them
+        pks = sorted({pk for change in table_changes if change.kind in TableChange.ROW_KINDS for pk in change.pks})
+        rows = {}
+        for batch in iter_batches(pks, ROWS_BATCH_SIZE):
+            rows.update((row[pk_name], row) for row in dynamic_model.objects.using('default').filter(pk__in=batch).values())
+
+        for change in table_changes:
+            data = {'table_id': table_id}
+            if change.kind in TableChange.ROW_KINDS:
+                data['rows'] = [rows[pk] for pk in change.pks if pk in rows]
+            elif change.kind == TableChange.DELETE:
+                data['ids'] = change.pks
+                data.update(change.details or {})
+            else:
+                data.update(change.details or {})
+                data['fields'] = [
+                    {'name': field.name, 'type': FIELD_TYPES_BY_DATA_TYPE[get_data_type(field)]}
+                    for field in dynamic_model._meta.concrete_fields
+                ]
+            events.append((table_id, change.id, f'id: {change.id}\nevent: {change.kind}\ndata: {encode(data)}\n\n'))
+    return sorted(events, key=lambda event: event[1])
+
+
+def read_change_events(table_id, after):
+    """
+    Return the events of the next changes of a table after change ``after``,
+    and whether more changes follow.
+    """
+    changes = list(TableChange.objects.filter(model_schema_id=table_id, id__gt=after).order_by('id')[:CATCH_UP_BATCH_SIZE])
+    events = [(change_id, event) for _, change_id, event in get_change_events(changes)]
+    # Changes of a deleted table have no events; the feed still moves past them
+    if changes and (not events or events[-1][0] != changes[-1].id):
+        events.append((changes[-1].id, None))
+    return events, len(changes) == CATCH_UP_BATCH_SIZE
+
+
+def get_last_change_id(table_id):
+    return TableChange.objects.filter(model_schema_id=table_id).aggregate(last=Max('id'))['last'] or 0
+
+
+class Subscription:
+    """
+    Events of one table for one change feed, handed over from the ChangeHub thread to the event loop of the feed.
+    """
+
+    def __init__(self, table_id, loop, ready):
+        self.table_id = table_id
+        self.ready = ready
+        # Set when events were dropped, so that the feed reads them from the change log instead
+        self.lost = False
+        self._loop = loop
+        self._events = collections.deque()
+        self._available = asyncio.Event()
+
+    def push(self, events):
+        """
+        Queue ``(change id, event)`` pairs from another thread; None marks events as lost.
+        """
+        try:
+            self._loop.call_soon_threadsafe(self._push, events)
+        except RuntimeError:
+            # The event loop of the feed was closed before it unsubscribed
+            pass
+
+    def _push(self, events):
+        if events is None or len(self._events) + len(events) > settings.CHANGE_FEED_QUEUE_SIZE:
+            self.lost = True
+            self._events.clear()
+        else:
+            self._events.extend(events)
+        self._available.set()
+
+    async def get(self, timeout):
+        """
+        Wait for events; returns None if none arrived within ``timeout`` seconds.
+        """
+        try:
+            await asyncio.wait_for(self._available.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._available.clear()
+        events = list(self._events)
+        self._events.clear()
+        return events
+
+
+class ChangeHub:
+    """
+    Fan-out of committed table changes to the change feeds of this process.
+
+    A single thread ``LISTEN``s on ``CHANGE_CHANNEL`` on Postgres, or reads
+    the change log every ``CHANGE_FEED_POLL_INTERVAL`` seconds elsewhere. It
+    reads every announced change and its rows once, then hands the encoded
+    events to all feeds of the table, so the number of open feeds does not
+    add queries. The thread runs while there are feeds and has its own
+    database connection.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._ready = None
+
+    def subscribe(self, table_id, loop):
+        with self._lock:
+            if self._thread is None:
+                self._ready = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(self._ready,), name='change-hub', daemon=True)
+                self._thread.start()
+            subscription = Subscription(table_id, loop, self._ready)
+            self._subscribers.setdefault(table_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.table_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscribers.pop(subscription.table_id, None)
+
+    def stop(self):
+        """
+        Drop all subscriptions and wait for the thread to close its connection.
+        """
+        with self._lock:
+            thread = self._thread
+            self._subscribers.clear()
+        if thread is not None:
+            thread.join()
+
+    def _run(self, ready):
+        current = threading.current_thread()
+        listening = False
+        last_ids = {}
+        try:
+            while True:
+                with self._lock:
+                    if not self._subscribers:
+                        if self._thread is current:
+                            self._thread = None
+                        return
+                    table_ids = set(self._subscribers)
+                try:
+                    if not ready.is_set():
+                        listening = self._listen()
+                        last_ids = {}
+                        ready.set()
+                    if listening:
+                        change_ids = self._wait_for_notifications(table_ids)
+                        changes = list(TableChange.objects.filter(id__in=change_ids)) if change_ids else []
+                    else:
+                        time.sleep(settings.CHANGE_FEED_POLL_INTERVAL)
+                        changes = self._poll(table_ids, last_ids)
+                    if changes:
+                        self._publish(get_change_events(changes))
+                except Exception:
+                    # Feeds catch up from the change log once the connection is back
+                    connection.close()
+                    self._publish_lost()
+                    listening = False
+                    ready.clear()
+                    time.sleep(settings.CHANGE_FEED_POLL_INTERVAL)
+        finally:
+            ready.set()
+            connection.close()
+
+    def _poll(self, table_ids, last_ids):
+        """
+        Read the changes committed since the last poll from the change log.
+
+        Only the changes of one table commit in id order, so each table is read
+        after its own last change. Feeds of a table the hub starts following
+        catch up from the change log, as changes committed before it was
+        followed are not published.
+        """
+        for table_id in set(last_ids) - table_ids:
+            del last_ids[table_id]
+        new_table_ids = table_ids - set(last_ids)
+        if new_table_ids:
+            last_ids.update(
+                TableChange.objects.filter(model_schema_id__in=new_table_ids)
+                .values('model_schema_id').annotate(last=Max('id')).values_list('model_schema_id', 'last')
+            )
+            last_ids.update((table_id, 0) for table_id in new_table_ids - set(last_ids))
+            self._publish_lost(new_table_ids)
+
+        condition = Q()
+        for table_id in table_ids:
+            condition |= Q(model_schema_id=table_id, id__gt=last_ids[table_id])
+        changes = list(TableChange.objects.filter(condition).order_by('id'))
+        for change in changes:
+            last_ids[change.model_schema_id] = change.id
+        return changes
+
+    def _listen(self):
+        connection.ensure_connection()
+        if connection.vendor != 'postgresql':
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {CHANGE_CHANNEL}')
+        return True
+
+    def _wait_for_notifications(self, table_ids):
+        change_ids = []
+        for notification in self._read_notifications(connection.connection):
+            table_id, change_id = notification.payload.split(':')
+            if int(table_id) in table_ids:
+                change_ids.append(int(change_id))
+        return change_ids
+
+    def _read_notifications(self, raw_connection):
+        # psycopg 3 reads notifications with a method, psycopg2 collects them in a list
+        if is_psycopg3(connection):
+            if not select.select([raw_connection], [], [], settings.CHANGE_FEED_POLL_INTERVAL)[0]:
+                return []
+            return list(raw_connection.notifies(timeout=0))
+        if not raw_connection.notifies and not select.select([raw_connection], [], [], settings.CHANGE_FEED_POLL_INTERVAL)[0]:
+            return []
+        raw_connection.poll()
+        notifications = list(raw_connection.notifies)
+        raw_connection.notifies.clear()
+        return notifications
+
+    def _publish(self, events):
+        events_by_table = {}
+        for table_id, change_id, event in events:
+            events_by_table.setdefault(table_id, []).append((change_id, event))
+        with self._lock:
+            subscriptions = [
+                (subscription, events_by_table[table_id])
+                for table_id in events_by_table for subscription in self._subscribers.get(table_id, ())
+            ]
+        for subscription, table_events in subscriptions:
+            subscription.push(table_events)
+
+    def _publish_lost(self, table_ids=None):
+        with self._lock:
+            subscriptions = [
+                subscription for table_id, subscriptions in self._subscribers.items()
+                if table_ids is None or table_id in table_ids for subscription in subscriptions
+            ]
+        for subscription in subscriptions:
+            subscription.push(None)
+
+
+change_hub = ChangeHub()
+
+
+def change_feed_response(table_id, after=None):
+    """
+    Stream the changes of a table as server-sent events.
+
+    The feed starts after change ``after``, replaying the change log, or
+    with the next change if ``after`` is None. Every event carries the id of
+    its change, which EventSource clients send back as ``Last-Event-ID``
+    when they reconnect.
+    """
+    response = StreamingHttpResponse(_change_events(table_id, after), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Proxies such as nginx would otherwise hold events back in their buffers
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def _change_events(table_id, after):
+    subscription = change_hub.subscribe(table_id, asyncio.get_running_loop())
+    try:
+        # Changes committed before the hub listens are read from the change log
+        await sync_to_async(subscription.ready.wait, thread_sensitive=False)(settings.CHANGE_FEED_KEEPALIVE)
+        if after is None:
+            after = await sync_to_async(get_last_change_id)(table_id)
+        else:
+            subscription.lost = True
+        yield ': connected\n\n'
+
+        while True:
+            if subscription.lost:
+                subscription.lost = False
+                events, more = await sync_to_async(read_change_events)(table_id, after)
+                subscription.lost = subscription.lost or more
+            else:
+                events = await subscription.get(settings.CHANGE_FEED_KEEPALIVE)
+                if events is None:
+                    yield ': keepalive\n\n'
+                    continue
+            for change_id, event in events:
+                # Changes can arrive both from the log and from the hub while catching up
+                if change_id > after:
+                    after = change_id
+                    if event is not None:
+                        yield event
+    finally:
+        change_hub.unsubscribe(subscription)
@@ -0,0 +1,187 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .filters import RESERVED_PARAMS, get_data_type, parse_filters
+from .jobs import enqueue_job, job_handler
+from .models import Job, RetentionPolicy, TableChange, TableVersion
+from .registry import get_model_schema, model_registry
+
+
+def delete_rows(model_schema, dynamic_model, condition, max_pk, progress=None, batch_size=None, sleep=None):
+    """
+    Delete the rows matching ``condition`` whose primary key is at most ``max_pk``.
+
+    Rows are deleted in primary key ranges holding ``batch_size`` matching
+    rows (``ROW_DELETE_BATCH_SIZE``), each in its own short transaction and
+    followed by a pause of ``sleep`` seconds (``ROW_DELETE_BATCH_SLEEP``).
+    Locks are held for one batch only and WAL is written at a pace that
+    replicas and autovacuum keep up with. Every batch logs the deleted ids
+    as a change of the table. ``progress`` is called with the rows deleted
+    so far after each batch. Returns the number of deleted rows.
+    """
+    batch_size = batch_size or settings.ROW_DELETE_BATCH_SIZE
+    sleep = settings.ROW_DELETE_BATCH_SLEEP if sleep is None else sleep
+    rows = dynamic_model.objects.filter(condition, pk__lte=max_pk).order_by('pk')
+    deleted = 0
+    last_pk = None
+    while True:
+        batch = rows if last_pk is None else rows.filter(pk__gt=last_pk)
+        upper = list(batch.values_list('pk', flat=True)[batch_size - 1:batch_size])
+        if upper:
+            batch = batch.filter(pk__lte=upper[0])
+
+        with transaction.atomic():
+            pks = list(batch.select_for_update().values_list('pk', flat=True))
+            if pks:
+                dynamic_model.objects.filter(pk__in=pks).delete()
+                TableChange.record(model_schema, TableChange.DELETE, pks)
+                TableVersion.bump_data_version(model_schema)
+        deleted += len(pks)
+        if progress is not None:
+            progress(deleted)
+
+        if not upper:
+            return deleted
+        last_pk = upper[0]
+        time.sleep(sleep)
+
+
+def parse_delete_filters(dynamic_model, query_params):
+    """
+    Read the filters of a delete request; returns the filters and their condition.
+
+    At least one filter is required, so that a request without parameters
+    cannot empty the table.
+    """
+    if 'q' in query_params:
+        raise ValidationError('Rows cannot be deleted by search. Use filters instead.')
+    filters = {key: value for key, value in query_params.items() if key not in RESERVED_PARAMS}
+    if not filters:
+        raise ValidationError('Please provide at least one filter. Use "id__gt=0" to delete every row.')
+    return filters, parse_filters(dynamic_model, filters)
+
+
+def enqueue_delete_rows(model_schema, dynamic_model, filters):
+    """
+    Queue a job deleting the rows matching ``filters``, as they exist now.
+
+    Rows added later are left alone even if they match, and a job that runs
+    again after an interruption deletes only the rows still left.
+    """
+    max_pk = dynamic_model.objects.aggregate(max_pk=Max('pk'))['max_pk'] or 0
+    return enqueue_job(Job.DELETE_ROWS, model_schema, {'filters': filters, 'max_pk': max_pk})
+
+
+@job_handler(Job.DELETE_ROWS)
+def run_delete_rows_job(job):
+    model_schema = get_model_schema(job.model_schema_id)
+    dynamic_model = model_registry.get_model(model_schema)
+    condition = parse_filters(dynamic_model, job.payload['filters'])
+    max_pk = job.payload['max_pk']
+
+    rows_total = dynamic_model.objects.filter(condition, pk__lte=max_pk).count()
+    job.report_progress(0, rows_total)
+    deleted = delete_rows(model_schema, dynamic_model, condition, max_pk, progress=job.report_progress)
+    return {'rows_deleted': deleted}
+
+
+def get_retention_policy(model_schema):
+    try:
+        return model_schema.retention_policy
+    except RetentionPolicy.DoesNotExist:
+        return None
+
+
+def parse_retention_policy(dynamic_model, declaration):
+    """
+    Validate the ``retention`` option of a table definition.
+
+    Returns an unsaved RetentionPolicy, or None for an empty object, which
+    removes the policy. ``max_age`` (seconds) needs a datetime ``field``;
+    ``keep_latest`` keeps the newest rows by an integer or datetime
+    ``field``, or by primary key.
+    """
+    if not isinstance(declaration, dict):
+        raise ValidationError('Invalid retention data. Expected an object with "max_age" and a "field", or "keep_latest".')
+    if not declaration:
+        return None
+
+    max_age = declaration.get('max_age')
+    keep_latest = declaration.get('keep_latest')
+    if (max_age is None) == (keep_latest is None):
+        raise ValidationError('A retention policy needs either "max_age" or "keep_latest".')
+    for value in (max_age, keep_latest):
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 1):
+            raise ValidationError('"max_age" and "keep_latest" should be positive integers.')
+
+    policy = RetentionPolicy(max_age=max_age, keep_latest=keep_latest)
+    data_type = None
+    name = declaration.get('field')
+    if name:
+        try:
+            field = dynamic_model._meta.get_field(name)
+        except FieldDoesNotExist:
+            raise ValidationError(f'Unknown retention field: {name}.')
+        policy.field = field.attname
+        data_type = get_data_type(field)
+
+    if max_age is not None and data_type != 'date':
+        raise ValidationError('A retention policy with "max_age" needs a datetime "field".')
+    if keep_latest is not None and data_type not in (None, 'integer', 'date'):
+        raise ValidationError('Rows can only be kept by an integer or datetime field.')
+    return policy
+
+
+def sync_retention_policy(model_schema, dynamic_model, declaration):
+    """
+    Make ``declaration`` the retention policy of a table; an empty object removes it.
+    """
+    policy = parse_retention_policy(dynamic_model, declaration)
+    RetentionPolicy.objects.filter(model_schema=model_schema).delete()
+    if policy is not None:
+        policy.model_schema = model_schema
+        policy.save()
+    return policy
+
+
+def get_retention_condition(policy, dynamic_model):
+    """
+    Return the condition selecting the rows a retention policy deletes, or None if there are none.
+    """
+    if policy.max_age is not None:
+        cutoff = timezone.now() - datetime.timedelta(seconds=policy.max_age)
+        return Q(**{f'{policy.field}__lt': cutoff})
+
+    # Rows tied with the oldest row that is kept are kept as well
+    name = policy.field or dynamic_model._meta.pk.attname
+    values = dynamic_model.objects.exclude(**{f'{name}__isnull': True}).order_by(f'-{name}').values_list(name, flat=True)
+    cutoff = list(values[policy.keep_latest - 1:policy.keep_latest])
+    if not cutoff:
+        return None
+    return Q(**{f'{name}__lt': cutoff[0]})
+
+
+def enforce_retention_policy(policy, progress=None, batch_size=None, sleep=None):
+    """
+    Delete the rows of a table that its retention policy no longer keeps.
+
+    Returns the number of deleted rows.
+    """
+    model_schema = get_model_schema(policy.model_schema_id)
+    dynamic_model = model_registry.get_model(model_schema)
+    condition = get_retention_condition(policy, dynamic_model)
+    deleted = 0
+    if condition is not None:
+        max_pk = dynamic_model.objects.aggregate(max_pk=Max('pk'))['max_pk'] or 0
+        deleted = delete_rows(
+            model_schema, dynamic_model, condition, max_pk, progress=progress, batch_size=batch_size, sleep=sleep
+        )
+    policy.last_run_at = timezone.now()
+    policy.save(update_fields=['last_run_at'])
+    return deleted
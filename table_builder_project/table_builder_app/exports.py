@@ -0,0 +1,202 @@
+import csv
+import io
+from importlib.util import find_spec
+
+from django.conf import settings
+from django.db import connections
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .filters import get_data_type
+from .utils import copy_to_stdout, iter_batches, mogrify
+
+# pyarrow is only needed by the Arrow and Parquet exports and slows down process startup, so it is imported on first use
+PYARROW_AVAILABLE = find_spec('pyarrow') is not None
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ExportUnavailable(Exception):
+    """
+    Raised when an export format needs an optional package that is not installed.
+    """
+
+
+def import_pyarrow():
+    import pyarrow
+    import pyarrow.parquet
+    return pyarrow
+
+
+class ExportRenderer(BaseRenderer):
+    """
+    Renderer that makes an export format negotiable with ``Accept`` or ``?format=``.
+
+    Rows are streamed by export_rows_response() and never go through the
+    renderer; only error responses do, and those are rendered as JSON.
+    """
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = 'application/json'
+        return JSONRenderer().render(data, renderer_context=renderer_context)
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = EXPORT_CONTENT_TYPES['csv']
+    format = 'csv'
+
+
+class ArrowRenderer(ExportRenderer):
+    media_type = EXPORT_CONTENT_TYPES['arrow']
+    format = 'arrow'
+
+
+class ParquetRenderer(ExportRenderer):
+    media_type = EXPORT_CONTENT_TYPES['parquet']
+    format = 'parquet'
+
+
+EXPORT_RENDERERS = [CSVRenderer, ArrowRenderer, ParquetRenderer]
+
+
+def export_rows_response(row_query, rows, export_format, filename, limit=None):
+    """
+    Stream the rows of a ``values()`` queryset as CSV, an Arrow IPC stream or a Parquet file.
+
+    On Postgres, CSV in primary key order is produced by ``COPY ... TO STDOUT``
+    in primary key ranges of ``ROWS_EXPORT_BATCH_SIZE`` rows. Arrow and Parquet
+    are written one record batch (row group) at a time, with column types
+    taken from the table schema.
+    """
+    dynamic_model = row_query.dynamic_model
+    names = row_query.fields or [field.attname for field in dynamic_model._meta.concrete_fields]
+    fields = [dynamic_model._meta.get_field(name) for name in names]
+    rows = rows.values_list(*names)
+    batch_size = settings.ROWS_EXPORT_BATCH_SIZE
+
+    if export_format == 'csv':
+        if connections[rows.db].vendor == 'postgresql' and row_query.is_default_ordering and limit is None:
+            content = _copy_csv_chunks(rows, batch_size)
+        else:
+            content = _csv_chunks(rows[:limit] if limit is not None else rows, names, batch_size)
+    else:
+        if not PYARROW_AVAILABLE:
+            raise ExportUnavailable(f'The "{export_format}" format requires the pyarrow package.')
+        content = _arrow_chunks(rows[:limit] if limit is not None else rows, fields, batch_size, export_format)
+
+    response = StreamingHttpResponse(content, content_type=EXPORT_CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
+
+
+def _copy_csv_chunks(rows, batch_size):
+    last_pk = None
+    while True:
+        batch = rows if last_pk is None else rows.filter(pk__gt=last_pk)
+        upper = list(batch.values_list('pk', flat=True)[batch_size - 1:batch_size])
+        if upper:
+            batch = batch.filter(pk__lte=upper[0])
+        yield _copy_to_csv(batch, header=last_pk is None)
+        if not upper:
+            return
+        last_pk = upper[0]
+
+
+def _copy_to_csv(queryset, header):
+    # The queryset's database, which may be a replica
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        # COPY does not take query parameters, so they are inlined by the driver
+        query = mogrify(cursor, sql, params)
+        options = 'FORMAT csv, HEADER' if header else 'FORMAT csv'
+        return copy_to_stdout(cursor, f'COPY ({query}) TO STDOUT WITH ({options})')
+
+
+def _csv_chunks(rows, names, batch_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(names)
+    for batch in iter_batches(rows.iterator(chunk_size=settings.ROWS_STREAM_CHUNK_SIZE), batch_size):
+        writer.writerows([_csv_value(value) for value in row] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _csv_value(value):
+    # Match the output of COPY, so the format does not depend on the code path
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return value
+
+
+def _arrow_type(field):
+    pyarrow = import_pyarrow()
+    if field.primary_key:
+        return pyarrow.int64()
+    return {
+        'character': pyarrow.string,
+        'text': pyarrow.string,
+        'integer': pyarrow.int32,
+        'float': pyarrow.float64,
+        'boolean': pyarrow.bool_,
+        'date': lambda: pyarrow.timestamp('us', tz='UTC'),
+    }[get_data_type(field)]()
+
+
+def _arrow_chunks(rows, fields, batch_size, export_format):
+    pyarrow = import_pyarrow()
+    schema = pyarrow.schema([pyarrow.field(field.attname, _arrow_type(field)) for field in fields])
+    sink = _ChunkSink()
+    if export_format == 'arrow':
+        writer = pyarrow.ipc.new_stream(sink, schema)
+    else:
+        writer = pyarrow.parquet.ParquetWriter(sink, schema)
+
+    for batch in iter_batches(rows.iterator(chunk_size=settings.ROWS_STREAM_CHUNK_SIZE), batch_size):
+        columns = zip(*batch)
+        arrays = [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)]
+        writer.write_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file that hands out what was written since the last drain().
+
+    Keeps counting the position, which writers use for offsets in the file.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
@@ -0,0 +1,231 @@
+import datetime
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from dynamic_models.factory import FieldFactory
+
+from .search import SEARCH_RANK, search_rows
+
+# Query parameters of the rows endpoint that are never treated as filters
+RESERVED_PARAMS = {'after', 'cursor', 'limit', 'stream', 'fields', 'ordering', 'format', 'q'}
+
+# Lookups allowed in filters, per FieldSchema data type
+LOOKUPS = {
+    'character': {'exact', 'in', 'startswith', 'icontains', 'gt', 'gte', 'lt', 'lte'},
+    'integer': {'exact', 'in', 'gt', 'gte', 'lt', 'lte'},
+    'boolean': {'exact'},
+    'date': {'exact', 'in', 'gt', 'gte', 'lt', 'lte'},
+}
+
+DATA_TYPES_BY_FIELD_CLASS = {
+    field_class: data_type for data_type, field_class in FieldFactory.DATA_TYPES.items()
+}
+
+BOOLEAN_VALUES = {'true': True, '1': True, 'false': False, '0': False}
+
+
+class RowQueryError(ValueError):
+    """
+    Raised for query parameters that do not match the table schema.
+    """
+
+
+def get_data_type(model_field):
+    """
+    Map a field of a generated model back to its FieldSchema data type.
+    """
+    if model_field.primary_key:
+        return 'integer'
+    return DATA_TYPES_BY_FIELD_CLASS[type(model_field)]
+
+
+def get_model_field(dynamic_model, name):
+    try:
+        return dynamic_model._meta.get_field(name)
+    except FieldDoesNotExist:
+        raise RowQueryError(f'Unknown field: {name}.')
+
+
+def coerce_value(data_type, name, value):
+    """
+    Convert a raw query string value to the Python type of a column.
+    """
+    if data_type == 'integer':
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise RowQueryError(f'Invalid value for "{name}": expected an integer.')
+    if data_type == 'boolean':
+        if isinstance(value, bool):
+            return value
+        try:
+            return BOOLEAN_VALUES[str(value).lower()]
+        except KeyError:
+            raise RowQueryError(f'Invalid value for "{name}": expected true or false.')
+    if data_type == 'date':
+        return coerce_datetime(name, value)
+    return str(value)
+
+
+def coerce_datetime(name, value):
+    """
+    Parse an ISO 8601 date or date and time; values without an offset are in UTC.
+    """
+    if not isinstance(value, datetime.datetime):
+        text = str(value)
+        try:
+            parsed = parse_datetime(text)
+            if parsed is None:
+                parsed_date = parse_date(text)
+                parsed = parsed_date and datetime.datetime.combine(parsed_date, datetime.time())
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise RowQueryError(f'Invalid value for "{name}": expected an ISO 8601 date and time.')
+        value = parsed
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, datetime.timezone.utc)
+    return value
+
+
+def parse_filters(dynamic_model, params, reserved=RESERVED_PARAMS):
+    """
+    Compile ``<field>`` / ``<field>__<lookup>`` parameters into a single Q object.
+
+    Parameters listed in ``reserved`` are skipped. Values are validated and
+    coerced against the data type of each column, and lookups are restricted to
+    the ones that make sense for that type.
+    """
+    condition = Q()
+    for key, value in params.items():
+        if key in reserved:
+            continue
+
+        name, _, lookup = key.partition('__')
+        lookup = lookup or 'exact'
+        data_type = get_data_type(get_model_field(dynamic_model, name))
+        if lookup not in LOOKUPS[data_type]:
+            raise RowQueryError(f'Unsupported filter "{lookup}" for {data_type} field "{name}".')
+
+        if lookup == 'in':
+            values = value if isinstance(value, list) else str(value).split(',')
+            value = [coerce_value(data_type, name, item) for item in values]
+        else:
+            value = coerce_value(data_type, name, value)
+        condition &= Q(**{f'{name}__{lookup}': value})
+    return condition
+
+
+def parse_fields(dynamic_model, value):
+    """
+    Parse ``fields=a,b`` into a list of column names; the primary key is always included.
+    """
+    pk_name = dynamic_model._meta.pk.attname
+    fields = [pk_name]
+    for name in filter(None, (part.strip() for part in value.split(','))):
+        get_model_field(dynamic_model, name)
+        if name not in fields:
+            fields.append(name)
+    return fields
+
+
+def parse_ordering(dynamic_model, value):
+    """
+    Parse ``ordering=-a,b`` into ``(name, descending)`` pairs.
+
+    The primary key is appended as a tie-breaker so that the ordering is total,
+    which keyset pagination relies on.
+    """
+    pk_name = dynamic_model._meta.pk.attname
+    ordering = []
+    for part in filter(None, (part.strip() for part in value.split(','))):
+        name = part.lstrip('-')
+        get_model_field(dynamic_model, name)
+        if name not in (existing for existing, _ in ordering):
+            ordering.append((name, part.startswith('-')))
+    if pk_name not in (name for name, _ in ordering):
+        ordering.append((pk_name, False))
+    return ordering
+
+
+def parse_search(dynamic_model, table_search, value):
+    """
+    Validate the ``q`` search parameter; returns the search query or None.
+    """
+    if value is None:
+        return None
+    if table_search is None or not table_search.fields:
+        raise RowQueryError('This table has no searchable fields. Mark string fields as "searchable" to search it.')
+    if not value.strip():
+        raise RowQueryError('Invalid value for "q": expected a search query.')
+    if any(field.name == SEARCH_RANK for field in dynamic_model._meta.concrete_fields):
+        raise RowQueryError(f'Search results cannot be ranked: the table has a field named "{SEARCH_RANK}".')
+    return value.strip()
+
+
+def keyset_condition(ordering, values):
+    """
+    Build the condition selecting rows that sort after ``values`` in ``ordering``.
+    """
+    condition = Q()
+    for index, (name, descending) in enumerate(ordering):
+        term = Q(**{f'{name}__{"lt" if descending else "gt"}': values[index]})
+        for previous_index, (previous_name, _) in enumerate(ordering[:index]):
+            term &= Q(**{previous_name: values[previous_index]})
+        condition |= term
+    return condition
+
+
+class RowQuery:
+    """
+    Filters, ordering and projection requested for the rows of a dynamic table.
+
+    Everything is compiled into a single queryset so that the database does
+    the filtering instead of Python. With a search in ``q``, only matching
+    rows are returned, each with its SEARCH_RANK, and they are ordered by
+    relevance unless another ordering is requested.
+    """
+
+    def __init__(self, dynamic_model, query_params, table_search=None):
+        self.dynamic_model = dynamic_model
+        self.condition = parse_filters(dynamic_model, query_params)
+        self.table_search = table_search
+        self.search = parse_search(dynamic_model, table_search, query_params.get('q'))
+        if self.search is not None and not query_params.get('ordering'):
+            self.ordering = [(SEARCH_RANK, True), (dynamic_model._meta.pk.attname, False)]
+        else:
+            self.ordering = parse_ordering(dynamic_model, query_params.get('ordering', ''))
+        fields = query_params.get('fields')
+        self.fields = parse_fields(dynamic_model, fields) if fields else None
+        # Values returned besides the columns in the projection
+        self.annotations = [SEARCH_RANK] if self.search is not None else []
+
+    @property
+    def is_default_ordering(self):
+        return self.ordering == [(self.dynamic_model._meta.pk.attname, False)]
+
+    @property
+    def ordering_fields(self):
+        return [name for name, _ in self.ordering]
+
+    def get_queryset(self, include_ordering_fields=False):
+        """
+        Return a ``values()`` queryset for the requested rows.
+
+        With ``include_ordering_fields``, columns needed to build a pagination
+        cursor are selected even if they were left out of the projection.
+        """
+        order_by = [f'-{name}' if descending else name for name, descending in self.ordering]
+        queryset = self.dynamic_model.objects.filter(self.condition)
+        if self.search is not None:
+            queryset = search_rows(queryset, self.table_search, self.search)
+        queryset = queryset.order_by(*order_by)
+        if self.fields is None:
+            return queryset.values()
+
+        fields = self.fields + self.annotations
+        if include_ordering_fields:
+            fields += [name for name in self.ordering_fields if name not in fields]
+        return queryset.values(*fields)
@@ -0,0 +1,159 @@
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connection, models, transaction
+from django.db.backends.utils import names_digest
+
+from .filters import RowQueryError, get_model_field, parse_filters
+from .models import TableIndex, TablePartitioning
+
+
+def get_index_name(dynamic_model, fields, unique, condition):
+    """
+    Derive a stable index name from the definition of the index.
+    """
+    digest = names_digest(repr(fields), repr(unique), repr(sorted(condition.items())), length=8)
+    suffix = 'uniq' if unique else 'idx'
+    return f'{dynamic_model._meta.db_table[:40]}_{digest}_{suffix}'
+
+
+def parse_index_declarations(dynamic_model, declarations, partitioning=None):
+    """
+    Validate index declarations against the table schema.
+
+    Returns unsaved TableIndex instances. Raises ValidationError for malformed
+    declarations or references to unknown fields. Postgres requires unique
+    indexes of a partitioned table to include its partition key.
+    """
+    if not isinstance(declarations, list):
+        raise ValidationError('Invalid indexes data. Expected a list of index definitions.')
+
+    table_indexes = {}
+    for declaration in declarations:
+        if not isinstance(declaration, dict):
+            raise ValidationError('Invalid index data. Each index should be an object with a list of fields.')
+
+        fields = declaration.get('fields')
+        unique = declaration.get('unique', False)
+        condition = declaration.get('condition') or {}
+        if not fields or not isinstance(fields, list) or not all(isinstance(name, str) for name in fields):
+            raise ValidationError('Invalid index data. Each index should have a non-empty list of field names.')
+        if not isinstance(unique, bool) or not isinstance(condition, dict):
+            raise ValidationError('Invalid index data. "unique" should be a boolean and "condition" an object.')
+
+        try:
+            columns = [get_model_field(dynamic_model, name).attname for name in fields]
+            parse_filters(dynamic_model, condition, reserved=())
+        except RowQueryError as e:
+            raise ValidationError(f'Invalid index definition: {e}')
+        if unique and partitioning is not None and partitioning.field not in columns:
+            raise ValidationError(
+                f'Unique indexes of a partitioned table must include the partition key "{partitioning.field}".'
+            )
+
+        name = get_index_name(dynamic_model, fields, unique, condition)
+        table_indexes[name] = TableIndex(name=name, fields=fields, unique=unique, condition=condition)
+    return list(table_indexes.values())
+
+
+def build_index(dynamic_model, table_index):
+    condition = None
+    if table_index.condition:
+        condition = parse_filters(dynamic_model, table_index.condition, reserved=())
+    return models.Index(fields=table_index.fields, name=table_index.name, condition=condition)
+
+
+def create_index(dynamic_model, table_index, concurrently=False):
+    index = build_index(dynamic_model, table_index)
+    with connection.schema_editor(atomic=not concurrently) as schema_editor:
+        sql = schema_editor.sql_create_index_concurrently if concurrently else schema_editor.sql_create_index
+        if table_index.unique:
+            sql = sql.replace('CREATE INDEX', 'CREATE UNIQUE INDEX', 1)
+        options = {'concurrently': concurrently} if connection.vendor == 'postgresql' else {}
+        schema_editor.execute(index.create_sql(dynamic_model, schema_editor, sql=sql, **options), params=None)
+
+
+def drop_index(dynamic_model, table_index, concurrently=False):
+    index = build_index(dynamic_model, table_index)
+    with connection.schema_editor(atomic=not concurrently) as schema_editor:
+        options = {'concurrently': concurrently} if connection.vendor == 'postgresql' else {}
+        schema_editor.execute(index.remove_sql(dynamic_model, schema_editor, **options))
+
+
+def sync_indexes(model_schema, dynamic_model, declarations):
+    """
+    Make the declared indexes the full set of indexes of a table.
+
+    Indexes that are no longer declared are dropped right away. New ones are
+    recorded and returned so that the caller can build them with
+    build_indexes(), outside of its transaction if possible.
+    """
+    # Read rather than from the cache of model_schema, as the table may just have been partitioned
+    partitioning = TablePartitioning.objects.filter(model_schema=model_schema).first()
+    declared = {
+        table_index.name: table_index
+        for table_index in parse_index_declarations(dynamic_model, declarations, partitioning)
+    }
+    existing = {table_index.name: table_index for table_index in model_schema.table_indexes.all()}
+
+    for name, table_index in existing.items():
+        if name not in declared:
+            drop_index(dynamic_model, table_index)
+            table_index.delete()
+
+    created = []
+    for name, table_index in declared.items():
+        if name not in existing:
+            table_index.model_schema = model_schema
+            table_index.save()
+            created.append(table_index)
+    return created
+
+
+def drop_indexes_for_fields(model_schema, dynamic_model, field_names):
+    """
+    Drop the indexes that reference any of the given fields.
+    """
+    field_names = set(field_names)
+    for table_index in model_schema.table_indexes.all():
+        if table_index.get_referenced_fields() & field_names:
+            drop_index(dynamic_model, table_index)
+            table_index.delete()
+
+
+def build_indexes(dynamic_model, table_indexes):
+    """
+    Create recorded indexes in the database.
+
+    On Postgres, outside of a transaction, indexes are built with
+    ``CREATE INDEX CONCURRENTLY`` so that writes to the table are not blocked;
+    partitioned tables do not support that and block writes during the build.
+    If a build fails, its record, and the invalid index a concurrent build
+    leaves behind, are removed before the error is re-raised.
+    """
+    if not table_indexes:
+        return
+    concurrently = (
+        connection.vendor == 'postgresql' and not connection.in_atomic_block and not is_partitioned(dynamic_model)
+    )
+    for table_index in table_indexes:
+        try:
+            if concurrently:
+                create_index(dynamic_model, table_index, concurrently=True)
+            else:
+                # A savepoint, so that the record can still be removed inside the caller's transaction
+                with transaction.atomic():
+                    create_index(dynamic_model, table_index)
+        except DatabaseError:
+            if concurrently:
+                drop_index(dynamic_model, table_index, concurrently=True)
+            table_index.delete()
+            raise
+
+
+def is_partitioned(dynamic_model):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT relkind FROM pg_class WHERE oid = %s::regclass',
+            [connection.ops.quote_name(dynamic_model._meta.db_table)]
+        )
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
@@ -0,0 +1,172 @@
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Job
+
+# Functions running each kind of job, registered with job_handler()
+JOB_HANDLERS = {}
+
+# Threads running the jobs started by this process, created on first use
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def job_handler(kind):
+    """
+    Register the function that runs jobs of a kind.
+
+    The function is called with the running Job, may report progress with
+    ``job.report_progress()`` and returns the JSON result of the job.
+    """
+    def decorator(function):
+        JOB_HANDLERS[kind] = function
+        return function
+    return decorator
+
+
+def enqueue_job(kind, model_schema, payload):
+    """
+    Queue a job. Call it inside the transaction that prepared the operation, if any.
+
+    With ``JOBS_RUN_IN_WEB_PROCESS``, the job also starts in a thread of this
+    process once the transaction commits; a ``run_table_worker`` process may
+    claim it first, in which case the thread does nothing.
+    """
+    job = Job.objects.create(kind=kind, model_schema=model_schema, payload=payload)
+    if settings.JOBS_RUN_IN_WEB_PROCESS:
+        transaction.on_commit(lambda: run_in_background(job.id))
+    return job
+
+
+def run_in_background(job_id):
+    """
+    Run a queued job in a thread of this process.
+
+    At most ``JOB_WORKER_CONCURRENCY`` jobs run at once per process; the
+    others wait, still queued, so a ``run_table_worker`` may claim them first.
+    """
+    global _executor
+
+    def run():
+        try:
+            job = claim_job(job_id=job_id, worker=f'web-{threading.get_ident()}')
+            if job is not None:
+                run_job(job)
+        finally:
+            connection.close()
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.JOB_WORKER_CONCURRENCY, thread_name_prefix='job')
+    _executor.submit(run)
+
+
+def claim_job(job_id=None, worker=''):
+    """
+    Mark the oldest queued job, or the given one, as running and return it.
+
+    ``SKIP LOCKED`` lets several workers poll the queue at the same time
+    without waiting for each other or claiming the same job. Returns None if
+    there is nothing to claim.
+    """
+    with transaction.atomic():
+        jobs = Job.objects.select_for_update(skip_locked=True).filter(state=Job.QUEUED)
+        if job_id is not None:
+            jobs = jobs.filter(id=job_id)
+        job = jobs.order_by('id').first()
+        if job is None:
+            return None
+        now = timezone.now()
+        job.state = Job.RUNNING
+        job.started_at = job.started_at or now
+        job.heartbeat_at = now
+        job.attempts += 1
+        job.worker = worker
+        job.save(update_fields=['state', 'started_at', 'heartbeat_at', 'attempts', 'worker'])
+    return job
+
+
+def run_job(job):
+    """
+    Run a claimed job and record its outcome. Never raises.
+    """
+    try:
+        with _heartbeat(job):
+            job.result = JOB_HANDLERS[job.kind](job) or {}
+        job.state = Job.COMPLETED
+        # The input of a finished job is of no further use, and may be large
+        job.payload = {}
+    except Exception as e:
+        job.state = Job.FAILED
+        job.error = str(e).strip() or type(e).__name__
+    job.finished_at = timezone.now()
+    job.save(update_fields=['result', 'state', 'payload', 'error', 'finished_at'])
+    return job
+
+
+@contextmanager
+def _heartbeat(job):
+    """
+    Keep the heartbeat of a job current from a separate thread while it runs,
+    including through long statements that report no progress.
+    """
+    stopped = threading.Event()
+
+    def beat():
+        try:
+            while not stopped.wait(settings.JOB_STALE_AFTER / 3):
+                Job.objects.filter(id=job.id).update(heartbeat_at=timezone.now())
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'job-{job.id}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+
+
+def recover_stale_jobs():
+    """
+    Deal with running jobs whose worker stopped sending heartbeats.
+
+    Jobs that can safely run again are queued again; the others are marked as
+    failed, as part of their work may already be committed. Returns the
+    number of jobs recovered.
+    """
+    stale = Job.objects.filter(
+        state=Job.RUNNING,
+        heartbeat_at__lt=timezone.now() - datetime.timedelta(seconds=settings.JOB_STALE_AFTER),
+    )
+    requeued = stale.filter(kind__in=Job.RESUMABLE_KINDS).update(state=Job.QUEUED, worker='')
+    # Only the other kinds, so that a resumable job going stale between the two updates is not failed
+    failed = stale.exclude(kind__in=Job.RESUMABLE_KINDS).update(
+        state=Job.FAILED, finished_at=timezone.now(), error='The worker running the job stopped before it finished.'
+    )
+    return requeued + failed
+
+
+def describe_job(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'table_id': job.model_schema_id,
+        'state': job.state,
+        'rows_done': job.rows_done,
+        'rows_total': job.rows_total,
+        'progress': job.progress,
+        'rows_per_second': job.rows_per_second,
+        'attempts': job.attempts,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+        'result': job.result,
+        'error': job.error,
+    }
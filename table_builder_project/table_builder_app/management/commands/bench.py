@@ -0,0 +1,100 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from table_builder_app.benchmarks import SCENARIOS, BenchmarkError, BenchmarkRunner, compare_results
+
+
+def int_list(value):
+    return [int(part) for part in value.split(',') if part]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the table endpoints: create-table latency by field count, single and bulk insert '
+        'throughput, rows read latency and schema update time by table size.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='Scenario to run; may be repeated. Default: all.')
+        parser.add_argument('--repeat', type=int, default=20, help='Requests per measurement.')
+        parser.add_argument('--field-counts', type=int_list, default=[1, 10, 50], help='Field counts for create_table.')
+        parser.add_argument('--bulk-sizes', type=int_list, default=[100, 1000, 10000], help='Rows per request for insert_bulk.')
+        parser.add_argument('--table-sizes', type=int_list, default=[1000, 10000, 100000], help='Table sizes for read_rows and update_schema.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--baseline', help='Compare the results with a JSON file written by an earlier run.')
+        parser.add_argument('--threshold', type=float, default=0.1, help='Slowdown reported as regression, as a fraction. Default: 0.1.')
+        parser.add_argument('--fail-on-regression', action='store_true', help='Exit with an error if a regression is found.')
+        parser.add_argument(
+            '--in-place', action='store_true',
+            help='Run against the configured database instead of a throwaway test database.',
+        )
+
+    def handle(self, *args, **options):
+        # Serve the requests like the test runner does: DEBUG off and the test client host allowed
+        try:
+            setup_test_environment(debug=False)
+            test_environment = True
+        except RuntimeError:
+            # Already set up, e.g. when called from the test suite
+            test_environment = False
+
+        test_database = None
+        if not options['in_place']:
+            test_database = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            summaries = self.run_benchmarks(options)
+        finally:
+            if test_database is not None:
+                connection.creation.destroy_test_db(test_database, verbosity=0)
+            if test_environment:
+                teardown_test_environment()
+
+        for summary in summaries:
+            self.stdout.write(self.format_summary(summary))
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'database': connection.vendor, 'results': summaries}, output, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+        if options['baseline']:
+            self.compare(summaries, options)
+
+    def run_benchmarks(self, options):
+        runner = BenchmarkRunner(options['repeat'], options['field_counts'], options['bulk_sizes'], options['table_sizes'])
+        try:
+            return [result.summary() for result in runner.run(options['scenario'] or SCENARIOS)]
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+        finally:
+            runner.cleanup()
+
+    def format_summary(self, summary):
+        params = ' '.join(f'{name}={value}' for name, value in summary['params'].items())
+        line = (
+            f'{summary["scenario"]:<14} {params:<40} p50 {summary["p50_ms"]:>9.2f} ms  p95 {summary["p95_ms"]:>9.2f} ms  '
+            f'p99 {summary["p99_ms"]:>9.2f} ms  queries {summary["queries"]:>6}'
+        )
+        if 'rows_per_second' in summary:
+            line += f'  {summary["rows_per_second"]:>10.1f} rows/s'
+        return line
+
+    def compare(self, summaries, options):
+        with open(options['baseline']) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+
+        comparisons, regressions = compare_results(summaries, baseline, options['threshold'])
+        self.stdout.write(f'Compared with {options["baseline"]}:')
+        for key, metric, previous, current, change in comparisons:
+            line = f'{key:<55} {metric:<8} {previous:>10} -> {current:>10} ({change:+.1%})'
+            style = self.style.ERROR if change > options['threshold'] else self.style.SUCCESS if change < 0 else str
+            self.stdout.write(style(line))
+
+        if regressions:
+            message = f'{len(regressions)} metrics regressed by more than {options["threshold"]:.0%}.'
+            if options['fail_on_regression']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from table_builder_app.deletes import enforce_retention_policy
+from table_builder_app.models import RetentionPolicy
+
+
+class Command(BaseCommand):
+    help = 'Delete the rows that the retention policies of tables no longer keep, e.g. from a cron job.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--table', type=int, action='append', dest='tables',
+            help='ID of a table to enforce the policy of; may be repeated. Defaults to every table with a policy.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.ROW_DELETE_BATCH_SIZE,
+            help='Rows deleted per batch, each in its own transaction.'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=settings.ROW_DELETE_BATCH_SLEEP,
+            help='Seconds to pause between two batches.'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        policies = RetentionPolicy.objects.order_by('model_schema_id')
+        if options['tables']:
+            policies = policies.filter(model_schema_id__in=options['tables'])
+
+        for policy in policies:
+            started = time.monotonic()
+
+            def progress(rows_deleted):
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'Table {policy.model_schema_id}: {rows_deleted} rows deleted')
+
+            deleted = enforce_retention_policy(
+                policy, progress=progress, batch_size=options['batch_size'], sleep=options['sleep']
+            )
+            elapsed = time.monotonic() - started
+            rate = deleted / elapsed if elapsed else 0
+            self.stdout.write(
+                f'Table {policy.model_schema_id}: {deleted} rows deleted in {elapsed:.1f}s ({rate:.0f} rows/s)'
+            )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from table_builder_app.models import ColumnMigration
+from table_builder_app.online import run_column_migration
+
+
+class Command(BaseCommand):
+    help = 'Finish online column type changes that were interrupted, e.g. by a server restart.'
+
+    def handle(self, *args, **options):
+        for migration_id in ColumnMigration.objects.filter(
+            state__in=ColumnMigration.ACTIVE_STATES
+        ).order_by('id').values_list('id', flat=True):
+            migration = run_column_migration(migration_id)
+            self.stdout.write(f'Column migration {migration.id}: {migration.state}')
@@ -0,0 +1,76 @@
+import os
+import socket
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from table_builder_app.jobs import claim_job, recover_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Run queued table jobs, such as bulk inserts and schema updates, until interrupted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.JOB_WORKER_CONCURRENCY,
+            help='Jobs run at the same time, each in its own thread and database connection.'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.JOB_POLL_INTERVAL,
+            help='Seconds to wait before polling an empty queue again.'
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Exit once the queue is empty instead of waiting for new jobs.'
+        )
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1.')
+
+        recovered = recover_stale_jobs()
+        if recovered:
+            self.stdout.write(f'Recovered {recovered} jobs abandoned by a previous worker.')
+
+        name = f'{socket.gethostname()}-{os.getpid()}'
+        stopped = threading.Event()
+        threads = [
+            threading.Thread(
+                target=self.work, args=(f'{name}-{index}', stopped, options['poll_interval'], options['burst']),
+                name=f'table-worker-{index}'
+            )
+            for index in range(options['concurrency'])
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                # A timeout keeps the main thread responsive to Ctrl-C
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping once the running jobs have finished.')
+            stopped.set()
+            for thread in threads:
+                thread.join()
+
+    def work(self, worker, stopped, poll_interval, burst):
+        try:
+            while not stopped.is_set():
+                job = claim_job(worker=worker)
+                if job is None:
+                    # Jobs of web processes and other workers that died while this one is running
+                    recovered = recover_stale_jobs()
+                    if recovered:
+                        self.stdout.write(f'Recovered {recovered} jobs abandoned by their worker.')
+                        continue
+                    if burst:
+                        return
+                    stopped.wait(poll_interval)
+                    continue
+                job = run_job(job)
+                self.stdout.write(f'Job {job.id} ({job.kind}): {job.state}')
+        finally:
+            connection.close()
@@ -0,0 +1,276 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Statements that change the structure of a table and hold an exclusive lock on it
+DDL_PREFIXES = ('ALTER ', 'CREATE ', 'DROP ', 'TRUNCATE ', 'LOCK ')
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_current_timings = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """
+    Time spent by one request, split into phases, and the queries it ran.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {'db': 0.0, 'ddl': 0.0, 'model_build': 0.0, 'serialize': 0.0}
+        self.query_count = 0
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def add(self, phase, duration):
+        self.phases[phase] = self.phases.get(phase, 0.0) + duration
+
+    def record_query(self, sql, duration):
+        self.query_count += 1
+        self.add('db', duration)
+        if sql.lstrip().upper().startswith(DDL_PREFIXES):
+            self.add('ddl', duration)
+
+    def server_timing(self):
+        """
+        Return the value of the ``Server-Timing`` header, with durations in milliseconds.
+        """
+        entries = [f'db;dur={self.phases["db"] * 1000:.2f};desc="{self.query_count} queries"']
+        entries += [
+            f'{phase};dur={duration * 1000:.2f}'
+            for phase, duration in self.phases.items() if phase != 'db' and duration
+        ]
+        entries.append(f'total;dur={self.total * 1000:.2f}')
+        return ', '.join(entries)
+
+
+@contextmanager
+def collect_timings():
+    timings = RequestTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+@contextmanager
+def timed(phase):
+    """
+    Add the time spent in the block to a phase of the current request, if any.
+    """
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(phase, time.perf_counter() - start)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """
+    ``connection_created`` receiver adding query_timer() to a database connection.
+
+    Installed once per connection object, which outlives reconnects, so that
+    queries are recorded in whichever thread runs them.
+    """
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+def query_timer(execute, sql, params, many, context):
+    """
+    Database execute wrapper recording every query in the current request.
+    """
+    timings = _current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.record_query(sql, time.perf_counter() - start)
+
+
+class Counter:
+    """
+    Monotonic counter kept in process memory.
+    """
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+connections_opened = Counter()
+
+# Seconds spent in each phase of the startup of this process, recorded by startup.warm_up()
+startup_durations = {}
+STARTUP_PHASES = {
+    'setup': 'Django setup and import of the installed apps',
+    'urls': 'import of the URL configuration and the views',
+    'model_warmup': 'building the model classes of all tables',
+}
+
+# Rows of buffered inserts that could not be written, which fire-and-forget clients never hear about
+buffered_rows_failed = Counter()
+
+
+def count_connection(sender, connection, **kwargs):
+    """
+    ``connection_created`` receiver counting new database connections.
+
+    With persistent connections or a pool this stays flat under load; a
+    counter growing with the request rate means connections are not reused.
+    """
+    connections_opened.inc()
+
+
+# Statistics of a psycopg 3 connection pool exposed as metrics
+POOL_STATS = (
+    ('pool_max', 'gauge', 'Maximum number of connections in the pool.'),
+    ('pool_size', 'gauge', 'Connections managed by the pool, in use or idle.'),
+    ('pool_available', 'gauge', 'Idle connections in the pool.'),
+    ('requests_waiting', 'gauge', 'Requests waiting for a connection from the pool.'),
+    ('requests_num', 'counter', 'Connections requested from the pool.'),
+    ('requests_queued', 'counter', 'Connection requests that had to wait for a connection.'),
+    ('requests_errors', 'counter', 'Connection requests that timed out or failed.'),
+)
+
+
+def get_pool_samples(connection):
+    """
+    Return pool saturation samples for render_metrics(), or none if the connection is not pooled.
+    """
+    # Only the psycopg backend of Django 5.1+ has a pool, when enabled in OPTIONS
+    pool = getattr(connection, 'pool', None)
+    if pool is None:
+        return []
+    stats = pool.get_stats()
+    samples = []
+    for name, metric_type, documentation in POOL_STATS:
+        suffix = '_total' if metric_type == 'counter' else ''
+        # Counters that never changed are left out of the statistics
+        samples.append((f'table_builder_db_{name}{suffix}', metric_type, documentation, stats.get(name, 0)))
+    return samples
+
+
+class Histogram:
+    """
+    Prometheus histogram with a fixed set of label names, kept in process memory.
+    """
+
+    def __init__(self, name, documentation, label_names, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted(self._series.items())
+            for key, values in series:
+                labels = ','.join(f'{name}="{escape_label(value)}"' for name, value in zip(self.label_names, key))
+                separator = ',' if labels else ''
+                for bound, count in zip(self.buckets, values['buckets']):
+                    lines.append(f'{self.name}_bucket{{{labels}{separator}le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{labels}{separator}le="+Inf"}} {values["count"]}')
+                lines.append(f'{self.name}_sum{{{labels}}} {values["sum"]}')
+                lines.append(f'{self.name}_count{{{labels}}} {values["count"]}')
+        return '\n'.join(lines)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_LABELS = ('endpoint', 'table_id')
+
+request_duration = Histogram(
+    'table_builder_request_duration_seconds', 'Time spent handling API requests.', REQUEST_LABELS, DURATION_BUCKETS
+)
+request_phase_duration = Histogram(
+    'table_builder_request_phase_duration_seconds',
+    'Time spent in the database, in DDL statements, building model classes and serializing responses.',
+    REQUEST_LABELS + ('phase',), DURATION_BUCKETS
+)
+request_queries = Histogram(
+    'table_builder_request_queries', 'SQL queries run per API request.', REQUEST_LABELS, QUERY_COUNT_BUCKETS
+)
+response_size = Histogram(
+    'table_builder_response_size_bytes', 'Size of API response bodies, unless streamed.', REQUEST_LABELS, SIZE_BUCKETS
+)
+row_buffer_batch_rows = Histogram(
+    'table_builder_row_buffer_batch_rows', 'Rows written per flush of the row write buffer.', ('table_id',),
+    BATCH_SIZE_BUCKETS
+)
+row_buffer_flush_duration = Histogram(
+    'table_builder_row_buffer_flush_duration_seconds', 'Time spent writing and committing a flush of the row write buffer.',
+    ('table_id',), DURATION_BUCKETS
+)
+HISTOGRAMS = (
+    request_duration, request_phase_duration, request_queries, response_size, row_buffer_batch_rows,
+    row_buffer_flush_duration,
+)
+
+
+def observe_request(endpoint, table_id, timings, size):
+    labels = {'endpoint': endpoint, 'table_id': table_id}
+    request_duration.observe(timings.total, **labels)
+    request_queries.observe(timings.query_count, **labels)
+    for phase, duration in timings.phases.items():
+        request_phase_duration.observe(duration, phase=phase, **labels)
+    if size is not None:
+        response_size.observe(size, **labels)
+
+
+def get_startup_samples():
+    return [
+        (f'table_builder_startup_{phase}_seconds', 'gauge', f'Seconds spent on {STARTUP_PHASES[phase]} at process startup.', seconds)
+        for phase, seconds in startup_durations.items()
+    ]
+
+
+def render_metrics(samples=()):
+    """
+    Render all metrics in the Prometheus text exposition format.
+
+    ``samples`` are ``(name, type, documentation, value)`` tuples for values
+    read at scrape time, such as counters kept by other components.
+    """
+    sections = [histogram.render() for histogram in HISTOGRAMS]
+    for name, metric_type, documentation, value in samples:
+        sections.append(f'# HELP {name} {documentation}\n# TYPE {name} {metric_type}\n{name} {value}')
+    return '\n'.join(sections) + '\n'
@@ -0,0 +1,87 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import collect_timings, observe_request, timed
+from .routers import PIN_COOKIE, SAFE_METHODS
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure the requests handled by the views of this app.
+
+    Records the number of SQL queries, time spent in the database and in DDL
+    statements, model class build time, serialization time and response size.
+    The breakdown is returned in a ``Server-Timing`` header and added to the
+    histograms exposed by the metrics endpoint. Queries are recorded by the
+    execute wrapper that the app installs on every database connection.
+
+    Works in both sync and async mode, so that async views are not pushed
+    into a thread under ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with collect_timings() as timings:
+            response = self.get_response(request)
+        return self.record(request, response, timings)
+
+    async def __acall__(self, request):
+        with collect_timings() as timings:
+            response = await self.get_response(request)
+        return self.record(request, response, timings)
+
+    def record(self, request, response, timings):
+        match = request.resolver_match
+        if match is None or not match.func.__module__.startswith('table_builder_app.') or match.url_name == 'get_metrics':
+            return response
+
+        response['Server-Timing'] = timings.server_timing()
+        size = None if response.streaming else len(response.content)
+        observe_request(match.url_name, match.kwargs.get('id', ''), timings, size)
+        return response
+
+    def process_template_response(self, request, response):
+        # Render here, rather than after the middleware chain, so serialization can be timed
+        with timed('serialize'):
+            response.render()
+        return response
+
+
+class ReplicaPinMiddleware:
+    """
+    Pin a client to the primary database for a while after it changed something.
+
+    Successful writes and schema changes set a short-lived cookie, and
+    reads_from_replica() reads from the primary while the cookie is present,
+    so the client sees its own writes even if the replicas are behind.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.pin(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.pin(request, await self.get_response(request))
+
+    def pin(self, request, response):
+        if settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.DATABASE_REPLICA_PIN_SECONDS, httponly=True, samesite='Lax'
+            )
+        return response
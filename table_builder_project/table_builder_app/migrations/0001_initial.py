@@ -0,0 +1,24 @@
+# Generated by Django 4.2.3 on 2026-10-17 02:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('dynamic_models', '0002_remove_modelschema__modified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('schema_version', models.PositiveIntegerField(default=0)),
+                ('model_schema', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='table_version', to='dynamic_models.modelschema')),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.3 on 2026-10-17 03:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dynamic_models', '0002_remove_modelschema__modified'),
+        ('table_builder_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=63, unique=True)),
+                ('fields', models.JSONField()),
+                ('unique', models.BooleanField(default=False)),
+                ('condition', models.JSONField(blank=True, default=dict)),
+                ('model_schema', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='table_indexes', to='dynamic_models.modelschema')),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.3 on 2026-10-17 03:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dynamic_models', '0002_remove_modelschema__modified'),
+        ('table_builder_app', '0002_tableindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ColumnMigration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('columns', models.JSONField()),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('max_pk', models.BigIntegerField(null=True)),
+                ('last_pk', models.BigIntegerField(default=0)),
+                ('rows_total', models.PositiveBigIntegerField(default=0)),
+                ('rows_done', models.PositiveBigIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(null=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('model_schema', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='column_migrations', to='dynamic_models.modelschema')),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.3 on 2026-10-17 03:13
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('table_builder_app', '0003_columnmigration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tableversion',
+            name='data_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tableversion',
+            name='modified_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.3 on 2026-10-17 03:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dynamic_models', '0002_remove_modelschema__modified'),
+        ('table_builder_app', '0004_tableversion_data_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TablePartitioning',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=63)),
+                ('interval', models.PositiveBigIntegerField(null=True)),
+                ('period', models.CharField(blank=True, choices=[('day', 'Day'), ('week', 'Week'), ('month', 'Month')], max_length=8)),
+                ('first_partition', models.BigIntegerField()),
+                ('last_partition', models.BigIntegerField()),
+                ('model_schema', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='partitioning', to='dynamic_models.modelschema')),
+            ],
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.3 on 2026-10-17 03:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+import table_builder_app.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dynamic_models', '0002_remove_modelschema__modified'),
+        ('table_builder_app', '0005_tablepartitioning'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('bulk_insert', 'Bulk insert'), ('schema_update', 'Schema update'), ('column_migration', 'Column migration')], max_length=32)),
+                ('payload', models.JSONField(default=dict)),
+                ('state', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='queued', max_length=16)),
+                ('result', models.JSONField(default=dict)),
+                ('error', models.TextField(blank=True)),
+                ('rows_total', models.PositiveBigIntegerField(default=0)),
+                ('rows_done', models.PositiveBigIntegerField(default=0)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(null=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('heartbeat_at', models.DateTimeField(null=True)),
+                ('model_schema', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='dynamic_models.modelschema')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['state', 'id'], name='job_state_id_idx')],
+            },
+            bases=(table_builder_app.models.ProgressMixin, models.Model),
+        ),
+    ]
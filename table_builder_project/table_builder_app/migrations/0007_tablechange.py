@@ -0,0 +1,30 @@
+# Generated by Django 4.2.3 on 2026-10-17 03:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dynamic_models', '0002_remove_modelschema__modified'),
+        ('table_builder_app', '0006_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('insert', 'Insert'), ('upsert', 'Upsert'), ('delete', 'Delete'), ('schema', 'Schema change')], max_length=16)),
+                ('pks', models.JSONField(null=True)),
+                ('details', models.JSONField(null=True)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('model_schema', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='dynamic_models.modelschema')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['model_schema', 'id'], name='tablechange_table_id_idx')],
+            },
+        ),
+    ]
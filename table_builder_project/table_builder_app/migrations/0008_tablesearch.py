@@ -0,0 +1,25 @@
+# Generated by Django 4.2.3 on 2026-10-17 04:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dynamic_models', '0002_remove_modelschema__modified'),
+        ('table_builder_app', '0007_tablechange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableSearch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fields', models.JSONField(default=list)),
+                ('trigram_fields', models.JSONField(default=list)),
+                ('config', models.CharField(default='simple', max_length=63)),
+                ('model_schema', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='table_search', to='dynamic_models.modelschema')),
+            ],
+        ),
+    ]
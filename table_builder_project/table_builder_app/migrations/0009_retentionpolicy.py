@@ -0,0 +1,31 @@
+# Generated by Django 4.2.3 on 2026-10-17 04:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dynamic_models', '0002_remove_modelschema__modified'),
+        ('table_builder_app', '0008_tablesearch'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.CharField(choices=[('bulk_insert', 'Bulk insert'), ('schema_update', 'Schema update'), ('column_migration', 'Column migration'), ('delete_rows', 'Delete rows')], max_length=32),
+        ),
+        migrations.CreateModel(
+            name='RetentionPolicy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(blank=True, max_length=63)),
+                ('max_age', models.PositiveBigIntegerField(null=True)),
+                ('keep_latest', models.PositiveBigIntegerField(null=True)),
+                ('last_run_at', models.DateTimeField(null=True)),
+                ('model_schema', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='retention_policy', to='dynamic_models.modelschema')),
+            ],
+        ),
+    ]
@@ -1,2 +1,317 @@
-# Create your models here.
+import datetime
 
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.utils import timezone
+from dynamic_models.models import ModelSchema
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Postgres notification channel announcing committed table changes, with "<table id>:<change id>" payloads
+CHANGE_CHANNEL = 'table_builder_changes'
+
+# Every this many changes, changes older than CHANGE_LOG_RETENTION are deleted
+CHANGE_LOG_PRUNE_EVERY = 1000
+
+
+class TableVersion(models.Model):
+    """
+    Version counters for the structure and the rows of a dynamic table.
+
+    Stored in the database so that every worker process can tell whether the
+    model class it generated for a table is still current. Together the two
+    counters form the change token of the table, used for conditional requests
+    and as part of the page cache key.
+    """
+    model_schema = models.OneToOneField(ModelSchema, on_delete=models.CASCADE, related_name='table_version')
+    schema_version = models.PositiveIntegerField(default=0)
+    data_version = models.PositiveBigIntegerField(default=0)
+    modified_at = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def bump_schema_version(cls, model_schema):
+        return cls._bump(model_schema, 'schema_version')
+
+    @classmethod
+    def bump_data_version(cls, model_schema):
+        """
+        Record a change to the rows of a table. Call it in the transaction that writes them.
+        """
+        return cls._bump(model_schema, 'data_version')
+
+    @classmethod
+    def _bump(cls, model_schema, counter):
+        modified_at = timezone.now()
+        updated = cls.objects.filter(model_schema=model_schema).update(
+            **{counter: models.F(counter) + 1}, modified_at=modified_at
+        )
+        if not updated:
+            return cls.objects.create(model_schema=model_schema, modified_at=modified_at, **{counter: 1})
+        return cls.objects.get(model_schema=model_schema)
+
+    @property
+    def change_token(self):
+        return f'{self.schema_version}.{self.data_version}'
+
+
+class TableIndex(models.Model):
+    """
+    Index declared by the user on the columns of a dynamic table.
+
+    ``condition`` holds a filter in the rows endpoint syntax and turns the
+    index into a partial index.
+    """
+    model_schema = models.ForeignKey(ModelSchema, on_delete=models.CASCADE, related_name='table_indexes')
+    name = models.CharField(max_length=63, unique=True)
+    fields = models.JSONField()
+    unique = models.BooleanField(default=False)
+    condition = models.JSONField(default=dict, blank=True)
+
+    def get_referenced_fields(self):
+        return set(self.fields) | {key.partition('__')[0] for key in self.condition}
+
+
+class ProgressMixin:
+    """
+    Progress and throughput of an operation counting ``rows_done`` out of ``rows_total``.
+    """
+
+    @property
+    def rows_per_second(self):
+        if not self.started_at:
+            return None
+        elapsed = ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+        return round(self.rows_done / elapsed, 1) if elapsed > 0 else None
+
+    @property
+    def progress(self):
+        if self.state == self.COMPLETED:
+            return 1.0
+        if not self.rows_total:
+            return 0.0
+        return round(min(self.rows_done / self.rows_total, 1.0), 4)
+
+
+class ColumnMigration(ProgressMixin, models.Model):
+    """
+    Online change of column types on a dynamic table.
+
+    New values are written to shadow columns, backfilled in primary key
+    batches while the table stays writable, and swapped in at the end.
+    ``columns`` lists the migrated columns as dicts with ``name``,
+    ``column``, ``shadow_column`` and the target ``data_type``.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    STATE_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (COMPLETED, 'Completed'), (FAILED, 'Failed')]
+    ACTIVE_STATES = (PENDING, RUNNING)
+
+    model_schema = models.ForeignKey(ModelSchema, on_delete=models.CASCADE, related_name='column_migrations')
+    columns = models.JSONField()
+    state = models.CharField(max_length=16, choices=STATE_CHOICES, default=PENDING)
+    max_pk = models.BigIntegerField(null=True)
+    last_pk = models.BigIntegerField(default=0)
+    rows_total = models.PositiveBigIntegerField(default=0)
+    rows_done = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+
+class TablePartitioning(models.Model):
+    """
+    Range partitioning of a dynamic table on Postgres.
+
+    The partition key ``field`` is the primary key, an integer field or a
+    datetime field. Partition number ``n`` holds the keys from ``n * interval``
+    up to ``(n + 1) * interval`` for integer keys, and the ``n``-th day, week
+    or month since 1970 (UTC) for datetime keys. Partitions
+    ``first_partition`` to ``last_partition`` exist; more are created as rows
+    arrive.
+    """
+    DAY = 'day'
+    WEEK = 'week'
+    MONTH = 'month'
+    PERIOD_CHOICES = [(DAY, 'Day'), (WEEK, 'Week'), (MONTH, 'Month')]
+
+    model_schema = models.OneToOneField(ModelSchema, on_delete=models.CASCADE, related_name='partitioning')
+    field = models.CharField(max_length=63)
+    interval = models.PositiveBigIntegerField(null=True)
+    period = models.CharField(max_length=8, choices=PERIOD_CHOICES, blank=True)
+    first_partition = models.BigIntegerField()
+    last_partition = models.BigIntegerField()
+
+    def get_partition_number(self, value):
+        if not self.period:
+            return value // self.interval
+        value = value.astimezone(datetime.timezone.utc)
+        if self.period == self.MONTH:
+            return value.year * 12 + value.month - 1 - 1970 * 12
+        days = (value.date() - EPOCH.date()).days
+        if self.period == self.WEEK:
+            # Weeks start on Monday; 1 January 1970 was a Thursday
+            return (days + 3) // 7
+        return days
+
+    def get_partition_start(self, number):
+        """
+        Return the lowest key of a partition, which is the highest (exclusive) key of the previous one.
+        """
+        if not self.period:
+            return number * self.interval
+        if self.period == self.MONTH:
+            year, month = divmod(number + 1970 * 12, 12)
+            return EPOCH.replace(year=year, month=month + 1)
+        if self.period == self.WEEK:
+            return EPOCH + datetime.timedelta(days=number * 7 - 3)
+        return EPOCH + datetime.timedelta(days=number)
+
+    def get_partition_suffix(self, number):
+        if not self.period:
+            return f'm{-number}' if number < 0 else str(number)
+        start = self.get_partition_start(number)
+        return start.strftime('%Y%m' if self.period == self.MONTH else '%Y%m%d')
+
+
+class TableSearch(models.Model):
+    """
+    Search options of the string fields of a dynamic table.
+
+    ``fields`` are searched as one document with the ``q`` parameter of the
+    rows endpoint, using the Postgres text search configuration ``config``.
+    ``trigram_fields`` get trigram indexes, which serve case-insensitive
+    substring filters (``icontains``).
+    """
+    model_schema = models.OneToOneField(ModelSchema, on_delete=models.CASCADE, related_name='table_search')
+    fields = models.JSONField(default=list)
+    trigram_fields = models.JSONField(default=list)
+    config = models.CharField(max_length=63, default='simple')
+
+    def get_referenced_fields(self):
+        return set(self.fields) | set(self.trigram_fields)
+
+
+class RetentionPolicy(models.Model):
+    """
+    Rows of a dynamic table that the enforce_retention command deletes.
+
+    Either the rows whose datetime ``field`` is more than ``max_age`` seconds
+    old, or all but the ``keep_latest`` newest rows, by ``field`` if set and
+    by primary key otherwise.
+    """
+    model_schema = models.OneToOneField(ModelSchema, on_delete=models.CASCADE, related_name='retention_policy')
+    field = models.CharField(max_length=63, blank=True)
+    max_age = models.PositiveBigIntegerField(null=True)
+    keep_latest = models.PositiveBigIntegerField(null=True)
+    last_run_at = models.DateTimeField(null=True)
+
+
+class Job(ProgressMixin, models.Model):
+    """
+    Long-running table operation, queued in the database and run by a worker.
+
+    ``payload`` holds the input of the operation and ``result`` its outcome.
+    Running jobs update ``heartbeat_at`` regularly, so that jobs
+    of a worker that died can be told apart from slow ones.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    STATE_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (COMPLETED, 'Completed'), (FAILED, 'Failed')]
+
+    BULK_INSERT = 'bulk_insert'
+    SCHEMA_UPDATE = 'schema_update'
+    COLUMN_MIGRATION = 'column_migration'
+    DELETE_ROWS = 'delete_rows'
+    KIND_CHOICES = [
+        (BULK_INSERT, 'Bulk insert'), (SCHEMA_UPDATE, 'Schema update'), (COLUMN_MIGRATION, 'Column migration'),
+        (DELETE_ROWS, 'Delete rows'),
+    ]
+    # Kinds that can safely run again after being interrupted
+    RESUMABLE_KINDS = (SCHEMA_UPDATE, COLUMN_MIGRATION, DELETE_ROWS)
+
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    model_schema = models.ForeignKey(ModelSchema, on_delete=models.CASCADE, null=True, related_name='jobs')
+    payload = models.JSONField(default=dict)
+    state = models.CharField(max_length=16, choices=STATE_CHOICES, default=QUEUED)
+    result = models.JSONField(default=dict)
+    error = models.TextField(blank=True)
+    rows_total = models.PositiveBigIntegerField(default=0)
+    rows_done = models.PositiveBigIntegerField(default=0)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    heartbeat_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['state', 'id'], name='job_state_id_idx')]
+
+    def report_progress(self, rows_done, rows_total=None):
+        self.rows_done = rows_done
+        if rows_total is not None:
+            self.rows_total = rows_total
+        self.heartbeat_at = timezone.now()
+        self.save(update_fields=['rows_done', 'rows_total', 'heartbeat_at'])
+
+
+class TableChange(models.Model):
+    """
+    Entry of the change log of a dynamic table, read by its change feed.
+
+    Row changes list the ids of the rows they wrote, not their values, so
+    logging a write is one small insert; the feed reads the rows when it
+    delivers the change. Each entry is announced on ``CHANGE_CHANNEL`` once
+    its transaction commits.
+    """
+    INSERT = 'insert'
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    SCHEMA = 'schema'
+    KIND_CHOICES = [(INSERT, 'Insert'), (UPSERT, 'Upsert'), (DELETE, 'Delete'), (SCHEMA, 'Schema change')]
+    ROW_KINDS = (INSERT, UPSERT)
+
+    model_schema = models.ForeignKey(ModelSchema, on_delete=models.CASCADE, related_name='changes')
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    pks = models.JSONField(null=True)
+    details = models.JSONField(null=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['model_schema', 'id'], name='tablechange_table_id_idx')]
+
+    @classmethod
+    def record(cls, model_schema, kind, pks=None, details=None):
+        """
+        Log a change to a table. Call it in the transaction that makes the change.
+
+        On Postgres the change id is handed out under the row lock of the
+        table's change token, which the transaction holds until it commits,
+        so the changes of a table commit in id order: a feed that has read a
+        change never misses one with a lower id.
+        """
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT 1 FROM {TableVersion._meta.db_table} WHERE model_schema_id = %s FOR UPDATE', [model_schema.id]
+                )
+        change = cls.objects.create(
+            model_schema=model_schema, kind=kind, pks=list(pks) if pks is not None else None, details=details
+        )
+        if connection.vendor == 'postgresql':
+            # Notifications are only sent on commit, so listeners never see changes that are rolled back
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_notify(%s, %s)', [CHANGE_CHANNEL, f'{model_schema.id}:{change.id}'])
+        if change.id % CHANGE_LOG_PRUNE_EVERY == 0:
+            transaction.on_commit(cls.prune)
+        return change
+
+    @classmethod
+    def prune(cls):
+        cutoff = timezone.now() - datetime.timedelta(seconds=settings.CHANGE_LOG_RETENTION)
+        return cls.objects.filter(created_at__lt=cutoff).delete()[0]
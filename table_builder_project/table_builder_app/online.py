@@ -0,0 +1,288 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from dynamic_models import cache
+from dynamic_models.models import FieldSchema
+
+from .indexes import build_indexes
+from .jobs import enqueue_job, job_handler
+from .models import ColumnMigration, Job
+from .registry import get_model_schema, get_schema_version, model_registry
+from .schema import FIELD_TYPES_BY_DATA_TYPE, get_shadow_column
+
+# Active migration per table id, cached with the schema version it was looked up for
+_active_migrations = {}
+_active_migrations_lock = threading.Lock()
+
+
+def start_column_migration(plan):
+    """
+    Record a ColumnMigration for the type changes of an applied online plan.
+
+    Must be called in the transaction that applied the plan, after the shadow
+    columns were added: the table lock taken by that ``ALTER TABLE`` makes
+    every row written before it visible here, so ``max_pk`` bounds the rows
+    the backfill has to convert. The backfill runs as a job, which is
+    returned along with the migration.
+    """
+    pk_column = plan.dynamic_model._meta.pk.column
+    migration = ColumnMigration.objects.create(
+        model_schema=plan.model_schema,
+        columns=[
+            {
+                'name': field_schema.name,
+                'column': new_field.column,
+                'shadow_column': get_shadow_column(new_field.column),
+                'data_type': field_schema.data_type,
+                'db_type': new_field.db_type(connection),
+            }
+            for field_schema, _, new_field in plan.altered
+        ],
+        max_pk=plan.dynamic_model.objects.aggregate(max_pk=Max(pk_column))['max_pk'] or 0,
+    )
+    job = enqueue_job(Job.COLUMN_MIGRATION, plan.model_schema, {'migration_id': migration.id})
+    return migration, job
+
+
+@job_handler(Job.COLUMN_MIGRATION)
+def run_column_migration_job(job):
+    migration = run_column_migration(job.payload['migration_id'], progress=job.report_progress)
+    if migration.state == ColumnMigration.FAILED:
+        raise RuntimeError(migration.error)
+    return {'migration_id': migration.id, 'state': migration.state}
+
+
+def run_column_migration(migration_id, progress=None):
+    """
+    Backfill the shadow columns of a migration and swap them in.
+
+    A migration that was interrupted resumes from the last converted primary
+    key. If a value cannot be converted the shadow columns are dropped and the
+    migration is marked as failed; the table keeps its old column types.
+    ``progress`` is called with the rows converted so far and the rows to
+    convert after each batch.
+    """
+    migration = ColumnMigration.objects.get(id=migration_id)
+    if migration.state not in ColumnMigration.ACTIVE_STATES:
+        return migration
+
+    model_schema = get_model_schema(migration.model_schema_id)
+    dynamic_model = model_registry.get_model(model_schema)
+
+    if migration.state == ColumnMigration.PENDING:
+        migration.state = ColumnMigration.RUNNING
+        migration.started_at = timezone.now()
+        migration.rows_total = dynamic_model.objects.filter(pk__lte=migration.max_pk).count()
+        migration.save(update_fields=['state', 'started_at', 'rows_total'])
+
+    try:
+        _backfill(migration, dynamic_model, progress)
+        _swap(migration, model_schema, dynamic_model)
+    except Exception as e:
+        _abort(migration, model_schema, dynamic_model, e)
+    return migration
+
+
+def _backfill(migration, dynamic_model, progress):
+    pk_column = dynamic_model._meta.pk.column
+    batch_size = settings.ONLINE_MIGRATION_BATCH_SIZE
+    target = migration.max_pk
+    while True:
+        while migration.last_pk < target:
+            upper = min(migration.last_pk + batch_size, target)
+            with transaction.atomic():
+                migration.rows_done += _copy_to_shadow(
+                    dynamic_model, migration.columns,
+                    f'{connection.ops.quote_name(pk_column)} > %s AND {connection.ops.quote_name(pk_column)} <= %s',
+                    [migration.last_pk, upper]
+                )
+                migration.last_pk = upper
+                migration.save(update_fields=['rows_done', 'last_pk'])
+            if progress is not None:
+                progress(migration.rows_done, migration.rows_total)
+            time.sleep(settings.ONLINE_MIGRATION_BATCH_SLEEP)
+
+        # Also convert rows inserted in the meantime, until few enough are left for the swap
+        latest = dynamic_model.objects.aggregate(max_pk=Max(pk_column))['max_pk'] or 0
+        if latest - target <= batch_size:
+            return
+        target = latest
+
+
+def _swap(migration, model_schema, dynamic_model):
+    quote_name = connection.ops.quote_name
+    table = quote_name(dynamic_model._meta.db_table)
+    name = _get_object_name(migration)
+
+    # From here on the database fills the shadow columns on every write, so the catch-up below is final
+    assignments = ' '.join(
+        f'NEW.{quote_name(column["shadow_column"])} := CAST(NEW.{quote_name(column["column"])} AS {column["db_type"]});'
+        for column in migration.columns
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE OR REPLACE FUNCTION {quote_name(name)}() RETURNS trigger AS $$ '
+            f'BEGIN {assignments} RETURN NEW; END $$ LANGUAGE plpgsql'
+        )
+        cursor.execute(f'DROP TRIGGER IF EXISTS {quote_name(name)} ON {table}')
+        cursor.execute(
+            f'CREATE TRIGGER {quote_name(name)} BEFORE INSERT OR UPDATE ON {table} '
+            f'FOR EACH ROW EXECUTE FUNCTION {quote_name(name)}()'
+        )
+    _catch_up(migration, dynamic_model)
+
+    # Validated checks let SET NOT NULL skip scanning the table while it is locked
+    constraints = [quote_name(f'{name}_{index}') for index in range(len(migration.columns))]
+    with connection.cursor() as cursor:
+        clauses = []
+        for constraint, column in zip(constraints, migration.columns):
+            clauses.append(f'DROP CONSTRAINT IF EXISTS {constraint}')
+            clauses.append(f'ADD CONSTRAINT {constraint} CHECK ({quote_name(column["shadow_column"])} IS NOT NULL) NOT VALID')
+        cursor.execute(f'ALTER TABLE {table} ' + ', '.join(clauses))
+        for constraint in constraints:
+            cursor.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {constraint}')
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE')
+            cursor.execute(f'DROP TRIGGER {quote_name(name)} ON {table}')
+            cursor.execute(f'DROP FUNCTION {quote_name(name)}()')
+
+            clauses = []
+            for column in migration.columns:
+                clauses.append(f'DROP COLUMN {quote_name(column["column"])}')
+                clauses.append(f'ALTER COLUMN {quote_name(column["shadow_column"])} SET NOT NULL')
+            cursor.execute(f'ALTER TABLE {table} ' + ', '.join(clauses))
+            cursor.execute(f'ALTER TABLE {table} ' + ', '.join(f'DROP CONSTRAINT {constraint}' for constraint in constraints))
+            for column in migration.columns:
+                cursor.execute(
+                    f'ALTER TABLE {table} RENAME COLUMN {quote_name(column["shadow_column"])} TO {quote_name(column["column"])}'
+                )
+
+        for column in migration.columns:
+            FieldSchema.objects.filter(model_schema=model_schema, name=column['name']).update(data_type=column['data_type'])
+
+        migration.state = ColumnMigration.COMPLETED
+        migration.finished_at = timezone.now()
+        migration.save(update_fields=['state', 'finished_at'])
+
+        cache.update_last_modified(model_schema.initial_model_name)
+        model_registry.invalidate(model_schema)
+
+    # Indexes on the old columns were dropped with them; rebuild them on the new ones
+    names = {column['name'] for column in migration.columns}
+    table_indexes = [
+        table_index for table_index in model_schema.table_indexes.all()
+        if table_index.get_referenced_fields() & names
+    ]
+    if table_indexes:
+        build_indexes(model_registry.get_model(model_schema), table_indexes)
+
+
+def _abort(migration, model_schema, dynamic_model, error):
+    quote_name = connection.ops.quote_name
+    table = quote_name(dynamic_model._meta.db_table)
+    name = quote_name(_get_object_name(migration))
+    clauses = [f'DROP COLUMN IF EXISTS {quote_name(column["shadow_column"])}' for column in migration.columns]
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name} ON {table}')
+            cursor.execute(f'DROP FUNCTION IF EXISTS {name}()')
+            cursor.execute(f'ALTER TABLE {table} ' + ', '.join(clauses))
+        migration.state = ColumnMigration.FAILED
+        migration.error = str(error).strip()
+        migration.finished_at = timezone.now()
+        migration.save(update_fields=['state', 'error', 'finished_at'])
+        model_registry.invalidate(model_schema)
+
+
+def _catch_up(migration, dynamic_model):
+    """
+    Convert the rows written since the backfill that were not dual-written, in batches.
+    """
+    quote_name = connection.ops.quote_name
+    pk_column = quote_name(dynamic_model._meta.pk.column)
+    condition = ' AND '.join(
+        [f'{pk_column} > %s', f'{pk_column} <= %s']
+        + [f'{quote_name(column["shadow_column"])} IS NULL' for column in migration.columns]
+    )
+    latest = dynamic_model.objects.aggregate(max_pk=Max(dynamic_model._meta.pk.column))['max_pk'] or 0
+    lower = migration.max_pk
+    while lower < latest:
+        upper = min(lower + settings.ONLINE_MIGRATION_BATCH_SIZE, latest)
+        with transaction.atomic():
+            _copy_to_shadow(dynamic_model, migration.columns, condition, [lower, upper])
+        lower = upper
+
+
+def _get_object_name(migration):
+    # Name of the trigger, its function and the check constraints used by the swap of a migration
+    return f'table_builder_migration_{migration.id}'
+
+
+def _copy_to_shadow(dynamic_model, columns, condition, params):
+    quote_name = connection.ops.quote_name
+    assignments = ', '.join(
+        f'{quote_name(column["shadow_column"])} = CAST({quote_name(column["column"])} AS {column["db_type"]})'
+        for column in columns
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f'UPDATE {quote_name(dynamic_model._meta.db_table)} SET {assignments} WHERE {condition}', params)
+        return cursor.rowcount
+
+
+def get_active_migration(model_schema):
+    """
+    Return the pending or running migration of a table, or None.
+
+    Starting and finishing a migration both bump the schema version of the
+    table, so the lookup only hits the database once per version.
+    """
+    version = get_schema_version(model_schema)
+    with _active_migrations_lock:
+        cached = _active_migrations.get(model_schema.id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    migration = ColumnMigration.objects.filter(
+        model_schema_id=model_schema.id, state__in=ColumnMigration.ACTIVE_STATES
+    ).first()
+    with _active_migrations_lock:
+        _active_migrations[model_schema.id] = (version, migration)
+    return migration
+
+
+def dual_write_rows(model_schema, dynamic_model, pks):
+    """
+    Fill the shadow columns of freshly written rows while a migration is running.
+    """
+    migration = get_active_migration(model_schema)
+    if migration is None or not pks:
+        return
+    pk_column = connection.ops.quote_name(dynamic_model._meta.pk.column)
+    _copy_to_shadow(dynamic_model, migration.columns, f'{pk_column} = ANY(%s)', [list(pks)])
+
+
+def describe_migration(migration):
+    return {
+        'id': migration.id,
+        'table_id': migration.model_schema_id,
+        'state': migration.state,
+        'columns': [
+            {'name': column['name'], 'type': FIELD_TYPES_BY_DATA_TYPE[column['data_type']]}
+            for column in migration.columns
+        ],
+        'rows_done': migration.rows_done,
+        'rows_total': migration.rows_total,
+        'progress': migration.progress,
+        'rows_per_second': migration.rows_per_second,
+        'created_at': migration.created_at,
+        'started_at': migration.started_at,
+        'finished_at': migration.finished_at,
+        'error': migration.error,
+    }
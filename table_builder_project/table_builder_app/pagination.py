@@ -0,0 +1,89 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import replace_query_param
+
+
+def get_keyset_params(query_params):
+    """
+    Read the ``after`` and ``limit`` keyset pagination parameters.
+
+    ``limit`` is capped at ``ROWS_MAX_PAGE_SIZE``. Raises ValueError with a
+    client-facing message for malformed values.
+    """
+    after = _get_int_param(query_params, 'after', minimum=0)
+    limit = _get_int_param(query_params, 'limit', minimum=1)
+    if limit is not None:
+        limit = min(limit, settings.ROWS_MAX_PAGE_SIZE)
+    return after, limit
+
+
+def get_cursor(query_params, size):
+    """
+    Decode the opaque ``cursor`` parameter into the sort key of the last row seen.
+    """
+    token = query_params.get('cursor')
+    if token is None:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, binascii.Error):
+        raise ValueError('Invalid cursor.')
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Invalid cursor.')
+    return values
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(JSONEncoder().encode(values).encode()).decode()
+
+
+def get_page(request, row_query, rows, limit):
+    """
+    Evaluate one page of ``rows`` and build the ``Link`` header for the next one.
+
+    Pages ordered by primary key continue with ``after=<id>``; any other
+    ordering continues with an opaque ``cursor`` holding the sort key of the
+    last row. Returns the serialized rows and the header value, or None when
+    this is the last page.
+    """
+    page = list(rows[:limit + 1])
+    link = None
+    if len(page) > limit:
+        page = page[:limit]
+        last_row = page[-1]
+        if row_query.is_default_ordering:
+            link = next_page_link(request, limit, after=last_row[row_query.ordering_fields[0]])
+        else:
+            cursor = encode_cursor([last_row[name] for name in row_query.ordering_fields])
+            link = next_page_link(request, limit, cursor=cursor)
+
+    # Drop sort columns that were only selected to build the cursor
+    if row_query.fields is not None:
+        extra = set(row_query.ordering_fields) - set(row_query.fields) - set(row_query.annotations)
+        if extra:
+            page = [{key: value for key, value in row.items() if key not in extra} for row in page]
+    return page, link
+
+
+def next_page_link(request, limit, **params):
+    url = replace_query_param(request.build_absolute_uri(), 'limit', limit)
+    for key, value in params.items():
+        url = replace_query_param(url, key, value)
+    return f'<{url}>; rel="next"'
+
+
+def _get_int_param(query_params, name, minimum):
+    value = query_params.get(name)
+    if value is None:
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f'Invalid value for "{name}": expected an integer.')
+    if value < minimum:
+        raise ValueError(f'Invalid value for "{name}": must be at least {minimum}.')
+    return value
@@ -0,0 +1,33 @@
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses newline-delimited JSON lazily, one line at a time.
+
+    Returns a generator so that large uploads are never held in memory as a
+    whole. Lines that are not valid JSON are yielded as ParseError instances
+    so callers can report them per row instead of rejecting the whole body.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        return self._iter_lines(stream, encoding)
+
+    def _iter_lines(self, stream, encoding):
+        if stream is None:
+            return
+        for line in stream:
+            line = line.decode(encoding).strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as exc:
+                yield ParseError('JSON parse error - %s' % str(exc))
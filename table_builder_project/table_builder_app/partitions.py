@@ -0,0 +1,254 @@
+import copy
+import datetime
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .filters import get_data_type
+from .models import TablePartitioning
+
+# Upper bound for the partitions created at once for the rows of one write
+MAX_NEW_PARTITIONS = 1000
+
+
+def get_partitioning(model_schema):
+    try:
+        return model_schema.partitioning
+    except TablePartitioning.DoesNotExist:
+        return None
+
+
+def parse_partitioning(dynamic_model, declaration):
+    """
+    Validate the ``partition`` option of a table definition.
+
+    Returns an unsaved TablePartitioning. The key is the primary key or an
+    integer field with an integer ``interval``, or a datetime field with an
+    ``interval`` of "day", "week" or "month".
+    """
+    if not isinstance(declaration, dict) or not declaration.get('field') or not declaration.get('interval'):
+        raise ValidationError('Invalid partition data. Expected an object with a field and an interval.')
+
+    name = declaration['field']
+    interval = declaration['interval']
+    try:
+        field = dynamic_model._meta.get_field(name)
+    except FieldDoesNotExist:
+        raise ValidationError(f'Unknown partition field: {name}.')
+
+    data_type = get_data_type(field)
+    partitioning = TablePartitioning(field=field.attname)
+    if data_type == 'integer':
+        if isinstance(interval, bool) or not isinstance(interval, int) or interval < 1:
+            raise ValidationError('The interval of an integer partition key must be a positive integer.')
+        partitioning.interval = interval
+    elif data_type == 'date':
+        periods = [period for period, _ in TablePartitioning.PERIOD_CHOICES]
+        if interval not in periods:
+            supported = ', '.join(f'"{period}"' for period in periods)
+            raise ValidationError(f'The interval of a datetime partition key must be one of {supported}.')
+        partitioning.period = interval
+    else:
+        raise ValidationError('Tables can only be partitioned on the primary key, an integer or a datetime field.')
+    return partitioning
+
+
+def is_growing(partitioning, dynamic_model):
+    # Keys that follow insertion order, for which partitions are created ahead
+    return bool(partitioning.period) or partitioning.field == dynamic_model._meta.pk.attname
+
+
+def get_partition_name(partitioning, dynamic_model, number):
+    name = f'{dynamic_model._meta.db_table}_p{partitioning.get_partition_suffix(number)}'
+    if len(name) > connection.ops.max_name_length():
+        name = f'table{partitioning.model_schema_id}_p{partitioning.get_partition_suffix(number)}'
+    return name
+
+
+def get_detached_name(name, detached_at):
+    # Detached partitions are renamed, so that a partition for the same range can be created again
+    suffix = f'_detached_{detached_at:%Y%m%d%H%M%S}'
+    return name[:connection.ops.max_name_length() - len(suffix)] + suffix
+
+
+def partition_table(dynamic_model, partitioning):
+    """
+    Recreate the empty table of a new dynamic table as a range partitioned table.
+
+    Postgres requires the partition key to be part of the primary key, so the
+    primary key of a table partitioned on a field covers the id and the key.
+    Must be called inside the transaction that created the table.
+    """
+    pk = dynamic_model._meta.pk
+    key = dynamic_model._meta.get_field(partitioning.field)
+    quote_name = connection.ops.quote_name
+    table = quote_name(dynamic_model._meta.db_table)
+
+    with connection.schema_editor() as schema_editor:
+        columns = []
+        for field in dynamic_model._meta.concrete_fields:
+            if field.primary_key:
+                # Keep the identity column, without the single column primary key
+                field = copy.copy(field)
+                field.primary_key = False
+            definition, _ = schema_editor.column_sql(dynamic_model, field)
+            suffix = field.db_type_suffix(connection)
+            columns.append(' '.join(filter(None, [quote_name(field.column), definition, suffix])))
+        primary_key = ', '.join(quote_name(column) for column in dict.fromkeys([pk.column, key.column]))
+        columns.append(f'PRIMARY KEY ({primary_key})')
+
+        schema_editor.execute(f'DROP TABLE {table}')
+        schema_editor.execute(
+            f'CREATE TABLE {table} ({", ".join(columns)}) PARTITION BY RANGE ({quote_name(key.column)})'
+        )
+
+    first = partitioning.get_partition_number(timezone.now()) if partitioning.period else 0
+    last = first + settings.PARTITIONS_PREMAKE if is_growing(partitioning, dynamic_model) else first
+    partitioning.first_partition = first
+    partitioning.last_partition = last
+    partitioning.save()
+    create_partitions(partitioning, dynamic_model, range(first, last + 1))
+
+
+def create_partitions(partitioning, dynamic_model, numbers):
+    quote_name = connection.ops.quote_name
+    table = quote_name(dynamic_model._meta.db_table)
+    with connection.cursor() as cursor:
+        for number in numbers:
+            name = quote_name(get_partition_name(partitioning, dynamic_model, number))
+            cursor.execute(
+                f'CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)',
+                [partitioning.get_partition_start(number), partitioning.get_partition_start(number + 1)]
+            )
+
+
+def get_required_partitions(partitioning, dynamic_model, instances):
+    """
+    Return the numbers of the partitions that rows about to be inserted fall into.
+    """
+    field = dynamic_model._meta.get_field(partitioning.field)
+    numbers = set()
+    for instance in instances:
+        value = getattr(instance, field.attname)
+        if value is None:
+            continue
+        value = field.to_python(value)
+        if partitioning.period and timezone.is_naive(value):
+            value = timezone.make_aware(value, datetime.timezone.utc)
+        numbers.add(partitioning.get_partition_number(value))
+
+    if field.primary_key:
+        # Ids are assigned by the database; the next ones follow the last one handed out
+        new_rows = sum(1 for instance in instances if instance.pk is None)
+        if new_rows:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT pg_sequence_last_value(pg_get_serial_sequence(%s, %s)::regclass)',
+                    [connection.ops.quote_name(dynamic_model._meta.db_table), field.column]
+                )
+                last_id = cursor.fetchone()[0] or 0
+            numbers.add(partitioning.get_partition_number(last_id + 1))
+            numbers.add(partitioning.get_partition_number(last_id + new_rows))
+    return numbers
+
+
+def ensure_partitions(partitioning, dynamic_model, instances):
+    """
+    Create the missing partitions for rows about to be inserted.
+
+    Partitions always form one contiguous range. Partitions of keys that
+    grow with time are created ``PARTITIONS_PREMAKE`` ahead, so that
+    creating them, which briefly locks the table, is rare. Does nothing for
+    tables that are not partitioned.
+    """
+    if partitioning is None:
+        return
+    numbers = get_required_partitions(partitioning, dynamic_model, instances)
+    if not numbers:
+        return
+    low, high = min(numbers), max(numbers)
+    if partitioning.first_partition <= low and high <= partitioning.last_partition:
+        return
+
+    if is_growing(partitioning, dynamic_model) and high > partitioning.last_partition:
+        high += settings.PARTITIONS_PREMAKE
+    with transaction.atomic():
+        # Serializes concurrent writers; the partitions may have been created in the meantime
+        current = TablePartitioning.objects.select_for_update().get(pk=partitioning.pk)
+        low, high = min(low, current.first_partition), max(high, current.last_partition)
+        missing = list(range(low, current.first_partition)) + list(range(current.last_partition + 1, high + 1))
+        if len(missing) > MAX_NEW_PARTITIONS:
+            raise ValidationError(
+                f'Value of "{partitioning.field}" is too far outside the partitioned range of the table.'
+            )
+        create_partitions(current, dynamic_model, missing)
+        current.first_partition, current.last_partition = low, high
+        current.save(update_fields=['first_partition', 'last_partition'])
+    partitioning.first_partition, partitioning.last_partition = low, high
+
+
+def list_partitions(partitioning, dynamic_model):
+    """
+    Describe the partitions of a table, oldest first, with planner row estimates and sizes.
+    """
+    names = {
+        get_partition_name(partitioning, dynamic_model, number): number
+        for number in range(partitioning.first_partition, partitioning.last_partition + 1)
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT relname, reltuples::bigint, pg_total_relation_size(oid) FROM pg_class '
+            'WHERE relname = ANY(%s) AND relkind = %s',
+            [list(names), 'r']
+        )
+        stats = {name: (rows, size) for name, rows, size in cursor.fetchall()}
+
+    partitions = []
+    for name, number in names.items():
+        if name not in stats:
+            continue
+        rows, size = stats[name]
+        partitions.append({
+            'name': name,
+            'from': partitioning.get_partition_start(number),
+            'to': partitioning.get_partition_start(number + 1),
+            'estimated_rows': max(rows, 0),
+            'size_bytes': size,
+        })
+    return partitions
+
+
+def drop_partitions(partitioning, dynamic_model, before, detach=False):
+    """
+    Drop, or detach, the partitions that only hold keys below ``before``.
+
+    Dropping a partition removes its rows at once, without the cost of a
+    ``DELETE``; a detached partition is kept as a table of its own, renamed
+    with a ``_detached_<timestamp>`` suffix. The newest partition is always
+    kept. Returns the names of the dropped partitions, or the new names of
+    the detached ones.
+    """
+    quote_name = connection.ops.quote_name
+    table = quote_name(dynamic_model._meta.db_table)
+    detached_at = timezone.now()
+    with transaction.atomic():
+        current = TablePartitioning.objects.select_for_update().get(pk=partitioning.pk)
+        last_removed = min(current.get_partition_number(before) - 1, current.last_partition - 1)
+        removed = []
+        with connection.cursor() as cursor:
+            for number in range(current.first_partition, last_removed + 1):
+                name = get_partition_name(current, dynamic_model, number)
+                if detach:
+                    detached_name = get_detached_name(name, detached_at)
+                    cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {quote_name(name)}')
+                    cursor.execute(f'ALTER TABLE {quote_name(name)} RENAME TO {quote_name(detached_name)}')
+                    name = detached_name
+                else:
+                    cursor.execute(f'DROP TABLE IF EXISTS {quote_name(name)}')
+                removed.append(name)
+        if removed:
+            current.first_partition = last_removed + 1
+            current.save(update_fields=['first_partition'])
+    return removed
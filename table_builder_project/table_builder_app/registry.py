@@ -0,0 +1,172 @@
+import threading
+
+from asgiref.sync import sync_to_async
+from dynamic_models.factory import FieldFactory, ModelFactory
+from dynamic_models.models import FieldSchema, ModelSchema
+
+from .metrics import timed
+from .models import TableChange, TableVersion
+from .validation import RowValidator
+
+
+def get_model_schema(id):
+    """
+    Fetch a table definition together with its schema version in one query.
+    """
+    return ModelSchema.objects.select_related('table_version', 'partitioning', 'table_search').get(id=id)
+
+
+async def aget_model_schema(id):
+    return await ModelSchema.objects.select_related('table_version', 'partitioning', 'table_search').aget(id=id)
+
+
+def get_schema_version(model_schema):
+    try:
+        return model_schema.table_version.schema_version
+    except TableVersion.DoesNotExist:
+        return 0
+
+
+class DynamicModelRegistry:
+    """
+    Process-wide cache of the model classes generated for dynamic tables.
+
+    Each class is stored with the schema version it was built from. The version
+    lives in the database and is bumped whenever the field set of a table
+    changes, so a change made by one worker invalidates the cached class in
+    every other worker on its next lookup. The row validator of each table is
+    cached the same way.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._validators = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_model(self, model_schema):
+        version = get_schema_version(model_schema)
+        with self._lock:
+            model = self._get_cached(model_schema.id, version)
+            if model is not None:
+                return model
+
+            self.misses += 1
+            with timed('model_build'):
+                model = ModelFactory(model_schema).make_model()
+            self._models[model_schema.id] = (version, model)
+            return model
+
+    async def aget_model(self, model_schema):
+        """
+        Async variant of get_model(); cache hits never leave the event loop.
+        """
+        version = get_schema_version(model_schema)
+        with self._lock:
+            model = self._get_cached(model_schema.id, version)
+        if model is not None:
+            return model
+        return await sync_to_async(self.get_model)(model_schema)
+
+    def _get_cached(self, model_schema_id, version):
+        cached = self._models.get(model_schema_id)
+        if cached is not None and cached[0] == version:
+            self.hits += 1
+            return cached[1]
+        return None
+
+    def get_validator(self, model_schema):
+        """
+        Return the RowValidator of a table, compiled once per schema version.
+        """
+        version = get_schema_version(model_schema)
+        with self._lock:
+            validator = self._get_cached_validator(model_schema.id, version)
+        if validator is not None:
+            return validator
+
+        validator = RowValidator(self.get_model(model_schema))
+        with self._lock:
+            self._validators[model_schema.id] = (version, validator)
+        return validator
+
+    async def aget_validator(self, model_schema):
+        version = get_schema_version(model_schema)
+        with self._lock:
+            validator = self._get_cached_validator(model_schema.id, version)
+        if validator is not None:
+            return validator
+        return await sync_to_async(self.get_validator)(model_schema)
+
+    def _get_cached_validator(self, model_schema_id, version):
+        cached = self._validators.get(model_schema_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        return None
+
+    def warm(self):
+        """
+        Build the model classes of all tables at once, e.g. before a server forks its workers.
+
+        Tables, their schema versions and their fields are read with one
+        joined query. Building the classes one by one would instead query the
+        fields of each table, and then the table again for every field, as
+        field schemas look up their table when they are created. Returns the
+        number of classes built.
+        """
+        rows = ModelSchema.objects.order_by('id', 'fields__id').values_list(
+            'id', 'name', 'table_version__schema_version',
+            'fields__id', 'fields__name', 'fields__data_type', 'fields__null', 'fields__unique', 'fields__max_length',
+        )
+        tables = {}
+        for table_id, name, version, field_id, *field_values in rows:
+            if table_id not in tables:
+                tables[table_id] = (ModelSchema.from_db('default', ['id', 'name'], [table_id, name]), version or 0, [])
+            model_schema, _, field_schemas = tables[table_id]
+            if field_id is not None:
+                field_name, data_type, null, unique, max_length = field_values
+                field_schemas.append(FieldSchema(
+                    id=field_id, model_schema=model_schema, name=field_name, data_type=data_type, null=null,
+                    unique=unique, max_length=max_length
+                ))
+
+        models = {}
+        with timed('model_build'):
+            for table_id, (model_schema, version, field_schemas) in tables.items():
+                models[table_id] = (version, _PreloadedModelFactory(model_schema, field_schemas).make_model())
+        with self._lock:
+            self._models.update(models)
+        return len(models)
+
+    def invalidate(self, model_schema):
+        """
+        Record a change to the table structure and drop the cached class.
+        """
+        model_schema.table_version = TableVersion.bump_schema_version(model_schema)
+        TableChange.record(
+            model_schema, TableChange.SCHEMA, details={'schema_version': model_schema.table_version.schema_version}
+        )
+        with self._lock:
+            self._models.pop(model_schema.id, None)
+            self._validators.pop(model_schema.id, None)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._models)}
+
+
+class _PreloadedModelFactory(ModelFactory):
+    """
+    Model factory for a table whose field schemas were already read.
+    """
+
+    def __init__(self, model_schema, field_schemas):
+        super().__init__(model_schema)
+        self.field_schemas = field_schemas
+
+    def _custom_fields(self):
+        return {field_schema.db_column: FieldFactory(field_schema).make_field() for field_schema in self.field_schemas}
+
+
+model_registry = DynamicModelRegistry()
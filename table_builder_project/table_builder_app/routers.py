@@ -0,0 +1,204 @@
+import functools
+import math
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+# Cookie set on responses to writes; while present, the client reads from the primary
+PIN_COOKIE = 'table_builder_primary'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Apps of the models read from replicas: table schemas, their versions and the dynamic models
+REPLICA_APP_LABELS = ('dynamic_models', 'table_builder_app')
+
+# Seconds a measured replication lag is reused before the replica is asked again
+LAG_CHECK_INTERVAL = 1.0
+
+_read_alias = ContextVar('replica_read_alias', default=None)
+
+
+def measure_replica_lag(connection):
+    """
+    Return how many seconds a replica is behind its primary.
+
+    A replica that replayed everything it received is not behind, however
+    long ago the last transaction on the primary was. A database that is
+    not a replica, as in tests, has no lag.
+    """
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT COALESCE(CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+            'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END, 0)'
+        )
+        return float(cursor.fetchone()[0])
+
+
+class ReplicaSelector:
+    """
+    Pick the replica that serves the reads of a request.
+
+    Replicas are taken in turn (``round_robin``) or by increasing replication
+    lag (``least_lag``). Replicas further behind than
+    ``DATABASE_REPLICA_MAX_LAG`` seconds, or that cannot be reached, are
+    skipped; when no replica is left, reads go to the primary.
+    """
+
+    def __init__(self, measure_lag=None):
+        self.measure_lag = measure_lag or (lambda alias: measure_replica_lag(connections[alias]))
+        self._next = 0
+        self._lags = {}
+        self._lock = threading.Lock()
+
+    def select(self):
+        replicas = list(settings.DATABASE_REPLICAS)
+        if not replicas:
+            return None
+        with self._lock:
+            start = self._next % len(replicas)
+            self._next += 1
+
+        candidates = replicas[start:] + replicas[:start]
+        if settings.DATABASE_REPLICA_SELECTION == 'least_lag':
+            # Stable sort, so replicas with the same lag still take turns
+            candidates.sort(key=self.get_lag)
+        for alias in candidates:
+            if self.get_lag(alias) <= settings.DATABASE_REPLICA_MAX_LAG:
+                return alias
+        return None
+
+    def get_lag(self, alias):
+        now = time.monotonic()
+        checked = self._lags.get(alias)
+        if checked is not None and now - checked[0] < LAG_CHECK_INTERVAL:
+            return checked[1]
+        try:
+            lag = self.measure_lag(alias)
+        except DatabaseError:
+            lag = math.inf
+        self._lags[alias] = (now, lag)
+        return lag
+
+    def reset(self):
+        with self._lock:
+            self._next = 0
+            self._lags.clear()
+
+
+replica_selector = ReplicaSelector()
+
+
+def get_read_alias(request):
+    """
+    Return the replica alias for the reads of a request, or None to read from the primary.
+    """
+    if request.method not in SAFE_METHODS or request.COOKIES.get(PIN_COOKIE):
+        return None
+    return replica_selector.select()
+
+
+def reads_from_replica(view):
+    """
+    Decorator running the queries of a read-only view on a replica.
+
+    The alias stays in effect while a streamed response is consumed, since
+    its rows are only fetched then.
+    """
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            alias = await sync_to_async(get_read_alias)(request)
+            if alias is None:
+                return await view(request, *args, **kwargs)
+            token = _read_alias.set(alias)
+            try:
+                response = await view(request, *args, **kwargs)
+            finally:
+                _read_alias.reset(token)
+            return _bind_streaming_content(response, alias)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        alias = get_read_alias(request)
+        if alias is None:
+            return view(request, *args, **kwargs)
+        token = _read_alias.set(alias)
+        try:
+            response = view(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+        return _bind_streaming_content(response, alias)
+    return wrapper
+
+
+def _bind_streaming_content(response, alias):
+    if response.streaming:
+        if response.is_async:
+            response.streaming_content = _async_chunks_using(alias, response.streaming_content)
+        else:
+            response.streaming_content = _chunks_using(alias, response.streaming_content)
+    return response
+
+
+def _chunks_using(alias, content):
+    iterator = iter(content)
+    while True:
+        token = _read_alias.set(alias)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _read_alias.reset(token)
+        yield chunk
+
+
+async def _async_chunks_using(alias, content):
+    iterator = content.__aiter__()
+    while True:
+        token = _read_alias.set(alias)
+        try:
+            chunk = await iterator.__anext__()
+        except StopAsyncIteration:
+            return
+        finally:
+            _read_alias.reset(token)
+        yield chunk
+
+
+class ReplicaRouter:
+    """
+    Database router sending the reads of views decorated with reads_from_replica() to a replica.
+
+    Only table schemas and rows are read from replicas; every other query,
+    and every write, goes to the primary (``default``).
+    Replicas get their schema from the primary through replication, so
+    migrations are never run on them.
+    """
+
+    def db_for_read(self, model, **hints):
+        # Users and sessions are always read from the primary
+        if model._meta.app_label in REPLICA_APP_LABELS:
+            return _read_alias.get()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
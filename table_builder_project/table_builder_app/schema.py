@@ -0,0 +1,264 @@
+from django.core.exceptions import ValidationError
+from django.db import connection
+from dynamic_models import cache
+from dynamic_models.exceptions import DynamicModelError
+from dynamic_models.factory import FieldFactory
+from dynamic_models.models import FieldSchema
+
+from .filters import get_data_type
+from .indexes import drop_indexes_for_fields
+from .models import TableIndex
+from .deletes import get_retention_policy
+from .partitions import get_partitioning
+from .search import get_table_search, is_search_changed, parse_search_options
+
+FIELD_TYPE_MAPPING = {
+    'string': 'character',
+    'integer': 'integer',
+    'boolean': 'boolean',
+    'datetime': 'date',
+}
+
+FIELD_TYPES_BY_DATA_TYPE = {data_type: field_type for field_type, data_type in FIELD_TYPE_MAPPING.items()}
+
+
+def parse_field_definitions(fields):
+    """
+    Validate the ``fields`` list of a table definition.
+
+    Returns a dict of field name to FieldSchema data type, in request order.
+    Raises ValidationError before anything is written if any entry is invalid.
+    """
+    if not isinstance(fields, list):
+        raise ValidationError('Invalid fields data. Expected a list of fields.')
+
+    definitions = {}
+    for field in fields:
+        name = field.get('name') if isinstance(field, dict) else None
+        field_type = field.get('type') if isinstance(field, dict) else None
+        if not name or not field_type:
+            raise ValidationError('Invalid field data. Each field should have a name and a type.')
+
+        data_type = FIELD_TYPE_MAPPING.get(field_type)
+        if not data_type:
+            raise ValidationError(f'Invalid field type: {field_type}. Supported types are "string", "integer", "boolean" and "datetime".')
+        if name in definitions:
+            raise ValidationError(f'Duplicate field name: {name}.')
+        definitions[name] = data_type
+    return definitions
+
+
+def get_shadow_column(column):
+    # Field names cannot contain "__", so this never clashes with a user column
+    return f'{column}__new'
+
+
+def make_model_field(field_schema):
+    field = FieldFactory(field_schema).make_field()
+    field.set_attributes_from_name(field_schema.db_column)
+    return field
+
+
+class SchemaUpdatePlan:
+    """
+    Difference between the stored fields of a table and a requested field set.
+
+    Built from a single query over the table's FieldSchema rows. On Postgres
+    all column changes are applied with one ``ALTER TABLE`` statement, so the
+    table is locked (and, for type changes, rewritten) only once.
+
+    With ``online``, type changes do not rewrite the table: a nullable shadow
+    column is added for each altered field instead, to be backfilled and
+    swapped in by a ColumnMigration.
+
+    The ``searchable`` and ``trigram`` options of the fields are planned too.
+    Search objects covering changed columns have to be dropped before the
+    change and created again after it.
+    """
+
+    def __init__(self, model_schema, dynamic_model, fields, allow_deletion, online=False):
+        self.model_schema = model_schema
+        self.dynamic_model = dynamic_model
+        self.online = online
+        self.added = []
+        self.altered = []
+        self.dropped = []
+
+        definitions = parse_field_definitions(fields)
+        existing = {field_schema.name: field_schema for field_schema in model_schema.fields.all()}
+
+        for name, data_type in definitions.items():
+            field_schema = existing.pop(name, None)
+            if field_schema is None:
+                field_schema = FieldSchema(model_schema=model_schema, name=name, data_type=data_type)
+                self._validate(field_schema)
+                self.added.append((field_schema, make_model_field(field_schema)))
+            elif field_schema.data_type != data_type:
+                old_field = dynamic_model._meta.get_field(field_schema.db_column)
+                field_schema.data_type = data_type
+                self.altered.append((field_schema, old_field, make_model_field(field_schema)))
+
+        if allow_deletion:
+            for field_schema in existing.values():
+                self.dropped.append((field_schema, dynamic_model._meta.get_field(field_schema.db_column)))
+
+        changed = [field_schema.name for field_schema, _, _ in self.altered] + [field_schema.name for field_schema, _ in self.dropped]
+        partitioning = get_partitioning(model_schema)
+        if partitioning is not None and partitioning.field in changed:
+            raise ValidationError(f'The partition key "{partitioning.field}" cannot be changed or removed.')
+        retention_policy = get_retention_policy(model_schema)
+        if retention_policy is not None and retention_policy.field in changed:
+            raise ValidationError(f'The field "{retention_policy.field}" of the retention policy cannot be changed or removed.')
+
+        self.search = parse_search_options(fields)
+        self.table_search = get_table_search(model_schema)
+        altered = {field_schema.name for field_schema, _, _ in self.altered}
+        if online and self.search is not None and self.search.get_referenced_fields() & altered:
+            raise ValidationError('Fields changing type online cannot be searchable until the change has finished.')
+        changed = altered | {field_schema.name for field_schema, _ in self.dropped}
+        self.search_columns_changed = self.table_search is not None and (
+            bool(self.table_search.get_referenced_fields() & changed)
+            # Other backends rebuild the whole table for any column change
+            or (connection.vendor != 'postgresql' and self.has_changes)
+        )
+
+        columns = [field.column for field in dynamic_model._meta.concrete_fields]
+        columns += [field.column for _, field in self.added]
+        duplicates = {column for column in columns if columns.count(column) > 1}
+        if duplicates:
+            raise ValidationError(f'Duplicate column name: {", ".join(sorted(duplicates))}.')
+
+    @staticmethod
+    def _validate(field_schema):
+        try:
+            field_schema.validate()
+        except DynamicModelError as e:
+            raise ValidationError(str(e))
+
+    @property
+    def has_changes(self):
+        return bool(self.added or self.altered or self.dropped)
+
+    @property
+    def search_changed(self):
+        return self.search_columns_changed or is_search_changed(self.table_search, self.search)
+
+    @property
+    def rewrites_table(self):
+        # Adding a column without a default and dropping one only touch the
+        # catalog on Postgres; changing a column type or adding the generated
+        # search column rewrites every row.
+        return (bool(self.altered) and not self.online) or bool(
+            self.search_changed and self.search is not None and self.search.fields
+        )
+
+    @property
+    def dropped_columns(self):
+        return [field.column for _, field in self.dropped]
+
+    def describe(self):
+        return {
+            'added': [
+                {'name': field_schema.name, 'type': FIELD_TYPES_BY_DATA_TYPE[field_schema.data_type]}
+                for field_schema, _ in self.added
+            ],
+            'altered': [
+                {
+                    'name': field_schema.name,
+                    'from': FIELD_TYPES_BY_DATA_TYPE[get_data_type(old_field)],
+                    'to': FIELD_TYPES_BY_DATA_TYPE[field_schema.data_type],
+                }
+                for field_schema, old_field, _ in self.altered
+            ],
+            'dropped': [field_schema.name for field_schema, _ in self.dropped],
+        }
+
+    def estimate_row_count(self):
+        """
+        Row count from the planner statistics, or None if unknown.
+        """
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [connection.ops.quote_name(self.dynamic_model._meta.db_table)]
+            )
+            row = cursor.fetchone()
+        return row[0] if row and row[0] >= 0 else None
+
+    def get_statements(self):
+        """
+        Return the DDL that applying the plan runs on Postgres: one ``ALTER TABLE`` for
+        the column changes, and another dropping the defaults of added columns, if any.
+        """
+        if not self.has_changes or connection.vendor != 'postgresql':
+            return []
+
+        schema_editor = connection.schema_editor(collect_sql=True)
+        quote_name = schema_editor.quote_name
+        clauses = []
+        for _, field in self.added:
+            definition, params = schema_editor.column_sql(self.dynamic_model, field, include_default=True)
+            if params:
+                definition = definition % tuple(schema_editor.quote_value(param) for param in params)
+            clauses.append(f'ADD COLUMN {quote_name(field.column)} {definition}')
+        for _, _, field in self.altered:
+            column = quote_name(field.column)
+            db_type = field.db_type(connection)
+            if self.online:
+                clauses.append(f'ADD COLUMN {quote_name(get_shadow_column(field.column))} {db_type} NULL')
+            else:
+                clauses.append(f'ALTER COLUMN {column} TYPE {db_type} USING {column}::{db_type}')
+        for _, field in self.dropped:
+            clauses.append(f'DROP COLUMN {quote_name(field.column)}')
+
+        table = quote_name(self.dynamic_model._meta.db_table)
+        statements = [f'ALTER TABLE {table} ' + ', '.join(clauses)]
+
+        # Defaults only fill the existing rows, as with Django's add_field(). Postgres
+        # applies DROP DEFAULT before the new column is filled, so it needs a statement
+        # of its own; it only changes the catalog.
+        dropped_defaults = [
+            f'ALTER COLUMN {quote_name(field.column)} DROP DEFAULT'
+            for _, field in self.added if schema_editor.effective_default(field) is not None
+        ]
+        if dropped_defaults:
+            statements.append(f'ALTER TABLE {table} ' + ', '.join(dropped_defaults))
+        return statements
+
+    def apply(self):
+        """
+        Apply the plan. Must be called inside a transaction.
+        """
+        if not self.has_changes:
+            return
+
+        if connection.vendor == 'postgresql':
+            # Write the field metadata in bulk, bypassing FieldSchema.save() and
+            # delete() which would issue one ALTER TABLE per field.
+            FieldSchema.objects.bulk_create([field_schema for field_schema, _ in self.added])
+            if not self.online:
+                # Online type changes keep the old data type until the shadow column is swapped in
+                FieldSchema.objects.bulk_update([field_schema for field_schema, _, _ in self.altered], ['data_type'])
+            FieldSchema.objects.filter(id__in=[field_schema.id for field_schema, _ in self.dropped]).delete()
+
+            # Postgres drops indexes together with their columns; only the records are left to remove
+            for table_index in TableIndex.objects.filter(model_schema=self.model_schema):
+                if table_index.get_referenced_fields() & set(self.dropped_columns):
+                    table_index.delete()
+
+            with connection.schema_editor() as schema_editor:
+                for statement in self.get_statements():
+                    schema_editor.execute(statement, params=None)
+        else:
+            # Other backends cannot combine alterations; fall back to one change at a time
+            drop_indexes_for_fields(self.model_schema, self.dynamic_model, self.dropped_columns)
+            for field_schema, _ in self.added:
+                field_schema.save()
+            for field_schema, _, _ in self.altered:
+                field_schema.save()
+            for field_schema, _ in self.dropped:
+                field_schema.delete()
+
+        cache.update_last_modified(self.model_schema.initial_model_name)
@@ -0,0 +1,220 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, connections
+from django.db.backends.utils import names_digest
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from .models import TableSearch
+
+# Field types that can be searchable or get trigram indexes
+SEARCHABLE_FIELD_TYPES = ('string',)
+
+# Generated tsvector column of a searchable table on Postgres; field names cannot contain "__"
+SEARCH_COLUMN = 'search__vector'
+
+# Name of the relevance of each row in search results
+SEARCH_RANK = 'search_rank'
+
+
+def get_table_search(model_schema):
+    try:
+        return model_schema.table_search
+    except TableSearch.DoesNotExist:
+        return None
+
+
+def parse_search_options(fields):
+    """
+    Read the ``searchable`` and ``trigram`` options of the ``fields`` of a table definition.
+
+    Returns an unsaved TableSearch, or None if no field has either option.
+    Both options only apply to string fields, and trigram indexes require
+    Postgres.
+    """
+    table_search = TableSearch(config=settings.SEARCH_TEXT_CONFIG)
+    for field in fields:
+        if not isinstance(field, dict):
+            continue
+        searchable = field.get('searchable', False)
+        trigram = field.get('trigram', False)
+        if not isinstance(searchable, bool) or not isinstance(trigram, bool):
+            raise ValidationError('Invalid field data. "searchable" and "trigram" should be booleans.')
+        if (searchable or trigram) and field.get('type') not in SEARCHABLE_FIELD_TYPES:
+            raise ValidationError(f'Only string fields can be searchable: {field.get("name")}.')
+        if searchable:
+            table_search.fields.append(field['name'])
+        if trigram:
+            table_search.trigram_fields.append(field['name'])
+
+    if not table_search.fields and not table_search.trigram_fields:
+        return None
+    if table_search.trigram_fields and connection.vendor != 'postgresql':
+        raise ValidationError('Trigram indexes require PostgreSQL.')
+    return table_search
+
+
+def is_search_changed(table_search, requested):
+    if table_search is None or requested is None:
+        return table_search is not requested
+    return (table_search.fields, table_search.trigram_fields) != (requested.fields, requested.trigram_fields)
+
+
+def get_search_table(dynamic_model):
+    # The FTS5 table holding the search index on SQLite
+    return f'{dynamic_model._meta.db_table}__search'
+
+
+def get_search_statements(dynamic_model, table_search):
+    """
+    Return the DDL creating the search column, search index and trigram indexes of a table.
+
+    On Postgres the searchable fields are concatenated into a generated
+    ``tsvector`` column with a GIN index, so the database keeps it current on
+    every write. Adding the column rewrites the table. On SQLite an FTS5
+    table indexes the searchable fields, kept current by triggers.
+    """
+    quote_name = connection.ops.quote_name
+    table = quote_name(dynamic_model._meta.db_table)
+    columns = [quote_name(dynamic_model._meta.get_field(name).column) for name in table_search.fields]
+
+    if connection.vendor != 'postgresql':
+        search_table = get_search_table(dynamic_model)
+        fts = quote_name(search_table)
+        pk = quote_name(dynamic_model._meta.pk.column)
+        names = ', '.join(columns)
+        new_values = ', '.join(f'new.{column}' for column in columns)
+        old_values = ', '.join(f'old.{column}' for column in columns)
+        insert_new = f'INSERT INTO {fts}(rowid, {names}) VALUES (new.{pk}, {new_values});'
+        delete_old = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.{pk}, {old_values});"
+        return [
+            f"CREATE VIRTUAL TABLE {fts} USING fts5({names}, content='{dynamic_model._meta.db_table}', content_rowid='{dynamic_model._meta.pk.column}')",
+            f'CREATE TRIGGER {quote_name(search_table + "_ai")} AFTER INSERT ON {table} BEGIN {insert_new} END',
+            f'CREATE TRIGGER {quote_name(search_table + "_ad")} AFTER DELETE ON {table} BEGIN {delete_old} END',
+            f'CREATE TRIGGER {quote_name(search_table + "_au")} AFTER UPDATE ON {table} BEGIN {delete_old} {insert_new} END',
+            f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+        ]
+
+    statements = []
+    if columns:
+        document = " || ' ' || ".join(f"coalesce({column}::text, '')" for column in columns)
+        config = connection.schema_editor().quote_value(table_search.config)
+        statements += [
+            f'ALTER TABLE {table} ADD COLUMN {quote_name(SEARCH_COLUMN)} tsvector '
+            f'GENERATED ALWAYS AS (to_tsvector({config}::regconfig, {document})) STORED',
+            f'CREATE INDEX {quote_name(get_search_index_name(dynamic_model))} ON {table} USING gin ({quote_name(SEARCH_COLUMN)})',
+        ]
+    if table_search.trigram_fields:
+        statements.append('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name in table_search.trigram_fields:
+        column = quote_name(dynamic_model._meta.get_field(name).column)
+        # The expression of case-insensitive lookups, so that icontains filters can use the index
+        statements.append(
+            f'CREATE INDEX {quote_name(get_trigram_index_name(dynamic_model, name))} ON {table} '
+            f'USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+        )
+    return statements
+
+
+def get_drop_search_statements(dynamic_model, table_search):
+    quote_name = connection.ops.quote_name
+    table = quote_name(dynamic_model._meta.db_table)
+    if connection.vendor != 'postgresql':
+        search_table = get_search_table(dynamic_model)
+        return [
+            *(f'DROP TRIGGER IF EXISTS {quote_name(search_table + suffix)}' for suffix in ('_ai', '_ad', '_au')),
+            f'DROP TABLE IF EXISTS {quote_name(search_table)}',
+        ]
+
+    # The GIN index goes with the column
+    statements = [
+        f'DROP INDEX IF EXISTS {quote_name(get_trigram_index_name(dynamic_model, name))}'
+        for name in table_search.trigram_fields
+    ]
+    if table_search.fields:
+        statements.append(f'ALTER TABLE {table} DROP COLUMN IF EXISTS {quote_name(SEARCH_COLUMN)}')
+    return statements
+
+
+def get_search_index_name(dynamic_model):
+    return f'{dynamic_model._meta.db_table[:40]}_search_idx'
+
+
+def get_trigram_index_name(dynamic_model, name):
+    return f'{dynamic_model._meta.db_table[:40]}_{names_digest(name, length=8)}_trgm'
+
+
+def create_search(dynamic_model, table_search):
+    """
+    Create the search objects of a table. Must be called inside a transaction.
+    """
+    if table_search.trigram_fields and not has_trigram_extension():
+        raise ValidationError('Trigram indexes require the pg_trgm extension of PostgreSQL.')
+    with connection.cursor() as cursor:
+        for statement in get_search_statements(dynamic_model, table_search):
+            cursor.execute(statement)
+
+
+def drop_search(dynamic_model, table_search):
+    with connection.cursor() as cursor:
+        for statement in get_drop_search_statements(dynamic_model, table_search):
+            cursor.execute(statement)
+
+
+def sync_search(model_schema, dynamic_model, requested):
+    """
+    Make ``requested`` the search options of a table, a TableSearch or None.
+
+    The search objects are only dropped and created again when the options
+    change. Must be called inside a transaction.
+    """
+    # Read again rather than from the cache of model_schema, which an earlier call may have made stale
+    table_search = TableSearch.objects.filter(model_schema=model_schema).first()
+    if not is_search_changed(table_search, requested):
+        return table_search
+    if table_search is not None:
+        drop_search(dynamic_model, table_search)
+        table_search.delete()
+    if requested is not None:
+        requested.model_schema = model_schema
+        create_search(dynamic_model, requested)
+        requested.save()
+    return requested
+
+
+def has_trigram_extension():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm')")
+        return cursor.fetchone()[0]
+
+
+def search_rows(queryset, table_search, query):
+    """
+    Filter the rows of a table to the ones matching a search, annotated with their SEARCH_RANK.
+
+    On Postgres ``query`` uses the web search syntax of
+    ``websearch_to_tsquery`` (quoted phrases, ``or``, ``-`` to exclude a
+    word) and rows are ranked by ``ts_rank``. On SQLite all words of
+    ``query`` must match and rows are ranked by FTS5's ``bm25``.
+    """
+    dynamic_model = queryset.model
+    connection = connections[queryset.db]
+    quote_name = connection.ops.quote_name
+    table = quote_name(dynamic_model._meta.db_table)
+
+    if connection.vendor == 'postgresql':
+        column = f'{table}.{quote_name(SEARCH_COLUMN)}'
+        tsquery = 'websearch_to_tsquery(%s::regconfig, %s)'
+        params = [table_search.config, query]
+        match = RawSQL(f'{column} @@ {tsquery}', params, output_field=BooleanField())
+        # Ranks are returned as double precision so that pagination cursors compare them exactly
+        rank = RawSQL(f'ts_rank({column}, {tsquery})::double precision', params, output_field=FloatField())
+    else:
+        fts = quote_name(get_search_table(dynamic_model))
+        pk = f'{table}.{quote_name(dynamic_model._meta.pk.column)}'
+        # Every word is quoted, so that punctuation is not read as FTS5 query syntax
+        params = [' '.join('"{}"'.format(word.replace('"', '""')) for word in query.split())]
+        match = RawSQL(f'{pk} IN (SELECT rowid FROM {fts} WHERE {fts} MATCH %s)', params, output_field=BooleanField())
+        # bm25 scores are lower for better matches
+        rank = RawSQL(f'(SELECT -rank FROM {fts} WHERE {fts} MATCH %s AND rowid = {pk})', params, output_field=FloatField())
+    return queryset.filter(match).annotate(**{SEARCH_RANK: rank})
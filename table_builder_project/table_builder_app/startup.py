@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.urls import get_resolver
+
+from .metrics import startup_durations
+from .registry import model_registry
+
+
+def warm_up(setup_duration=None):
+    """
+    Do the work of the first requests of a server process before it serves any.
+
+    Imports the URL configuration and with it all views, which Django
+    otherwise does on the first request, and with ``WARM_MODEL_REGISTRY``
+    builds the model classes of all tables. Called by the WSGI and ASGI
+    modules. With ``gunicorn --preload`` they are imported once, before the
+    workers are forked, which then share the classes; the database
+    connection is closed afterwards so that no worker inherits it. The time
+    of each phase is reported by the metrics endpoint.
+    """
+    if setup_duration is not None:
+        startup_durations['setup'] = setup_duration
+
+    start = time.perf_counter()
+    get_resolver().url_patterns
+    startup_durations['urls'] = time.perf_counter() - start
+
+    if settings.WARM_MODEL_REGISTRY:
+        start = time.perf_counter()
+        try:
+            model_registry.warm()
+        except DatabaseError:
+            # Without the database, e.g. before the first migration, classes are built on first use
+            pass
+        else:
+            startup_durations['model_warmup'] = time.perf_counter() - start
+        finally:
+            connections.close_all()
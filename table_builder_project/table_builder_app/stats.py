@@ -0,0 +1,98 @@
+import json
+
+from django.db import connections
+
+from .filters import get_data_type
+from .schema import FIELD_TYPES_BY_DATA_TYPE
+
+# Tables with fewer rows than this are counted exactly, even when an estimate is enough
+EXACT_COUNT_LIMIT = 1000
+
+
+def get_table_stats(dynamic_model, exact=False):
+    """
+    Describe the size of a table without reading its rows.
+
+    Small tables are counted exactly. The row count of larger ones is the
+    planner estimate, which scales the row count of the last ``ANALYZE`` to
+    the current size of the table on disk, unless ``exact`` asks for a
+    ``COUNT(*)``. Null and distinct counts per column come from the
+    statistics of the last ``ANALYZE`` (``pg_stats``) and are None for
+    columns without statistics. Partitioned tables are measured over all
+    their partitions. Queries run on the database the rows are read from,
+    which may be a replica.
+    """
+    queryset = dynamic_model.objects.all()
+    connection = connections[queryset.db]
+    table = dynamic_model._meta.db_table
+
+    exact = exact or connection.vendor != 'postgresql'
+    if exact:
+        row_count = queryset.count()
+    else:
+        # Counting at most EXACT_COUNT_LIMIT rows stays cheap however large the table is
+        row_count = queryset[:EXACT_COUNT_LIMIT].count()
+        exact = row_count < EXACT_COUNT_LIMIT
+        if not exact:
+            row_count = max(estimate_row_count(connection, table), EXACT_COUNT_LIMIT)
+
+    stats = {
+        'row_count': row_count,
+        'row_count_exact': exact,
+        'size_bytes': None,
+        'analyzed_at': None,
+        'columns': [
+            {
+                'name': field.name,
+                'type': FIELD_TYPES_BY_DATA_TYPE[get_data_type(field)],
+                'null_count': None,
+                'distinct_count': None,
+            }
+            for field in dynamic_model._meta.concrete_fields
+        ],
+    }
+    if connection.vendor != 'postgresql':
+        return stats
+
+    with connection.cursor() as cursor:
+        # The partitions of a partitioned table, if any, hold all of its rows
+        cursor.execute(
+            'SELECT SUM(pg_total_relation_size(tables.relid)), SUM(pg_table_size(tables.relid)), '
+            'SUM(pg_indexes_size(tables.relid)), MAX(GREATEST(last_analyze, last_autoanalyze)) '
+            'FROM (SELECT %s::regclass AS relid UNION SELECT relid FROM pg_partition_tree(%s::regclass)) AS tables '
+            'LEFT JOIN pg_stat_user_tables ON pg_stat_user_tables.relid = tables.relid',
+            [connection.ops.quote_name(table)] * 2
+        )
+        total, table_size, indexes_size, analyzed_at = cursor.fetchone()
+        stats['size_bytes'] = {'total': int(total or 0), 'table': int(table_size or 0), 'indexes': int(indexes_size or 0)}
+        stats['analyzed_at'] = analyzed_at
+
+        # Statistics of a partitioned table cover its partitions (inherited)
+        cursor.execute(
+            'SELECT attname, null_frac, n_distinct FROM pg_stats '
+            'WHERE schemaname = current_schema() AND tablename = %s ORDER BY inherited',
+            [table]
+        )
+        column_stats = {name: (null_frac, n_distinct) for name, null_frac, n_distinct in cursor.fetchall()}
+
+    columns = {field.column: column for field, column in zip(dynamic_model._meta.concrete_fields, stats['columns'])}
+    for name, (null_frac, n_distinct) in column_stats.items():
+        column = columns.get(name)
+        if column is None:
+            continue
+        column['null_count'] = round(null_frac * row_count)
+        # A negative n_distinct is a fraction of the rows, for columns whose distinct values grow with the table
+        column['distinct_count'] = round(-n_distinct * row_count) if n_distinct < 0 else round(n_distinct)
+    return stats
+
+
+def estimate_row_count(connection, table):
+    """
+    Return the planner's estimate of the rows of a table (Postgres only).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) SELECT 1 FROM {connection.ops.quote_name(table)}')
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+from .utils import aiter_batches, iter_batches
+
+STREAM_CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def streaming_rows_response(rows, stream_format):
+    """
+    Stream the rows of a ``values()`` queryset as a JSON array or as NDJSON.
+
+    Rows are read through a server-side cursor in chunks of
+    ``ROWS_STREAM_CHUNK_SIZE`` and encoded one chunk at a time, so memory use
+    does not depend on the size of the table.
+    """
+    chunk_size = settings.ROWS_STREAM_CHUNK_SIZE
+    rows = rows.iterator(chunk_size=chunk_size)
+    if stream_format == 'ndjson':
+        content = _ndjson_chunks(rows, chunk_size)
+    else:
+        content = _json_array_chunks(rows, chunk_size)
+    return StreamingHttpResponse(content, content_type=STREAM_CONTENT_TYPES[stream_format])
+
+
+def async_streaming_rows_response(rows, stream_format):
+    """
+    Async variant of streaming_rows_response() for views served under ASGI.
+
+    The event loop is only handed to a database thread while a chunk is
+    fetched, so slow clients do not hold a worker thread.
+    """
+    chunk_size = settings.ROWS_STREAM_CHUNK_SIZE
+    chunks = aiter_batches(rows.aiterator(chunk_size=chunk_size), chunk_size)
+    if stream_format == 'ndjson':
+        content = _async_ndjson_chunks(chunks)
+    else:
+        content = _async_json_array_chunks(chunks)
+    return StreamingHttpResponse(content, content_type=STREAM_CONTENT_TYPES[stream_format])
+
+
+async def _async_json_array_chunks(chunks):
+    encode = JSONEncoder().encode
+    separator = '['
+    async for chunk in chunks:
+        yield separator + ','.join(encode(row) for row in chunk)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+async def _async_ndjson_chunks(chunks):
+    encode = JSONEncoder().encode
+    async for chunk in chunks:
+        yield ''.join(encode(row) + '\n' for row in chunk)
+
+
+def _json_array_chunks(rows, chunk_size):
+    encode = JSONEncoder().encode
+    separator = '['
+    for chunk in iter_batches(rows, chunk_size):
+        yield separator + ','.join(encode(row) for row in chunk)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+def _ndjson_chunks(rows, chunk_size):
+    encode = JSONEncoder().encode
+    for chunk in iter_batches(rows, chunk_size):
+        yield ''.join(encode(row) + '\n' for row in chunk)
@@ -1,11 +1,48 @@
+import asyncio
+import base64
+import datetime
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import User
-from rest_framework.test import APITestCase, force_authenticate
+from rest_framework.test import APIClient, APITestCase, APITransactionTestCase, force_authenticate
 from rest_framework import status
 from django.urls import reverse
 from dynamic_models.models import ModelSchema, FieldSchema
-from django.db import connection
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models import F
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
 from .views import FIELD_TYPE_MAPPING
+from .models import (
+    ColumnMigration, Job, RetentionPolicy, TableChange, TableIndex, TablePartitioning, TableSearch, TableVersion
+)
+from .benchmarks import compare_results
+from .buffering import row_write_buffer
+from .bulk import bulk_insert_rows
+from .changes import ChangeHub, change_hub
+from .exports import PYARROW_AVAILABLE
+from .jobs import JOB_HANDLERS, claim_job, recover_stale_jobs, run_in_background, run_job
+from .management.commands.run_table_worker import Command as WorkerCommand
+from .stats import EXACT_COUNT_LIMIT
+from .metrics import get_pool_samples, row_buffer_batch_rows
+from .online import run_column_migration
+from .routers import PIN_COOKIE, ReplicaSelector, get_read_alias, replica_selector
+from .registry import DynamicModelRegistry, get_model_schema, model_registry
+from .schema import SchemaUpdatePlan
 
+# Replicas only see committed data, so reads stay on the primary inside test transactions
+@override_settings(DATABASE_REPLICAS=[])
 class BaseAPITestCase(APITestCase):
     def setUp(self):
         super().setUp()
@@ -165,6 +202,102 @@ class UpdateDynamicTableAPITest(BaseAPITestCase):
         self.assertEqual(existing_fields.count(), 3)  # Three fields as before
     
 
+    def test_update_dynamic_table_single_alter_statement(self):
+        table_name = 'DynamicTable5'
+        fields = [{'name': 'field1', 'type': 'string'}, {'name': 'field2', 'type': 'integer'}, {'name': 'field3', 'type': 'boolean'},]
+        self.create_dynamic_table(table_name, fields)
+        self.model_schema = ModelSchema.objects.get(name=table_name)
+        self.model_schema.as_model().objects.create(field1='a', field2=7, field3=True)
+
+        data = {
+            'fields': [
+                {'name': 'field1', 'type': 'string'},
+                {'name': 'field2', 'type': 'string'},  # Changing the type of field2, dropping field3
+            ]
+        }
+        url = reverse('update_dynamic_table', kwargs={'id': self.model_schema.id})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        statements = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('ALTER TABLE')]
+        self.assertEqual(len(statements), 1)
+        self.assertIn('TYPE varchar(255)', statements[0])
+        self.assertIn('DROP COLUMN "field3"', statements[0])
+
+        # Existing values are converted in place
+        rows = list(self.model_schema.as_model().objects.values('field1', 'field2'))
+        self.assertEqual(rows, [{'field1': 'a', 'field2': '7'}])
+
+    def test_added_columns_keep_no_default(self):
+        self.create_dynamic_table('DefaultsTable1', [{'name': 'field1', 'type': 'integer'}])
+        self.model_schema = ModelSchema.objects.get(name='DefaultsTable1')
+        dynamic_model = model_registry.get_model(get_model_schema(self.model_schema.id))
+        dynamic_model.objects.create(field1=1)
+        fields = [{'name': 'field1', 'type': 'integer'}, {'name': 'field2', 'type': 'string'}]
+        plan = SchemaUpdatePlan(self.model_schema, dynamic_model, fields, allow_deletion=True)
+        plan.added[0][1].default = 'none'
+
+        # A default fills the existing rows, but the column ends up like one added by Django's schema editor
+        statements = plan.get_statements()
+        self.assertEqual(len(statements), 2)
+        self.assertIn('DEFAULT', statements[0])
+        self.assertIn('ALTER COLUMN "field2" DROP DEFAULT', statements[1])
+        plan.apply()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT field2 FROM {dynamic_model._meta.db_table}')
+            self.assertEqual(cursor.fetchall(), [('none',)])
+            cursor.execute(
+                'SELECT column_default FROM information_schema.columns WHERE table_name = %s AND column_name = %s',
+                [dynamic_model._meta.db_table, 'field2']
+            )
+            self.assertIsNone(cursor.fetchone()[0])
+
+    def test_update_dynamic_table_dry_run(self):
+        table_name = 'DynamicTable6'
+        fields = [{'name': 'field1', 'type': 'string'}, {'name': 'field2', 'type': 'integer'}]
+        self.create_dynamic_table(table_name, fields)
+        self.model_schema = ModelSchema.objects.get(name=table_name)
+
+        data = {'fields': [{'name': 'field1', 'type': 'string'}, {'name': 'field3', 'type': 'integer'}]}
+        url = reverse('update_dynamic_table', kwargs={'id': self.model_schema.id})
+        response = self.client.put(f'{url}?dry_run=1', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['changes'], {
+            'added': [{'name': 'field3', 'type': 'integer'}],
+            'altered': [],
+            'dropped': ['field2'],
+        })
+        self.assertEqual(len(response.data['statements']), 1)
+        self.assertFalse(response.data['rewrites_table'])
+
+        data['fields'][0]['type'] = 'integer'
+        response = self.client.put(f'{url}?dry_run=1', data, format='json')
+        self.assertTrue(response.data['rewrites_table'])
+
+        # Nothing was applied
+        self.assertEqual(
+            sorted(FieldSchema.objects.filter(model_schema=self.model_schema).values_list('name', 'data_type')),
+            [('field1', 'character'), ('field2', 'integer')]
+        )
+
+    def test_update_dynamic_table_rejects_whole_request_on_invalid_field(self):
+        table_name = 'DynamicTable7'
+        fields = [{'name': 'field1', 'type': 'string'}]
+        self.create_dynamic_table(table_name, fields)
+        self.model_schema = ModelSchema.objects.get(name=table_name)
+
+        url = reverse('update_dynamic_table', kwargs={'id': self.model_schema.id})
+        for invalid in ({'name': 'field1'}, {'name': 'field3', 'type': 'float'}):
+            data = {'fields': [{'name': 'field2', 'type': 'integer'}, invalid]}
+            response = self.client.put(url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        data = {'fields': [{'name': 'field1', 'type': 'string'}, {'name': 'field1', 'type': 'integer'}]}
+        response = self.client.put(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(FieldSchema.objects.filter(model_schema=self.model_schema).values_list('name', flat=True)), ['field1'])
+
 class AddRowToDynamicTableAPITest(BaseAPITestCase):
     def test_add_row_to_dynamic_table_success(self):
         table_name = "MyDynamicTable1"
@@ -216,6 +349,38 @@ class AddRowToDynamicTableAPITest(BaseAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('error', response.data)
 
+    def test_add_row_is_validated_before_any_write(self):
+        fields = [
+            {'name': 'field1', 'type': 'string'},
+            {'name': 'field2', 'type': 'integer'},
+            {'name': 'field3', 'type': 'boolean'},
+        ]
+        self.create_dynamic_table('MyDynamicTable4', fields)
+        self.model_schema = ModelSchema.objects.get(name='MyDynamicTable4')
+        url = reverse('add_row_to_dynamic_table', kwargs={'id': self.model_schema.id})
+        max_length = self.model_schema.as_model()._meta.get_field('field1').max_length
+        data = {'fields': {'field1': 'x' * (max_length + 1), 'field2': 'forty-two', 'field9': 1}}
+
+        self.client.post(url, data, format='json')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data['errors']), {'field1', 'field2', 'field3', 'field9'})
+        self.assertEqual(response.data['errors']['field3'], ['This field is required.'])
+        self.assertFalse(any('INSERT' in query['sql'] for query in queries))
+
+        # Values are coerced to the column types
+        data = {'fields': {'field1': 'short', 'field2': '42', 'field3': 'true'}}
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.model_schema.as_model().objects.get().field2, 42)
+
+        # Empty strings are stored, as before rows were validated
+        data = {'fields': {'field1': '', 'field2': 1, 'field3': False}}
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertTrue(self.model_schema.as_model().objects.filter(field1='').exists())
+
     def test_add_row_to_dynamic_table_nonexistent_table(self):
         table_name = "MyDynamicTable3"
         fields = [
@@ -241,6 +406,153 @@ class AddRowToDynamicTableAPITest(BaseAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertIn('error', response.data)
 
+class BulkAddRowsToDynamicTableAPITest(BaseAPITestCase):
+    def create_bulk_table(self, table_name):
+        fields = [
+            {'name': 'field1', 'type': 'string'},
+            {'name': 'field2', 'type': 'integer'},
+            {'name': 'field3', 'type': 'boolean'},
+        ]
+        self.create_dynamic_table(table_name, fields)
+        self.model_schema = ModelSchema.objects.get(name=table_name)
+        self.url = reverse('bulk_add_rows_to_dynamic_table', kwargs={'id': self.model_schema.id})
+
+    def test_bulk_add_rows_json_array_success(self):
+        self.create_bulk_table('BulkTable1')
+        rows = [{'field1': f'value{i}', 'field2': i, 'field3': i % 2 == 0} for i in range(5)]
+
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['inserted'], 5)
+        self.assertEqual(response.data['errors'], [])
+        self.assertEqual(self.model_schema.as_model().objects.count(), 5)
+
+    def test_bulk_add_rows_bump_the_change_token_with_the_rows(self):
+        self.create_bulk_table('BulkTable6')
+        rows = [{'field1': 'a', 'field2': 1, 'field3': True}]
+
+        # Rows are only committed together with the new change token of the table
+        with mock.patch.object(TableVersion, 'bump_data_version', side_effect=DatabaseError('unavailable')):
+            self.client.post(self.url, rows, format='json')
+        self.assertEqual(self.model_schema.as_model().objects.count(), 0)
+
+        version = TableVersion.objects.get(model_schema=self.model_schema).data_version
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(TableVersion.objects.get(model_schema=self.model_schema).data_version, version + 1)
+
+    def test_bulk_add_rows_reports_invalid_rows_by_index(self):
+        self.create_bulk_table('BulkTable2')
+        rows = [
+            {'field1': 'ok', 'field2': 1, 'field3': True},
+            {'field1': 'bad', 'field2': 'not a number', 'field3': True},
+            {'field1': 'unknown', 'field2': 2, 'field3': False, 'field9': 1},
+            'not an object',
+            {'field1': 'also ok', 'field2': 3, 'field3': False},
+        ]
+
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['inserted'], 2)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2, 3])
+        self.assertIn('field2', response.data['errors'][0]['errors'])
+        self.assertEqual(self.model_schema.as_model().objects.count(), 2)
+
+    def test_bulk_add_rows_ndjson_stream(self):
+        self.create_bulk_table('BulkTable3')
+        body = (
+            b'{"field1": "a", "field2": 1, "field3": true}\n'
+            b'{"field1": "b", "field2": 2,\n'
+            b'\n'
+            b'{"field1": "c", "field2": 3, "field3": false}\n'
+        )
+
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['inserted'], 2)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+
+    @override_settings(BULK_INSERT_BATCH_SIZE=2, BULK_INSERT_COPY_THRESHOLD=1)
+    def test_bulk_add_rows_with_copy(self):
+        self.create_bulk_table('BulkTable4')
+        rows = [
+            {'field1': 'with "quotes", and commas', 'field2': 1, 'field3': True},
+            {'field1': 'NULL', 'field2': 2, 'field3': False},
+            {'field1': 'plain', 'field2': 3, 'field3': True},
+        ]
+
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        stored = list(self.model_schema.as_model().objects.order_by('field2').values('field1', 'field2', 'field3'))
+        self.assertEqual(stored, rows)
+        # COPY takes the ids from the sequence up front, so the change log lists them
+        logged = TableChange.objects.filter(model_schema=self.model_schema, kind=TableChange.INSERT)
+        self.assertEqual(
+            {pk for change in logged for pk in change.pks},
+            set(self.model_schema.as_model().objects.values_list('id', flat=True))
+        )
+
+    def test_bulk_add_rows_empty_payload(self):
+        self.create_bulk_table('BulkTable5')
+
+        response = self.client.post(self.url, [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('error', response.data)
+
+class UpsertRowsAPITest(BaseAPITestCase):
+    def create_upsert_table(self, table_name):
+        fields = [{'name': 'code', 'type': 'string'}, {'name': 'amount', 'type': 'integer'}]
+        data = {'table_name': table_name, 'fields': fields, 'indexes': [{'fields': ['code'], 'unique': True}]}
+        self.client.post('/api/table/', data, format='json')
+        self.model_schema = ModelSchema.objects.get(name=table_name)
+        self.url = reverse('get_all_rows_in_dynamic_table', kwargs={'id': self.model_schema.id})
+        self.client.post(
+            reverse('bulk_add_rows_to_dynamic_table', kwargs={'id': self.model_schema.id}),
+            [{'code': 'a', 'amount': 1}, {'code': 'b', 'amount': 2}], format='json'
+        )
+
+    def get_amounts(self):
+        return dict(self.model_schema.as_model().objects.values_list('code', 'amount'))
+
+    def test_upsert_by_unique_field(self):
+        self.create_upsert_table('UpsertTable1')
+        rows = [{'code': 'b', 'amount': 20}, {'code': 'c', 'amount': 3}, {'code': 'a', 'amount': 'x'}, {'code': 'q'}]
+
+        response = self.client.patch(self.url, {'key': 'code', 'rows': rows}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual((response.data['inserted'], response.data['updated']), (1, 1))
+        self.assertEqual([error['index'] for error in response.data['errors']], [2, 3])
+        self.assertEqual(self.get_amounts(), {'a': 1, 'b': 20, 'c': 3})
+
+    def test_partial_update_by_id(self):
+        self.create_upsert_table('UpsertTable2')
+        first = self.model_schema.as_model().objects.get(code='a')
+        rows = [{'id': first.id, 'amount': 10}, {'id': first.id + 100, 'code': 'z', 'amount': 5}]
+
+        response = self.client.patch(self.url, {'rows': rows}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['inserted'], response.data['updated']), (1, 1))
+        self.assertEqual(self.get_amounts(), {'a': 10, 'b': 2, 'z': 5})
+
+        # New rows get ids past the ones inserted explicitly
+        response = self.client.post(
+            reverse('add_row_to_dynamic_table', kwargs={'id': self.model_schema.id}),
+            {'fields': {'code': 'd', 'amount': 4}}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertGreater(self.model_schema.as_model().objects.get(code='d').id, first.id + 100)
+
+    def test_upsert_bumps_the_change_token_with_the_rows(self):
+        self.create_upsert_table('UpsertTable4')
+        with mock.patch.object(TableVersion, 'bump_data_version', side_effect=DatabaseError('unavailable')):
+            self.client.patch(self.url, {'key': 'code', 'rows': [{'code': 'a', 'amount': 10}]}, format='json')
+        self.assertEqual(self.get_amounts(), {'a': 1, 'b': 2})
+
+    def test_key_must_be_unique(self):
+        self.create_upsert_table('UpsertTable3')
+        response = self.client.patch(self.url, {'key': 'amount', 'rows': [{'amount': 1}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 class GetAllRowsInDynamicTableAPITest(BaseAPITestCase):
 
     def test_get_all_rows_in_dynamic_table_success(self):
@@ -293,3 +605,1519 @@ class GetAllRowsInDynamicTableAPITest(BaseAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertIn('error', response.data)
 
+
+    def create_rows_table(self, table_name, row_count):
+        fields = [
+            {'name': 'field1', 'type': 'string'},
+            {'name': 'field2', 'type': 'integer'},
+            {'name': 'field3', 'type': 'boolean'},
+        ]
+        self.create_dynamic_table(table_name, fields)
+        self.model_schema = ModelSchema.objects.get(name=table_name)
+        dynamic_model = self.model_schema.as_model()
+        dynamic_model.objects.bulk_create(
+            [dynamic_model(field1=f'value{i}', field2=i, field3=i % 2 == 0) for i in range(row_count)]
+        )
+        return reverse('get_all_rows_in_dynamic_table', kwargs={'id': self.model_schema.id})
+
+    def test_get_rows_keyset_pagination(self):
+        url = self.create_rows_table('DynamicTable13', 5)
+
+        response = self.client.get(url, {'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['field2'] for row in response.data], [0, 1])
+        self.assertIn('rel="next"', response['Link'])
+
+        response = self.client.get(url, {'after': response.data[-1]['id'], 'limit': 2})
+        self.assertEqual([row['field2'] for row in response.data], [2, 3])
+
+        response = self.client.get(url, {'after': response.data[-1]['id'], 'limit': 2})
+        self.assertEqual([row['field2'] for row in response.data], [4])
+        self.assertFalse(response.has_header('Link'))
+
+    def test_get_rows_invalid_pagination_params(self):
+        url = self.create_rows_table('DynamicTable14', 1)
+
+        for params in ({'limit': 'abc'}, {'limit': 0}, {'after': -1}, {'stream': 'xml'}):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('error', response.data)
+
+    @override_settings(ROWS_STREAM_CHUNK_SIZE=2)
+    def test_get_rows_streaming(self):
+        url = self.create_rows_table('DynamicTable15', 5)
+
+        response = self.client.get(url, {'stream': 'json'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([row['field2'] for row in rows], [0, 1, 2, 3, 4])
+
+        response = self.client.get(url, {'stream': 'ndjson', 'after': rows[2]['id']})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['field1'] for line in lines], ['value3', 'value4'])
+
+    def test_get_rows_streaming_empty_table(self):
+        url = self.create_rows_table('DynamicTable16', 0)
+
+        response = self.client.get(url, {'stream': 'json'})
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [])
+
+    def test_get_rows_with_filters(self):
+        url = self.create_rows_table('DynamicTable17', 6)
+
+        cases = [
+            ({'field2__gte': 2, 'field2__lt': 4}, [2, 3]),
+            ({'field1__in': 'value0,value4,missing'}, [0, 4]),
+            ({'field1__startswith': 'value5'}, [5]),
+            ({'field3': 'false', 'field2__gt': 1}, [3, 5]),
+            ({'field1': 'value1'}, [1]),
+        ]
+        for params, expected in cases:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual([row['field2'] for row in response.data], expected)
+
+    def test_get_rows_invalid_filters(self):
+        url = self.create_rows_table('DynamicTable18', 1)
+
+        for params in (
+            {'unknown': 1},
+            {'field2': 'abc'},
+            {'field3': 'maybe'},
+            {'field3__gt': 'true'},
+            {'field2__startswith': 1},
+            {'fields': 'field1,unknown'},
+            {'ordering': '-unknown'},
+        ):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('error', response.data)
+
+    def test_get_rows_with_projection(self):
+        url = self.create_rows_table('DynamicTable19', 2)
+
+        response = self.client.get(url, {'fields': 'field1'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([set(row) for row in response.data], [{'id', 'field1'}, {'id', 'field1'}])
+
+    def test_get_rows_ordering_with_cursor_pagination(self):
+        url = self.create_rows_table('DynamicTable20', 5)
+
+        params = {'ordering': '-field3,-field2', 'fields': 'field1', 'limit': 2}
+        response = self.client.get(url, params)
+        self.assertEqual([row['field1'] for row in response.data], ['value4', 'value2'])
+        self.assertEqual(set(response.data[0]), {'id', 'field1'})
+
+        seen = [row['field1'] for row in response.data]
+        while response.has_header('Link'):
+            next_url = response['Link'].split(';')[0].strip('<>')
+            self.assertIn('cursor=', next_url)
+            response = self.client.get(next_url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += [row['field1'] for row in response.data]
+        self.assertEqual(seen, ['value4', 'value2', 'value0', 'value3', 'value1'])
+
+        response = self.client.get(url, {'ordering': 'field2', 'after': 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(ROWS_EXPORT_BATCH_SIZE=2)
+    def test_get_rows_as_csv(self):
+        url = self.create_rows_table('DynamicTable21', 5)
+        expected = 'id,field1,field2,field3\n' + ''.join(
+            f'{row["id"]},value{row["field2"]},{row["field2"]},{"t" if row["field3"] else "f"}\n'
+            for row in self.client.get(url).data
+        )
+
+        # Primary key order is exported with COPY, any other ordering through the csv module
+        for params in ({'format': 'csv'}, {'format': 'csv', 'ordering': 'field2'}):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response['Content-Type'], 'text/csv')
+            self.assertEqual(b''.join(response.streaming_content).decode(), expected)
+
+        response = self.client.get(url, {'field2__gte': 3, 'fields': 'field3'}, HTTP_ACCEPT='text/csv')
+        self.assertEqual(b''.join(response.streaming_content).decode().splitlines()[1:], ['4,f', '5,t'])
+
+    def test_get_rows_export_errors_are_json(self):
+        url = self.create_rows_table('DynamicTable22', 1)
+
+        response = self.client.get(url, {'format': 'csv', 'unknown': 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('error', json.loads(response.content))
+
+    @skipUnless(PYARROW_AVAILABLE, 'pyarrow is not installed')
+    @override_settings(ROWS_EXPORT_BATCH_SIZE=2)
+    def test_get_rows_as_arrow_and_parquet(self):
+        import pyarrow.parquet
+        url = self.create_rows_table('DynamicTable23', 5)
+
+        response = self.client.get(url, {'format': 'arrow', 'field2__gt': 0})
+        self.assertEqual(response['Content-Type'], 'application/vnd.apache.arrow.stream')
+        table = pyarrow.ipc.open_stream(b''.join(response.streaming_content)).read_all()
+        self.assertEqual(str(table.schema.field('field2').type), 'int32')
+        self.assertEqual(str(table.schema.field('field3').type), 'bool')
+        self.assertEqual(table.column('field2').to_pylist(), [1, 2, 3, 4])
+
+        response = self.client.get(url, {'format': 'parquet', 'limit': 3}, HTTP_ACCEPT='application/vnd.apache.parquet')
+        table = pyarrow.parquet.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.column('field1').to_pylist(), ['value0', 'value1', 'value2'])
+        self.assertEqual(table.column('field3').to_pylist(), [True, False, True])
+
+class TableIndexAPITest(BaseAPITestCase):
+    fields = [
+        {'name': 'field1', 'type': 'string'},
+        {'name': 'field2', 'type': 'integer'},
+        {'name': 'field3', 'type': 'boolean'},
+    ]
+
+    def create_indexed_table(self, table_name, indexes):
+        response = self.client.post(
+            '/api/table/', {'table_name': table_name, 'fields': self.fields, 'indexes': indexes}, format='json'
+        )
+        self.model_schema = ModelSchema.objects.filter(name=table_name).first()
+        return response
+
+    def get_db_indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s', [self.model_schema.db_table])
+            return {name: definition for name, definition in cursor.fetchall() if not name.endswith('_pkey')}
+
+    def test_create_table_with_indexes(self):
+        indexes = [
+            {'fields': ['field1']},
+            {'fields': ['field1', 'field2'], 'unique': True},
+            {'fields': ['field2'], 'condition': {'field3': True}},
+        ]
+        response = self.create_indexed_table('IndexedTable1', indexes)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        db_indexes = self.get_db_indexes()
+        self.assertEqual(set(db_indexes), set(self.model_schema.table_indexes.values_list('name', flat=True)))
+        definitions = sorted(db_indexes.values())
+        self.assertEqual(len(definitions), 3)
+        self.assertEqual(sum('CREATE UNIQUE INDEX' in definition for definition in definitions), 1)
+        self.assertEqual(sum('WHERE field3' in definition for definition in definitions), 1)
+
+    def test_unique_index_is_enforced(self):
+        self.create_indexed_table('IndexedTable2', [{'fields': ['field2'], 'unique': True}])
+        url = reverse('bulk_add_rows_to_dynamic_table', kwargs={'id': self.model_schema.id})
+        rows = [{'field1': 'a', 'field2': 1, 'field3': True}, {'field1': 'b', 'field2': 1, 'field3': True}]
+
+        response = self.client.post(url, rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+
+    def test_update_replaces_declared_indexes(self):
+        self.create_indexed_table('IndexedTable3', [{'fields': ['field1']}, {'fields': ['field2']}])
+        old_names = set(self.get_db_indexes())
+
+        url = reverse('update_dynamic_table', kwargs={'id': self.model_schema.id})
+        data = {'fields': self.fields, 'indexes': [{'fields': ['field2']}, {'fields': ['field3', 'field1']}]}
+        response = self.client.put(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        new_names = set(self.get_db_indexes())
+        self.assertEqual(len(new_names), 2)
+        self.assertEqual(len(old_names & new_names), 1)
+        self.assertEqual(new_names, set(self.model_schema.table_indexes.values_list('name', flat=True)))
+
+    def test_removing_field_drops_its_indexes(self):
+        self.create_indexed_table('IndexedTable4', [{'fields': ['field1', 'field2']}, {'fields': ['field1']}])
+
+        url = reverse('update_dynamic_table', kwargs={'id': self.model_schema.id})
+        response = self.client.put(url, {'fields': self.fields[:1] + self.fields[2:]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        remaining = TableIndex.objects.filter(model_schema=self.model_schema)
+        self.assertEqual([table_index.fields for table_index in remaining], [['field1']])
+        self.assertEqual(set(self.get_db_indexes()), {remaining[0].name})
+
+    def test_failed_index_build_removes_its_record(self):
+        self.create_indexed_table('IndexedTable5', [])
+        rows = [{'field1': 'a', 'field2': 1, 'field3': True}, {'field1': 'a', 'field2': 2, 'field3': True}]
+        self.client.post(reverse('bulk_add_rows_to_dynamic_table', kwargs={'id': self.model_schema.id}), rows, format='json')
+
+        # Inside a transaction, as on partitioned tables and SQLite, the index is not built concurrently
+        url = reverse('update_dynamic_table', kwargs={'id': self.model_schema.id})
+        data = {'fields': self.fields, 'indexes': [{'fields': ['field1'], 'unique': True}]}
+        response = self.client.put(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('could not be created', response.data['error'])
+        self.assertFalse(self.model_schema.table_indexes.exists())
+        self.assertEqual(self.get_db_indexes(), {})
+
+        # Without the record, the field is not taken for a unique upsert key
+        response = self.client.patch(
+            reverse('get_all_rows_in_dynamic_table', kwargs={'id': self.model_schema.id}),
+            {'key': 'field1', 'rows': [{'field1': 'a', 'field2': 3, 'field3': False}]}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_index_declarations(self):
+        for index, indexes in enumerate((
+            [{'fields': []}],
+            [{'fields': ['unknown']}],
+            [{'fields': ['field1'], 'condition': {'field2__startswith': 'a'}}],
+            'field1',
+        )):
+            response = self.create_indexed_table(f'InvalidIndexTable{index}', indexes)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('error', response.data)
+            self.assertIsNone(self.model_schema)
+
+class ConditionalRowsAPITest(BaseAPITestCase):
+    def create_polled_table(self, table_name):
+        self.create_dynamic_table(table_name, [{'name': 'field1', 'type': 'string'}])
+        self.model_schema = ModelSchema.objects.get(name=table_name)
+        self.add_row('a')
+        return reverse('get_all_rows_in_dynamic_table', kwargs={'id': self.model_schema.id})
+
+    def add_row(self, value):
+        url = reverse('add_row_to_dynamic_table', kwargs={'id': self.model_schema.id})
+        self.client.post(url, {'fields': {'field1': value}}, format='json')
+
+    def test_unchanged_table_is_not_modified(self):
+        url = self.create_polled_table('PolledTable1')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(len(queries), 1)
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # The CSV export of the same rows is a different representation
+        response = self.client.get(url, {'format': 'csv'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_writes_change_the_etag(self):
+        url = self.create_polled_table('PolledTable2')
+        etag = self.client.get(url)['ETag']
+
+        self.add_row('b')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        self.client.post(
+            reverse('bulk_add_rows_to_dynamic_table', kwargs={'id': self.model_schema.id}), [{'field1': 'c'}], format='json'
+        )
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
+
+        etag = self.client.get(url)['ETag']
+        update_url = reverse('update_dynamic_table', kwargs={'id': self.model_schema.id})
+        data = {'fields': [{'name': 'field1', 'type': 'string'}], 'indexes': [{'fields': ['field1']}]}
+        self.assertEqual(self.client.put(update_url, data, format='json').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    @override_settings(ROWS_CACHE_ALIAS='rows')
+    def test_page_cache(self):
+        caches['rows'].clear()
+        url = self.create_polled_table('PolledTable3')
+
+        response = self.client.get(url, {'limit': 1, 'field1__startswith': 'a'})
+        self.assertEqual([row['field1'] for row in json.loads(response.content)], ['a'])
+
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(url, {'field1__startswith': 'a', 'limit': 1})
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['ETag'], response['ETag'])
+        self.assertEqual(len(queries), 1)
+
+        self.add_row('ab')
+        response = self.client.get(url, {'limit': 5, 'field1__startswith': 'a'})
+        self.assertEqual([row['field1'] for row in json.loads(response.content)], ['a', 'ab'])
+
+class AggregateDynamicTableAPITest(BaseAPITestCase):
+    def create_aggregate_table(self, table_name):
+        fields = [
+            {'name': 'field1', 'type': 'string'},
+            {'name': 'field2', 'type': 'integer'},
+            {'name': 'field3', 'type': 'boolean'},
+        ]
+        self.create_dynamic_table(table_name, fields)
+        model_schema = ModelSchema.objects.get(name=table_name)
+        dynamic_model = model_schema.as_model()
+        dynamic_model.objects.bulk_create([
+            dynamic_model(field1='a', field2=1, field3=True),
+            dynamic_model(field1='a', field2=3, field3=False),
+            dynamic_model(field1='b', field2=5, field3=True),
+            dynamic_model(field1='b', field2=5, field3=True),
+        ])
+        return reverse('aggregate_dynamic_table', kwargs={'id': model_schema.id})
+
+    def test_aggregate_whole_table(self):
+        url = self.create_aggregate_table('AggregateTable1')
+
+        response = self.client.get(url, {'aggregates': 'count,sum:field2,avg:field2,min:field2,max:field3,count_distinct:field2'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'count': 4, 'sum_field2': 14, 'avg_field2': 3.5, 'min_field2': 1, 'max_field3': True, 'count_distinct_field2': 3,
+        })
+
+    def test_aggregate_by_group_with_filters(self):
+        url = self.create_aggregate_table('AggregateTable2')
+
+        response = self.client.get(url, {'aggregates': 'count,sum:field3', 'group_by': 'field1', 'field2__gt': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [
+            {'field1': 'a', 'count': 1, 'sum_field3': 0},
+            {'field1': 'b', 'count': 2, 'sum_field3': 2},
+        ])
+
+    def test_aggregate_runs_one_query(self):
+        url = self.create_aggregate_table('AggregateTable3')
+        self.client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'aggregates': 'sum:field2', 'group_by': 'field1,field3'})
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(sum('GROUP BY' in query['sql'] for query in queries.captured_queries), 1)
+
+    def test_invalid_aggregates(self):
+        url = self.create_aggregate_table('AggregateTable4')
+
+        for params in (
+            {'aggregates': 'median:field2'},
+            {'aggregates': 'sum:field1'},
+            {'aggregates': 'sum'},
+            {'aggregates': 'count', 'group_by': 'unknown'},
+            {'field2__startswith': '1'},
+        ):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('error', response.data)
+
+class OnlineColumnMigrationAPITest(BaseAPITestCase):
+    fields = [
+        {'name': 'field1', 'type': 'string'},
+        {'name': 'field2', 'type': 'boolean'},
+    ]
+
+    def create_migrated_table(self, table_name, values, indexes=None):
+        data = {'table_name': table_name, 'fields': self.fields}
+        if indexes:
+            data['indexes'] = indexes
+        self.client.post('/api/table/', data, format='json')
+        self.model_schema = ModelSchema.objects.get(name=table_name)
+        rows = [{'field1': value, 'field2': True} for value in values]
+        self.client.post(reverse('bulk_add_rows_to_dynamic_table', kwargs={'id': self.model_schema.id}), rows, format='json')
+
+        url = reverse('update_dynamic_table', kwargs={'id': self.model_schema.id})
+        fields = [{'name': 'field1', 'type': 'integer'}, self.fields[1]]
+        return self.client.put(f'{url}?online=1', {'fields': fields}, format='json')
+
+    def get_columns(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT column_name, data_type FROM information_schema.columns WHERE table_name = %s',
+                [self.model_schema.db_table]
+            )
+            return dict(cursor.fetchall())
+
+    @override_settings(ONLINE_MIGRATION_BATCH_SIZE=2, ONLINE_MIGRATION_BATCH_SLEEP=0)
+    def test_online_type_change(self):
+        response = self.create_migrated_table('OnlineTable1', ['1', '2', '3'])
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['migration']['state'], ColumnMigration.PENDING)
+        self.assertEqual(self.get_columns()['field1__new'], 'integer')
+        self.assertEqual(self.model_schema.fields.get(name='field1').data_type, 'character')
+
+        # Rows added during the backfill are written to the shadow column as well
+        url = reverse('add_row_to_dynamic_table', kwargs={'id': self.model_schema.id})
+        self.client.post(url, {'fields': {'field1': '4', 'field2': False}}, format='json')
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT field1__new FROM {self.model_schema.db_table} ORDER BY id')
+            self.assertEqual([row[0] for row in cursor.fetchall()], [None, None, None, 4])
+
+        migration = run_column_migration(response.data['migration']['id'])
+        self.assertEqual(migration.state, ColumnMigration.COMPLETED)
+        self.assertEqual(migration.rows_done, 3)
+        self.assertEqual(self.get_columns(), {'id': 'bigint', 'field1': 'integer', 'field2': 'boolean'})
+        self.assertEqual(self.model_schema.fields.get(name='field1').data_type, 'integer')
+
+        response = self.client.get(reverse('get_all_rows_in_dynamic_table', kwargs={'id': self.model_schema.id}))
+        self.assertEqual([row['field1'] for row in response.data], [1, 2, 3, 4])
+
+        url = reverse('get_column_migration', kwargs={'id': self.model_schema.id, 'migration_id': migration.id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['progress'], 1.0)
+        self.assertEqual(response.data['columns'], [{'name': 'field1', 'type': 'integer'}])
+
+    def test_failed_online_type_change_keeps_old_column(self):
+        response = self.create_migrated_table('OnlineTable2', ['1', 'two'])
+        migration = run_column_migration(response.data['migration']['id'])
+
+        self.assertEqual(migration.state, ColumnMigration.FAILED)
+        self.assertIn('two', migration.error)
+        self.assertEqual(self.get_columns()['field1'], 'character varying')
+        self.assertNotIn('field1__new', self.get_columns())
+        self.assertEqual(self.model_schema.fields.get(name='field1').data_type, 'character')
+
+    def test_update_rejected_while_migration_is_running(self):
+        self.create_migrated_table('OnlineTable3', ['1'])
+        url = reverse('update_dynamic_table', kwargs={'id': self.model_schema.id})
+        response = self.client.put(url, {'fields': self.fields}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_indexes_are_rebuilt_after_swap(self):
+        response = self.create_migrated_table('OnlineTable4', ['1', '2'], indexes=[{'fields': ['field1'], 'unique': True}])
+        run_column_migration(response.data['migration']['id'])
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT indexdef FROM pg_indexes WHERE tablename = %s', [self.model_schema.db_table])
+            definitions = [row[0] for row in cursor.fetchall()]
+        self.assertEqual(sum('UNIQUE INDEX' in definition and '(field1)' in definition for definition in definitions), 1)
+
+    @override_settings(ONLINE_MIGRATION_BATCH_SIZE=2)
+    def test_only_the_swap_runs_under_the_table_lock(self):
+        response = self.create_migrated_table('OnlineTable5', ['1', '2'])
+
+        # Rows written without dual writes are caught up in batches before the swap
+        with connection.cursor() as cursor:
+            for value in ['3', '4', '5', '6', '7']:
+                cursor.execute(f"INSERT INTO {self.model_schema.db_table} (field1, field2) VALUES (%s, true)", [value])
+        with CaptureQueriesContext(connection) as queries:
+            migration = run_column_migration(response.data['migration']['id'])
+        self.assertEqual(migration.state, ColumnMigration.COMPLETED)
+
+        statements = [query['sql'] for query in queries.captured_queries]
+        lock = next(index for index, sql in enumerate(statements) if sql.startswith('LOCK TABLE'))
+        self.assertTrue(any('VALIDATE CONSTRAINT' in sql for sql in statements[:lock]))
+        self.assertFalse(any(sql.startswith('UPDATE') and self.model_schema.db_table in sql for sql in statements[lock:]))
+
+        response = self.client.get(reverse('get_all_rows_in_dynamic_table', kwargs={'id': self.model_schema.id}))
+        self.assertEqual([row['field1'] for row in response.data], [1, 2, 3, 4, 5, 6, 7])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM pg_trigger WHERE tgrelid = %s::regclass', [self.model_schema.db_table])
+            self.assertEqual(cursor.fetchone()[0], 0)
+            cursor.execute('SELECT count(*) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = %s', [self.model_schema.db_table, 'c'])
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_failed_catch_up_removes_the_trigger(self):
+        response = self.create_migrated_table('OnlineTable6', ['1'])
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.model_schema.db_table} (field1, field2) VALUES ('x', true)")
+        migration = run_column_migration(response.data['migration']['id'])
+        self.assertEqual(migration.state, ColumnMigration.FAILED)
+
+        url = reverse('add_row_to_dynamic_table', kwargs={'id': self.model_schema.id})
+        response = self.client.post(url, {'fields': {'field1': 'y', 'field2': True}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+class JobQueueAPITest(BaseAPITestCase):
+    def test_async_bulk_insert(self):
+        self.create_dynamic_table('JobTable1', [{'name': 'field1', 'type': 'integer'}])
+        model_schema = ModelSchema.objects.get(name='JobTable1')
+        url = reverse('bulk_add_rows_to_dynamic_table', kwargs={'id': model_schema.id})
+        rows = [{'field1': 1}, {'field1': 'not a number'}, {'field1': 3}]
+
+        response = self.client.post(f'{url}?async=1', rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['job']['state'], Job.QUEUED)
+        self.assertEqual(model_schema.as_model().objects.count(), 0)
+
+        job = run_job(claim_job(worker='test'))
+        self.assertEqual(job.state, Job.COMPLETED)
+        self.assertEqual(job.result['inserted'], 2)
+        self.assertEqual([error['index'] for error in job.result['errors']], [1])
+        self.assertEqual(model_schema.as_model().objects.count(), 2)
+
+        response = self.client.get(response.data['status_url'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['rows_done'], 3)
+        self.assertEqual(response.data['progress'], 1.0)
+        self.assertEqual(Job.objects.get(id=job.id).payload, {})
+        self.assertIsNone(claim_job())
+
+    def test_async_schema_update(self):
+        self.create_dynamic_table('JobTable2', [{'name': 'field1', 'type': 'string'}])
+        model_schema = ModelSchema.objects.get(name='JobTable2')
+        url = reverse('update_dynamic_table', kwargs={'id': model_schema.id})
+        fields = [{'name': 'field1', 'type': 'string'}, {'name': 'field2', 'type': 'integer'}]
+
+        response = self.client.put(f'{url}?async=true', {'fields': fields}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(model_schema.fields.filter(name='field2').exists())
+
+        job = run_job(claim_job())
+        self.assertEqual(job.state, Job.COMPLETED)
+        self.assertEqual(job.result['changes']['added'], [{'name': 'field2', 'type': 'integer'}])
+        self.assertTrue(model_schema.fields.filter(name='field2').exists())
+
+        # Invalid definitions are still rejected before anything is queued
+        response = self.client.put(f'{url}?async=true', {'fields': [{'name': 'field3', 'type': 'blob'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Job.objects.filter(state=Job.QUEUED).exists())
+
+    def test_stale_jobs_are_recovered(self):
+        stale = timezone.now() - datetime.timedelta(seconds=settings.JOB_STALE_AFTER + 1)
+        resumable = Job.objects.create(kind=Job.SCHEMA_UPDATE, state=Job.RUNNING, heartbeat_at=stale)
+        other = Job.objects.create(kind=Job.BULK_INSERT, state=Job.RUNNING, heartbeat_at=stale)
+        running = Job.objects.create(kind=Job.BULK_INSERT, state=Job.RUNNING, heartbeat_at=timezone.now())
+
+        self.assertEqual(recover_stale_jobs(), 2)
+        self.assertEqual(Job.objects.get(id=resumable.id).state, Job.QUEUED)
+        self.assertEqual(Job.objects.get(id=other.id).state, Job.FAILED)
+        self.assertEqual(Job.objects.get(id=running.id).state, Job.RUNNING)
+
+    def test_unknown_job(self):
+        response = self.client.get(reverse('get_job', kwargs={'id': 0}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+# Worker threads use connections of their own, which only see committed data
+@override_settings(DATABASE_REPLICAS=[], JOBS_RUN_IN_WEB_PROCESS=False)
+class TableWorkerCommandTest(APITransactionTestCase):
+    def test_worker_runs_queued_jobs(self):
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=user)
+        data = {'table_name': 'JobTable3', 'fields': [{'name': 'field1', 'type': 'integer'}]}
+        self.client.post(reverse('create_dynamic_table'), data, format='json')
+        model_schema = ModelSchema.objects.get(name='JobTable3')
+        url = reverse('bulk_add_rows_to_dynamic_table', kwargs={'id': model_schema.id})
+        for value in range(3):
+            self.client.post(f'{url}?async=1', [{'field1': value}], format='json')
+
+        output = io.StringIO()
+        call_command('run_table_worker', '--burst', '--concurrency', '2', stdout=output)
+        self.assertEqual(output.getvalue().count(': completed'), 3)
+        self.assertEqual(model_schema.as_model().objects.count(), 3)
+        model_schema.delete()
+
+    def test_running_worker_recovers_stale_jobs(self):
+        stopped = threading.Event()
+        worker = threading.Thread(target=WorkerCommand(stdout=io.StringIO()).work, args=('test', stopped, 0.05, False))
+        worker.start()
+        self.addCleanup(worker.join)
+        self.addCleanup(stopped.set)
+
+        # The job of a worker that died after this one started, which no restart would recover
+        stale = timezone.now() - datetime.timedelta(seconds=settings.JOB_STALE_AFTER + 1)
+        job = Job.objects.create(kind=Job.SCHEMA_UPDATE, state=Job.RUNNING, heartbeat_at=stale, attempts=1, worker='dead')
+        deadline = time.monotonic() + 10
+        while Job.objects.get(id=job.id).attempts == 1 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        job.refresh_from_db()
+        self.assertEqual((job.worker, job.attempts), ('test', 2))
+
+    @override_settings(JOB_WORKER_CONCURRENCY=1)
+    def test_web_process_runs_a_bounded_number_of_jobs(self):
+        started = []
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def handler(job):
+            started.append(job.id)
+            release.wait(10)
+
+        with mock.patch.dict(JOB_HANDLERS, {Job.SCHEMA_UPDATE: handler}), mock.patch('table_builder_app.jobs._executor', None):
+            jobs = [Job.objects.create(kind=Job.SCHEMA_UPDATE) for _ in range(2)]
+            for job in jobs:
+                run_in_background(job.id)
+            time.sleep(0.5)
+            self.assertEqual(started, [jobs[0].id])
+            self.assertEqual(Job.objects.get(id=jobs[1].id).state, Job.QUEUED)
+
+            release.set()
+            deadline = time.monotonic() + 10
+            while Job.objects.filter(state=Job.COMPLETED).count() < 2 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(started, [job.id for job in jobs])
+
+# Buffered rows are written by a thread of the buffer, with a connection of its own
+@override_settings(DATABASE_REPLICAS=[], ROW_WRITE_BUFFER='durable', ROW_WRITE_BUFFER_MAX_ROWS=5, ROW_WRITE_BUFFER_MAX_DELAY=5)
+class RowWriteBufferTest(APITransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        self.addCleanup(row_write_buffer.stop)
+
+    def create_table(self, table_name):
+        data = {'table_name': table_name, 'fields': [{'name': 'field1', 'type': 'integer'}]}
+        self.client.post(reverse('create_dynamic_table'), data, format='json')
+        model_schema = ModelSchema.objects.get(name=table_name)
+        self.addCleanup(model_schema.delete)
+        return model_schema
+
+    def test_concurrent_rows_share_one_flush(self):
+        model_schema = self.create_table('BufferTable1')
+        url = reverse('add_row_to_dynamic_table', kwargs={'id': model_schema.id})
+        responses = []
+
+        def post(value):
+            client = APIClient()
+            client.force_authenticate(user=self.user)
+            responses.append(client.post(url, {'fields': {'field1': value}}, format='json'))
+            connection.close()
+
+        threads = [threading.Thread(target=post, args=(value,)) for value in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_201_CREATED] * 5)
+        self.assertEqual(sorted(model_schema.as_model().objects.values_list('field1', flat=True)), list(range(5)))
+        series = row_buffer_batch_rows._series[(str(model_schema.id),)]
+        self.assertEqual((series['count'], series['sum']), (1, 5))
+
+    @override_settings(ROW_WRITE_BUFFER='async')
+    def test_async_rows_are_accepted_before_they_are_written(self):
+        model_schema = self.create_table('BufferTable2')
+        url = reverse('add_row_to_dynamic_table', kwargs={'id': model_schema.id})
+        response = self.client.post(url, {'fields': {'field1': 1}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(model_schema.as_model().objects.count(), 0)
+
+        row_write_buffer.flush()
+        self.assertEqual(model_schema.as_model().objects.count(), 1)
+
+    async def test_async_endpoint_buffers_rows(self):
+        model_schema = await sync_to_async(self.create_table)('BufferTable4')
+        url = reverse('add_row_to_dynamic_table_async', kwargs={'id': model_schema.id})
+        credentials = base64.b64encode(b'testuser:testpassword').decode()
+        headers = {'authorization': f'Basic {credentials}'}
+
+        responses = await asyncio.gather(*[
+            self.async_client.post(url, {'fields': {'field1': value}}, content_type='application/json', headers=headers)
+            for value in range(5)
+        ])
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_201_CREATED] * 5)
+        self.assertEqual(await model_schema.as_model().objects.acount(), 5)
+        series = row_buffer_batch_rows._series[(str(model_schema.id),)]
+        self.assertEqual((series['count'], series['sum']), (1, 5))
+
+    def test_invalid_rows_are_rejected_before_buffering(self):
+        model_schema = self.create_table('BufferTable3')
+        url = reverse('add_row_to_dynamic_table', kwargs={'id': model_schema.id})
+        response = self.client.post(url, {'fields': {'field1': 'one'}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+# The change hub reads committed changes with a connection of its own
+@override_settings(DATABASE_REPLICAS=[], CHANGE_FEED_POLL_INTERVAL=0.05, CHANGE_FEED_KEEPALIVE=1)
+class ChangeFeedTest(APITransactionTestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=user)
+        credentials = base64.b64encode(b'testuser:testpassword').decode()
+        self.auth_headers = {'authorization': f'Basic {credentials}'}
+        self.addCleanup(change_hub.stop)
+
+    def create_table(self, table_name):
+        data = {'table_name': table_name, 'fields': [{'name': 'field1', 'type': 'integer'}]}
+        self.client.post(reverse('create_dynamic_table'), data, format='json')
+        model_schema = ModelSchema.objects.get(name=table_name)
+        self.addCleanup(model_schema.delete)
+        return model_schema
+
+    async def next_event(self, stream):
+        return await asyncio.wait_for(self.read_event(stream), timeout=10)
+
+    async def read_event(self, stream):
+        while True:
+            chunk = (await anext(stream)).decode()
+            if not chunk.startswith(':'):
+                lines = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+                return int(lines['id']), lines['event'], json.loads(lines['data'])
+
+    async def test_feed_replays_and_follows_changes(self):
+        model_schema = await sync_to_async(self.create_table)('ChangeTable1')
+        row_url = reverse('add_row_to_dynamic_table', kwargs={'id': model_schema.id})
+        await sync_to_async(self.client.post)(row_url, {'fields': {'field1': 1}}, format='json')
+
+        url = reverse('dynamic_table_changes', kwargs={'id': model_schema.id})
+        response = await self.async_client.get(url, {'after': 0}, headers=self.auth_headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        _, kind, data = await self.next_event(stream)
+        self.assertEqual((kind, data['schema_version']), ('schema', 1))
+        change_id, kind, data = await self.next_event(stream)
+        self.assertEqual((kind, [row['field1'] for row in data['rows']]), ('insert', [1]))
+
+        # Later changes are announced by the database, without the feed polling for them
+        await sync_to_async(self.client.post)(row_url, {'fields': {'field1': 2}}, format='json')
+        next_id, kind, data = await self.next_event(stream)
+        self.assertGreater(next_id, change_id)
+        self.assertEqual((kind, [row['field1'] for row in data['rows']]), ('insert', [2]))
+
+        await sync_to_async(self.client.patch)(
+            reverse('get_all_rows_in_dynamic_table', kwargs={'id': model_schema.id}),
+            {'rows': [{'id': data['rows'][0]['id'], 'field1': 3}]}, format='json'
+        )
+        _, kind, data = await self.next_event(stream)
+        self.assertEqual((kind, [row['field1'] for row in data['rows']]), ('upsert', [3]))
+
+        await sync_to_async(self.client.put)(
+            reverse('update_dynamic_table', kwargs={'id': model_schema.id}),
+            {'fields': [{'name': 'field1', 'type': 'string'}]}, format='json'
+        )
+        _, kind, data = await self.next_event(stream)
+        self.assertEqual((kind, data['schema_version']), ('schema', 2))
+        self.assertEqual(data['fields'][1], {'name': 'field1', 'type': 'string'})
+
+        # A client reconnecting with the id of the last event it saw gets the changes after it
+        response = await self.async_client.get(url, headers={'last-event-id': str(change_id), **self.auth_headers})
+        self.assertEqual((await self.next_event(response.streaming_content))[0], next_id)
+
+    @override_settings(CHANGE_FEED_POLL_INTERVAL=3)
+    async def test_feed_is_notified_by_either_driver(self):
+        model_schema = await sync_to_async(self.create_table)('ChangeTable3')
+        url = reverse('dynamic_table_changes', kwargs={'id': model_schema.id})
+        response = await self.async_client.get(url, {'after': 0}, headers=self.auth_headers)
+        stream = response.streaming_content
+        self.assertEqual((await self.next_event(stream))[1], 'schema')
+
+        # Polling would only find the change after CHANGE_FEED_POLL_INTERVAL
+        row_url = reverse('add_row_to_dynamic_table', kwargs={'id': model_schema.id})
+        await sync_to_async(self.client.post)(row_url, {'fields': {'field1': 1}}, format='json')
+        _, kind, _ = await asyncio.wait_for(self.read_event(stream), timeout=2)
+        self.assertEqual(kind, 'insert')
+
+    async def assert_changes_committed_out_of_order_are_delivered(self, *table_names):
+        streams = []
+        model_schemas = []
+        for table_name in table_names:
+            model_schema = await sync_to_async(self.create_table)(table_name)
+            url = reverse('dynamic_table_changes', kwargs={'id': model_schema.id})
+            stream = (await self.async_client.get(url, headers=self.auth_headers)).streaming_content
+            await anext(stream)
+            model_schemas.append(model_schema)
+            streams.append(stream)
+        first, second = (model_schemas * 2)[:2]
+
+        recorded = threading.Event()
+        committed = threading.Event()
+
+        def write(model_schema, pk, wait):
+            try:
+                with transaction.atomic():
+                    TableChange.record(model_schema, TableChange.DELETE, [pk])
+                    if wait:
+                        recorded.set()
+                        committed.wait(10)
+            finally:
+                connection.close()
+
+        # The first change is logged first, but its transaction is still open when the second one commits
+        threads = [threading.Thread(target=write, args=(first, 1, True)), threading.Thread(target=write, args=(second, 2, False))]
+        threads[0].start()
+        recorded.wait(10)
+        threads[1].start()
+        await asyncio.sleep(0.5)
+        committed.set()
+        for thread in threads:
+            await sync_to_async(thread.join, thread_sensitive=False)()
+
+        if len(streams) == 1:
+            events = [await self.next_event(streams[0]) for _ in range(2)]
+            self.assertEqual([data['ids'] for _, _, data in events], [[1], [2]])
+            self.assertLess(events[0][0], events[1][0])
+        else:
+            events = [await self.next_event(stream) for stream in streams]
+            self.assertEqual([data['ids'] for _, _, data in events], [[1], [2]])
+
+    async def test_feed_delivers_changes_committed_out_of_order(self):
+        await self.assert_changes_committed_out_of_order_are_delivered('ChangeTable4')
+
+    @mock.patch.object(ChangeHub, '_listen', return_value=False)
+    async def test_polling_feed_delivers_changes_committed_out_of_order(self, _):
+        await self.assert_changes_committed_out_of_order_are_delivered('ChangeTable5')
+        # Changes of different tables still commit in any order
+        await self.assert_changes_committed_out_of_order_are_delivered('ChangeTable6', 'ChangeTable7')
+
+    async def test_feed_checks_table_and_position(self):
+        model_schema = await sync_to_async(self.create_table)('ChangeTable2')
+        url = reverse('dynamic_table_changes', kwargs={'id': model_schema.id})
+        response = await self.async_client.get(url, {'after': 'last'}, headers=self.auth_headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = await self.async_client.get(reverse('dynamic_table_changes', kwargs={'id': 0}), headers=self.auth_headers)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class TableStatsAPITest(BaseAPITestCase):
+    def test_table_stats(self):
+        fields = [{'name': 'field1', 'type': 'string'}, {'name': 'field2', 'type': 'integer'}]
+        self.create_dynamic_table('StatsTable1', fields)
+        model_schema = ModelSchema.objects.get(name='StatsTable1')
+        rows = [{'field1': f'value{index % 3}', 'field2': index} for index in range(30)]
+        self.client.post(reverse('bulk_add_rows_to_dynamic_table', kwargs={'id': model_schema.id}), rows, format='json')
+        url = reverse('dynamic_table_stats', kwargs={'id': model_schema.id})
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['row_count'], response.data['row_count_exact']), (30, True))
+        self.assertGreater(response.data['size_bytes']['total'], 0)
+        self.assertEqual([column['name'] for column in response.data['columns']], ['id', 'field1', 'field2'])
+        self.assertIsNone(response.data['columns'][1]['distinct_count'])
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {model_schema.db_table}')
+        response = self.client.get(url, {'exact': 1})
+        self.assertEqual(response.data['row_count'], 30)
+        self.assertEqual(response.data['columns'][1]['distinct_count'], 3)
+        self.assertEqual(response.data['columns'][1]['null_count'], 0)
+
+    @override_settings(BULK_INSERT_BATCH_SIZE=10)
+    def test_large_tables_are_estimated(self):
+        self.create_dynamic_table('StatsTable2', [{'name': 'field1', 'type': 'integer'}])
+        model_schema = ModelSchema.objects.get(name='StatsTable2')
+        dynamic_model = model_registry.get_model(get_model_schema(model_schema.id))
+        bulk_insert_rows(dynamic_model, [{'field1': index} for index in range(EXACT_COUNT_LIMIT + 500)])
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {model_schema.db_table}')
+
+        response = self.client.get(reverse('dynamic_table_stats', kwargs={'id': model_schema.id}))
+        self.assertFalse(response.data['row_count_exact'])
+        self.assertEqual(response.data['row_count'], EXACT_COUNT_LIMIT + 500)
+
+class SearchAPITest(BaseAPITestCase):
+    def create_search_table(self, table_name):
+        fields = [
+            {'name': 'title', 'type': 'string', 'searchable': True},
+            {'name': 'body', 'type': 'string', 'searchable': True},
+            {'name': 'rating', 'type': 'integer'},
+        ]
+        response = self.create_dynamic_table(table_name, fields)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        model_schema = ModelSchema.objects.get(name=table_name)
+        rows = [
+            {'title': 'Quick brown fox', 'body': 'jumps over the lazy dog', 'rating': 1},
+            {'title': 'Lazy dog', 'body': 'sleeps all day', 'rating': 2},
+            {'title': 'Fox den', 'body': 'a fox and another fox', 'rating': 3},
+            {'title': 'Cat', 'body': 'purrs', 'rating': 4},
+        ]
+        self.client.post(reverse('bulk_add_rows_to_dynamic_table', kwargs={'id': model_schema.id}), rows, format='json')
+        return model_schema, reverse('get_all_rows_in_dynamic_table', kwargs={'id': model_schema.id})
+
+    def test_search_ranks_matching_rows(self):
+        model_schema, url = self.create_search_table('SearchTable1')
+
+        response = self.client.get(url, {'q': 'fox'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual([row['rating'] for row in response.data], [3, 1])
+        self.assertGreater(response.data[0]['search_rank'], response.data[1]['search_rank'])
+
+        # Web search syntax, filters and projections combine with the search
+        response = self.client.get(url, {'q': 'dog -fox'})
+        self.assertEqual([row['rating'] for row in response.data], [2])
+        response = self.client.get(url, {'q': 'fox', 'rating__gt': 1, 'fields': 'rating'})
+        self.assertEqual(list(response.data), [{'id': 3, 'rating': 3, 'search_rank': response.data[0]['search_rank']}])
+        response = self.client.get(url, {'q': 'lazy', 'ordering': '-rating'})
+        self.assertEqual([row['rating'] for row in response.data], [2, 1])
+
+        # Pages of ranked results continue with a cursor
+        response = self.client.get(url, {'q': 'fox', 'limit': 1})
+        self.assertEqual([row['rating'] for row in response.data], [3])
+        next_url = response['Link'][1:response['Link'].index('>')]
+        response = self.client.get(next_url)
+        self.assertEqual([row['rating'] for row in response.data], [1])
+        self.assertNotIn('Link', response)
+
+        # Rows written later are searchable right away
+        self.client.post(reverse('add_row_to_dynamic_table', kwargs={'id': model_schema.id}), {'fields': {'title': 'Fox', 'body': 'new', 'rating': 5}}, format='json')
+        response = self.client.get(url, {'q': 'fox'})
+        self.assertEqual(sorted(row['rating'] for row in response.data), [1, 3, 5])
+
+    def test_search_requires_searchable_fields(self):
+        self.create_dynamic_table('SearchTable2', [{'name': 'title', 'type': 'string'}])
+        model_schema = ModelSchema.objects.get(name='SearchTable2')
+        response = self.client.get(reverse('get_all_rows_in_dynamic_table', kwargs={'id': model_schema.id}), {'q': 'fox'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.create_dynamic_table('SearchTable3', [{'name': 'count', 'type': 'integer', 'searchable': True}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(ModelSchema.objects.filter(name='SearchTable3').exists())
+
+    def test_schema_updates_rebuild_the_search_column(self):
+        model_schema, url = self.create_search_table('SearchTable4')
+        update_url = reverse('update_dynamic_table', kwargs={'id': model_schema.id})
+
+        # Dropping a searchable field removes it from the search
+        fields = [{'name': 'title', 'type': 'string', 'searchable': True}, {'name': 'rating', 'type': 'integer'}]
+        response = self.client.put(update_url + '?dry_run=1', {'fields': fields}, format='json')
+        self.assertTrue(response.data['rewrites_table'])
+        response = self.client.put(update_url, {'fields': fields}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual(TableSearch.objects.get(model_schema=model_schema).fields, ['title'])
+        response = self.client.get(url, {'q': 'fox'})
+        self.assertEqual(sorted(row['rating'] for row in response.data), [1, 3])
+        response = self.client.get(url, {'q': 'another'})
+        self.assertEqual(list(response.data), [])
+
+        # Changing the type of a searchable field is possible once it is no longer searchable
+        fields = [{'name': 'title', 'type': 'string'}, {'name': 'rating', 'type': 'string', 'searchable': True}]
+        response = self.client.put(update_url, {'fields': fields}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        response = self.client.get(url, {'q': '4'})
+        self.assertEqual([row['title'] for row in response.data], ['Cat'])
+
+        response = self.client.put(update_url, {'fields': [{'name': 'title', 'type': 'string'}, {'name': 'rating', 'type': 'string'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertFalse(TableSearch.objects.filter(model_schema=model_schema).exists())
+        with connection.cursor() as cursor:
+            columns = [column.name for column in connection.introspection.get_table_description(cursor, model_schema.db_table)]
+        self.assertEqual(columns, ['id', 'title', 'rating'])
+
+    def test_trigram_indexes_serve_icontains_filters(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm')")
+            available = cursor.fetchone()[0]
+        response = self.create_dynamic_table('SearchTable5', [{'name': 'title', 'type': 'string', 'trigram': True}])
+        if not available:
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.skipTest('The pg_trgm extension is not available.')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        model_schema = ModelSchema.objects.get(name='SearchTable5')
+        rows = [{'title': f'item {index}'} for index in range(100)] + [{'title': 'Red Fox'}]
+        self.client.post(reverse('bulk_add_rows_to_dynamic_table', kwargs={'id': model_schema.id}), rows, format='json')
+        url = reverse('get_all_rows_in_dynamic_table', kwargs={'id': model_schema.id})
+        response = self.client.get(url, {'title__icontains': 'd fo'})
+        self.assertEqual([row['title'] for row in response.data], ['Red Fox'])
+
+        dynamic_model = model_registry.get_model(get_model_schema(model_schema.id))
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = dynamic_model.objects.filter(title__icontains='d fo').explain()
+        self.assertIn('_trgm', plan)
+
+@override_settings(ROW_DELETE_BATCH_SIZE=2, ROW_DELETE_BATCH_SLEEP=0)
+class DeleteRowsAPITest(BaseAPITestCase):
+    def create_delete_table(self, table_name):
+        self.create_dynamic_table(table_name, [{'name': 'field1', 'type': 'integer'}])
+        self.model_schema = ModelSchema.objects.get(name=table_name)
+        rows = [{'field1': index} for index in range(7)]
+        self.client.post(reverse('bulk_add_rows_to_dynamic_table', kwargs={'id': self.model_schema.id}), rows, format='json')
+        self.url = reverse('get_all_rows_in_dynamic_table', kwargs={'id': self.model_schema.id})
+
+    def test_delete_rows_by_filter(self):
+        self.create_delete_table('DeleteTable1')
+        response = self.client.delete(f'{self.url}?field1__gte=2')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED, response.data)
+        deleted = list(self.model_schema.as_model().objects.filter(field1__gte=2).values_list('id', flat=True))
+
+        job = run_job(claim_job())
+        self.assertEqual(job.state, Job.COMPLETED)
+        self.assertEqual(job.result, {'rows_deleted': 5})
+        self.assertEqual((job.rows_done, job.rows_total), (5, 5))
+        self.assertEqual(sorted(self.model_schema.as_model().objects.values_list('field1', flat=True)), [0, 1])
+        # One change per batch of ROW_DELETE_BATCH_SIZE rows
+        logged = TableChange.objects.filter(model_schema=self.model_schema, kind=TableChange.DELETE)
+        self.assertEqual(logged.count(), 3)
+        self.assertEqual(sorted(pk for change in logged for pk in change.pks), sorted(deleted))
+
+    def test_delete_rows_requires_filters(self):
+        self.create_delete_table('DeleteTable2')
+        for query in ('', '?limit=10', '?field2=1', '?field1=abc', '?q=word'):
+            response = self.client.delete(f'{self.url}{query}')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query)
+            self.assertIn('error', response.data)
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(self.model_schema.as_model().objects.count(), 7)
+
+    def test_delete_rows_unknown_table(self):
+        response = self.client.delete(reverse('get_all_rows_in_dynamic_table', kwargs={'id': 0}) + '?id__gt=0')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+@override_settings(ROW_DELETE_BATCH_SIZE=2, ROW_DELETE_BATCH_SLEEP=0)
+class RetentionPolicyTest(BaseAPITestCase):
+    def create_retention_table(self, table_name, retention):
+        fields = [{'name': 'label', 'type': 'string'}, {'name': 'created', 'type': 'datetime'}]
+        data = {'table_name': table_name, 'fields': fields, 'retention': retention}
+        response = self.client.post(reverse('create_dynamic_table'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        model_schema = ModelSchema.objects.get(name=table_name)
+        now = timezone.now()
+        dynamic_model = model_registry.get_model(get_model_schema(model_schema.id))
+        bulk_insert_rows(dynamic_model, [
+            {'label': f'row{days}', 'created': (now - datetime.timedelta(days=days)).isoformat()} for days in range(5)
+        ])
+        return model_schema
+
+    def test_max_age(self):
+        model_schema = self.create_retention_table('RetentionTable1', {'field': 'created', 'max_age': 2 * 24 * 3600 + 60})
+        out = io.StringIO()
+        call_command('enforce_retention', stdout=out)
+        self.assertIn(f'Table {model_schema.id}: 2 rows deleted', out.getvalue())
+        labels = sorted(model_schema.as_model().objects.values_list('label', flat=True))
+        self.assertEqual(labels, ['row0', 'row1', 'row2'])
+        self.assertIsNotNone(RetentionPolicy.objects.get(model_schema=model_schema).last_run_at)
+
+    def test_keep_latest(self):
+        model_schema = self.create_retention_table('RetentionTable2', {'field': 'created', 'keep_latest': 2})
+        other = self.create_retention_table('RetentionTable3', {'keep_latest': 1})
+        call_command('enforce_retention', table=[model_schema.id], stdout=io.StringIO())
+        labels = sorted(model_schema.as_model().objects.values_list('label', flat=True))
+        self.assertEqual(labels, ['row0', 'row1'])
+        self.assertEqual(other.as_model().objects.count(), 5)
+
+        call_command('enforce_retention', table=[other.id], stdout=io.StringIO())
+        self.assertEqual(list(other.as_model().objects.values_list('label', flat=True)), ['row4'])
+
+    def test_retention_validation(self):
+        fields = [{'name': 'label', 'type': 'string'}, {'name': 'created', 'type': 'datetime'}]
+        for index, retention in enumerate((
+            {'max_age': 60},
+            {'field': 'label', 'max_age': 60},
+            {'field': 'created', 'max_age': 60, 'keep_latest': 1},
+            {'field': 'created', 'keep_latest': 0},
+            {'field': 'missing', 'keep_latest': 1},
+        )):
+            data = {'table_name': f'RetentionInvalidTable{index}', 'fields': fields, 'retention': retention}
+            response = self.client.post(reverse('create_dynamic_table'), data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, retention)
+        self.assertFalse(RetentionPolicy.objects.exists())
+
+        model_schema = self.create_retention_table('RetentionTable5', {'field': 'created', 'max_age': 60})
+        url = reverse('update_dynamic_table', kwargs={'id': model_schema.id})
+        response = self.client.put(url, {'fields': [{'name': 'label', 'type': 'string'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.put(url, {'fields': fields, 'retention': {}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertFalse(RetentionPolicy.objects.filter(model_schema=model_schema).exists())
+
+class PartitionedTableAPITest(BaseAPITestCase):
+    def create_partitioned_table(self, table_name, fields, partition):
+        data = {'table_name': table_name, 'fields': fields, 'partition': partition}
+        response = self.client.post(reverse('create_dynamic_table'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        return ModelSchema.objects.get(name=table_name)
+
+    def test_datetime_partitions_are_created_pruned_and_dropped(self):
+        fields = [{'name': 'label', 'type': 'string'}, {'name': 'created', 'type': 'datetime'}]
+        model_schema = self.create_partitioned_table('PartitionedTable1', fields, {'field': 'created', 'interval': 'month'})
+        now = timezone.now()
+        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        old = month_start.replace(year=now.year - 1)
+
+        url = reverse('add_row_to_dynamic_table', kwargs={'id': model_schema.id})
+        for label, created in (('new', now), ('old', old)):
+            response = self.client.post(url, {'fields': {'label': label, 'created': created.isoformat()}}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+
+        partitions_url = reverse('dynamic_table_partitions', kwargs={'id': model_schema.id})
+        response = self.client.get(partitions_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['interval'], 'month')
+        # From the month of the old row up to two months ahead of the current one
+        self.assertEqual(len(response.data['partitions']), 15)
+        self.assertEqual(response.data['partitions'][0]['from'], old)
+
+        # Filters on the key only scan the matching partitions
+        dynamic_model = model_registry.get_model(get_model_schema(model_schema.id))
+        plan = dynamic_model.objects.filter(created__gte=now - datetime.timedelta(minutes=1)).explain()
+        self.assertEqual(plan.count(f'{dynamic_model._meta.db_table}_p'), 3)
+
+        rows_url = reverse('get_all_rows_in_dynamic_table', kwargs={'id': model_schema.id})
+        response = self.client.get(rows_url, {'created__lt': (now - datetime.timedelta(days=30)).isoformat()})
+        self.assertEqual([row['label'] for row in response.data], ['old'])
+
+        response = self.client.delete(f'{partitions_url}?before={month_start.isoformat().replace("+", "%2B")}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['partitions']), 12)
+        response = self.client.get(rows_url)
+        self.assertEqual([row['label'] for row in response.data], ['new'])
+
+    def test_primary_key_partitions_for_bulk_inserts(self):
+        fields = [{'name': 'amount', 'type': 'integer'}]
+        model_schema = self.create_partitioned_table('PartitionedTable2', fields, {'field': 'id', 'interval': 10})
+        url = reverse('bulk_add_rows_to_dynamic_table', kwargs={'id': model_schema.id})
+        response = self.client.post(url, [{'amount': index} for index in range(35)], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+
+        partitioning = TablePartitioning.objects.get(model_schema=model_schema)
+        self.assertEqual((partitioning.first_partition, partitioning.last_partition), (0, 5))
+        response = self.client.get(reverse('dynamic_table_partitions', kwargs={'id': model_schema.id}))
+        self.assertEqual([partition['from'] for partition in response.data['partitions']], [0, 10, 20, 30, 40, 50])
+
+        response = self.client.get(reverse('get_all_rows_in_dynamic_table', kwargs={'id': model_schema.id}))
+        self.assertEqual(len(response.data), 35)
+
+    def test_detached_partitions_can_be_created_again(self):
+        fields = [{'name': 'n', 'type': 'integer'}]
+        model_schema = self.create_partitioned_table('PartitionedTable6', fields, {'field': 'n', 'interval': 10})
+        url = reverse('add_row_to_dynamic_table', kwargs={'id': model_schema.id})
+        for n in (5, 35):
+            response = self.client.post(url, {'fields': {'n': n}}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+
+        partitions_url = reverse('dynamic_table_partitions', kwargs={'id': model_schema.id})
+        response = self.client.delete(f'{partitions_url}?before=30&detach=true')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        detached = response.data['partitions']
+        self.assertEqual(len(detached), 3)
+        self.assertTrue(all('_detached_' in name for name in detached))
+
+        # The range of a detached partition gets a new partition, next to the detached table
+        response = self.client.post(url, {'fields': {'n': 5}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(sorted(model_schema.as_model().objects.values_list('n', flat=True)), [5, 35])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(detached[0])}')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_unique_indexes_must_include_partition_key(self):
+        fields = [{'name': 'code', 'type': 'string'}, {'name': 'n', 'type': 'integer'}]
+        data = {
+            'table_name': 'PartitionedTable7', 'fields': fields, 'partition': {'field': 'n', 'interval': 10},
+            'indexes': [{'fields': ['code'], 'unique': True}],
+        }
+        response = self.client.post(reverse('create_dynamic_table'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('partition key', response.data['error'])
+
+        data['table_name'] = 'PartitionedTable8'
+        data['indexes'] = [{'fields': ['code', 'n'], 'unique': True}]
+        response = self.client.post(reverse('create_dynamic_table'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+
+    def test_upsert_into_partitioned_table(self):
+        fields = [{'name': 'label', 'type': 'string'}, {'name': 'n', 'type': 'integer'}]
+        model_schema = self.create_partitioned_table('PartitionedTable5', fields, {'field': 'n', 'interval': 10})
+        url = reverse('get_all_rows_in_dynamic_table', kwargs={'id': model_schema.id})
+        self.client.post(
+            reverse('bulk_add_rows_to_dynamic_table', kwargs={'id': model_schema.id}),
+            [{'label': 'a', 'n': 5}, {'label': 'b', 'n': 15}], format='json'
+        )
+        existing = dict(model_schema.as_model().objects.values_list('label', 'id'))
+
+        rows = [
+            {'id': existing['a'], 'label': 'a2', 'n': 5},
+            {'id': existing['b'] + 100, 'label': 'c', 'n': 25},
+            {'id': existing['b'], 'label': 'b2'},
+        ]
+        response = self.client.patch(url, {'key': 'id', 'rows': rows}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS, response.data)
+        self.assertEqual((response.data['inserted'], response.data['updated']), (1, 1))
+        # Partial rows of a partitioned table need the partition key to find their row
+        self.assertEqual([error['index'] for error in response.data['errors']], [2])
+        labels = dict(model_schema.as_model().objects.values_list('id', 'label'))
+        self.assertEqual(labels, {existing['a']: 'a2', existing['b']: 'b', existing['b'] + 100: 'c'})
+
+    def test_invalid_partition_declarations(self):
+        fields = [{'name': 'label', 'type': 'string'}, {'name': 'created', 'type': 'datetime'}]
+        for index, partition in enumerate((
+            {'field': 'label', 'interval': 10},
+            {'field': 'created', 'interval': 'year'},
+            {'field': 'id', 'interval': 0},
+            {'field': 'missing', 'interval': 10},
+        )):
+            data = {'table_name': f'PartitionedTable3_{index}', 'fields': fields, 'partition': partition}
+            response = self.client.post(reverse('create_dynamic_table'), data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertFalse(ModelSchema.objects.filter(name=f'PartitionedTable3_{index}').exists())
+
+    def test_partition_key_cannot_change(self):
+        fields = [{'name': 'label', 'type': 'string'}, {'name': 'created', 'type': 'datetime'}]
+        model_schema = self.create_partitioned_table('PartitionedTable4', fields, {'field': 'created', 'interval': 'day'})
+        response = self.client.put(
+            reverse('update_dynamic_table', kwargs={'id': model_schema.id}),
+            {'fields': [{'name': 'label', 'type': 'string'}, {'name': 'created', 'type': 'string'}]}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('partition key', response.data['error'])
+
+        response = self.client.get(reverse('dynamic_table_partitions', kwargs={'id': model_schema.id}))
+        self.assertEqual(len(response.data['partitions']), 3)
+
+
+class AsyncRowsAPITest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        credentials = base64.b64encode(b'testuser:testpassword').decode()
+        self.auth_headers = {'authorization': f'Basic {credentials}'}
+
+    def create_async_table(self, table_name):
+        fields = [{'name': 'field1', 'type': 'string'}, {'name': 'field2', 'type': 'integer'}]
+        self.create_dynamic_table(table_name, fields)
+        return ModelSchema.objects.get(name=table_name)
+
+    async def read_stream(self, response):
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    async def test_async_add_and_read_rows(self):
+        model_schema = await sync_to_async(self.create_async_table)('AsyncTable1')
+        url = reverse('add_row_to_dynamic_table_async', kwargs={'id': model_schema.id})
+        for index, value in enumerate(['a', 'b', 'c']):
+            response = await self.async_client.post(
+                url, {'fields': {'field1': value, 'field2': index}}, content_type='application/json', headers=self.auth_headers
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        url = reverse('get_all_rows_in_dynamic_table_async', kwargs={'id': model_schema.id})
+        response = await self.async_client.get(url, {'field2__gte': 1, 'fields': 'field1'}, headers=self.auth_headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = json.loads(await self.read_stream(response))
+        self.assertEqual([row['field1'] for row in rows], ['b', 'c'])
+        self.assertEqual(set(rows[0]), {'id', 'field1'})
+
+        response = await self.async_client.get(url, {'stream': 'ndjson', 'after': rows[0]['id']}, headers=self.auth_headers)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = (await self.read_stream(response)).decode().splitlines()
+        self.assertEqual([json.loads(line)['field1'] for line in lines], ['c'])
+
+        # Rows added through the async endpoint change the table's ETag like any other write
+        etag = response['ETag']
+        response = await self.async_client.get(url, {'stream': 'ndjson'}, headers={'if-none-match': etag, **self.auth_headers})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_async_views_check_permissions_and_input(self):
+        model_schema = await sync_to_async(self.create_async_table)('AsyncTable2')
+        url = reverse('add_row_to_dynamic_table_async', kwargs={'id': model_schema.id})
+
+        response = await self.async_client.post(url, {'fields': {'field1': 'a', 'field2': 1}}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        response = await self.async_client.post(url, {'fields': 'a'}, content_type='application/json', headers=self.auth_headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = await self.async_client.get(url, headers=self.auth_headers)
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+        url = reverse('get_all_rows_in_dynamic_table_async', kwargs={'id': model_schema.id})
+        response = await self.async_client.get(url, {'unknown': 1}, headers=self.auth_headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        url = reverse('get_all_rows_in_dynamic_table_async', kwargs={'id': 0})
+        response = await self.async_client.get(url, headers=self.auth_headers)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_async_row_is_recorded_in_its_transaction(self):
+        model_schema = await sync_to_async(self.create_async_table)('AsyncTable3')
+        url = reverse('add_row_to_dynamic_table_async', kwargs={'id': model_schema.id})
+        with mock.patch.object(TableVersion, 'bump_data_version', side_effect=DatabaseError('unavailable')):
+            response = await self.async_client.post(
+                url, {'fields': {'field1': 'a', 'field2': 1}}, content_type='application/json', headers=self.auth_headers
+            )
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertEqual(await model_schema.as_model().objects.acount(), 0)
+
+class RequestMetricsTest(BaseAPITestCase):
+    def test_server_timing_header(self):
+        response = self.create_dynamic_table('MetricsTable1', [{'name': 'field1', 'type': 'string'}])
+        self.assertIn('ddl;dur=', response['Server-Timing'])
+
+        model_schema = ModelSchema.objects.get(name='MetricsTable1')
+        url = reverse('get_all_rows_in_dynamic_table', kwargs={'id': model_schema.id})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    def test_metrics_endpoint(self):
+        self.create_dynamic_table('MetricsTable2', [{'name': 'field1', 'type': 'string'}])
+        model_schema = ModelSchema.objects.get(name='MetricsTable2')
+        url = reverse('add_row_to_dynamic_table', kwargs={'id': model_schema.id})
+        self.client.post(url, {'fields': {'field1': 'a'}}, format='json')
+
+        response = self.client.get(reverse('get_metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertNotIn('Server-Timing', response)
+
+        content = response.content.decode()
+        labels = f'endpoint="add_row_to_dynamic_table",table_id="{model_schema.id}"'
+        self.assertIn(f'table_builder_request_duration_seconds_count{{{labels}}}', content)
+        self.assertIn(f'table_builder_request_phase_duration_seconds_bucket{{{labels},phase="db",le="+Inf"}}', content)
+        self.assertIn(f'table_builder_response_size_bytes_count{{{labels}}}', content)
+        self.assertIn('# TYPE table_builder_model_cache_hits_total counter', content)
+        self.assertNotIn('endpoint="get_metrics"', content)
+        self.assertIn('# TYPE table_builder_db_connections_opened_total counter', content)
+
+    def test_pool_samples(self):
+        class Pool:
+            def get_stats(self):
+                return {'pool_max': 8, 'pool_size': 4, 'pool_available': 1, 'requests_num': 12}
+
+        self.assertEqual(get_pool_samples(connection), [])
+        samples = {name: value for name, _, _, value in get_pool_samples(SimpleNamespace(pool=Pool()))}
+        self.assertEqual(samples['table_builder_db_pool_available'], 1)
+        self.assertEqual(samples['table_builder_db_requests_num_total'], 12)
+        self.assertEqual(samples['table_builder_db_requests_waiting'], 0)
+
+class ReplicaRoutingTest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        replica_selector.reset()
+        self.addCleanup(replica_selector.reset)
+
+    @override_settings(DATABASE_REPLICAS=['replica1', 'replica2', 'replica3'], DATABASE_REPLICA_MAX_LAG=5.0)
+    def test_round_robin_skips_lagging_replicas(self):
+        lags = {'replica1': 0.5, 'replica2': 30.0, 'replica3': 1.0}
+        selector = ReplicaSelector(measure_lag=lags.get)
+        self.assertEqual([selector.select() for _ in range(4)], ['replica1', 'replica3', 'replica3', 'replica1'])
+
+    @override_settings(
+        DATABASE_REPLICAS=['replica1', 'replica2', 'replica3'], DATABASE_REPLICA_SELECTION='least_lag',
+        DATABASE_REPLICA_MAX_LAG=5.0
+    )
+    def test_least_lag(self):
+        lags = {'replica1': 2.0, 'replica3': 1.0}
+
+        def measure_lag(alias):
+            if alias not in lags:
+                raise DatabaseError('could not connect to server')
+            return lags[alias]
+
+        selector = ReplicaSelector(measure_lag=measure_lag)
+        self.assertEqual([selector.select() for _ in range(3)], ['replica3', 'replica3', 'replica3'])
+
+        lags.update(replica1=10.0, replica3=10.0)
+        selector._lags.clear()
+        self.assertIsNone(selector.select())
+
+    @override_settings(DATABASE_REPLICAS=['replica1'], DATABASE_REPLICA_PIN_SECONDS=10)
+    def test_writes_pin_client_to_primary(self):
+        response = self.create_dynamic_table('ReplicaTable1', [{'name': 'field1', 'type': 'string'}])
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 10)
+
+        factory = RequestFactory()
+        request = factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.assertIsNone(get_read_alias(request))
+        self.assertIsNone(get_read_alias(factory.post('/')))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_pin_without_replicas(self):
+        response = self.create_dynamic_table('ReplicaTable2', [{'name': 'field1', 'type': 'string'}])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'Set DATABASE_REPLICA_URLS to run the read replica tests.')
+class ReplicaDatabaseTest(APITransactionTestCase):
+    databases = {'default', *settings.DATABASE_REPLICAS}
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        replica_selector.reset()
+        self.addCleanup(replica_selector.reset)
+
+    def test_reads_go_to_replica_unless_pinned(self):
+        data = {'table_name': 'ReplicaTable3', 'fields': [{'name': 'field1', 'type': 'string'}]}
+        self.client.post(reverse('create_dynamic_table'), data, format='json')
+        model_schema = ModelSchema.objects.get(name='ReplicaTable3')
+        url = reverse('get_all_rows_in_dynamic_table', kwargs={'id': model_schema.id})
+        replica = connections[settings.DATABASE_REPLICAS[0]]
+
+        # Pinned by the cookie set when the table was created
+        with CaptureQueriesContext(replica) as replica_queries:
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.assertEqual(len(replica_queries), 0)
+
+        del self.client.cookies[PIN_COOKIE]
+        with CaptureQueriesContext(replica) as replica_queries:
+            response = self.client.get(url, {'stream': 'ndjson'})
+            self.assertEqual(b''.join(response.streaming_content), b'')
+        self.assertTrue(any(model_schema.db_table in query['sql'] for query in replica_queries))
+
+
+class BenchCommandTest(BaseAPITestCase):
+    def test_bench_writes_results_and_compares_with_baseline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            options = ['--in-place', '--repeat', '2', '--field-counts', '2', '--bulk-sizes', '10', '--table-sizes', '20']
+            call_command('bench', *options, '--output', output, stdout=io.StringIO())
+
+            with open(output) as output_file:
+                results = json.load(output_file)['results']
+            self.assertEqual(
+                [result['scenario'] for result in results],
+                ['create_table', 'insert_row', 'insert_bulk', 'read_rows', 'read_rows', 'read_rows', 'update_schema'],
+            )
+            for result in results:
+                self.assertEqual(result['runs'], 2)
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+                self.assertGreater(result['queries'], 0)
+            self.assertFalse(ModelSchema.objects.filter(name__startswith='bench').exists())
+
+            stdout = io.StringIO()
+            call_command('bench', '--in-place', '--scenario', 'insert_row', '--repeat', '2', '--baseline', output, stdout=stdout)
+            self.assertIn('insert_row[]', stdout.getvalue())
+
+    def test_compare_results(self):
+        baseline = [{'scenario': 'read_rows', 'params': {'limit': 10}, 'p50_ms': 10.0, 'p95_ms': 20.0, 'p99_ms': 30.0, 'queries': 2}]
+        current = [{'scenario': 'read_rows', 'params': {'limit': 10}, 'p50_ms': 12.0, 'p95_ms': 20.0, 'p99_ms': 15.0, 'queries': 2}]
+
+        comparisons, regressions = compare_results(current, baseline, threshold=0.1)
+        self.assertEqual(len(comparisons), 4)
+        self.assertEqual([(metric, round(change, 2)) for _, metric, _, _, change in regressions], [('p50_ms', 0.2)])
+
+class DynamicModelRegistryTest(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.registry = DynamicModelRegistry()
+
+    def create_registry_table(self, table_name):
+        fields = [{'name': 'field1', 'type': 'string'}, {'name': 'field2', 'type': 'integer'}]
+        self.create_dynamic_table(table_name, fields)
+        self.model_schema = ModelSchema.objects.get(name=table_name)
+
+    def test_model_class_is_reused_while_schema_is_unchanged(self):
+        self.create_registry_table('RegistryTable1')
+        first = self.registry.get_model(get_model_schema(self.model_schema.id))
+        second = self.registry.get_model(get_model_schema(self.model_schema.id))
+
+        self.assertIs(first, second)
+        self.assertEqual(self.registry.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_schema_update_rebuilds_model_class(self):
+        self.create_registry_table('RegistryTable2')
+        before = self.registry.get_model(get_model_schema(self.model_schema.id))
+
+        url = reverse('update_dynamic_table', kwargs={'id': self.model_schema.id})
+        data = {'fields': [{'name': 'field1', 'type': 'string'}, {'name': 'field4', 'type': 'boolean'}]}
+        response = self.client.put(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        after = self.registry.get_model(get_model_schema(self.model_schema.id))
+        self.assertIsNot(before, after)
+        self.assertEqual([f.name for f in after._meta.fields], ['id', 'field1', 'field4'])
+
+    def test_validator_is_compiled_once_per_schema_version(self):
+        self.create_registry_table('RegistryTable4')
+        validator = self.registry.get_validator(get_model_schema(self.model_schema.id))
+        self.assertIs(self.registry.get_validator(get_model_schema(self.model_schema.id)), validator)
+
+        TableVersion.objects.filter(model_schema=self.model_schema).update(schema_version=F('schema_version') + 1)
+        self.assertIsNot(self.registry.get_validator(get_model_schema(self.model_schema.id)), validator)
+
+    def test_warm_builds_all_classes_with_one_query(self):
+        self.create_registry_table('RegistryTable5')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertGreaterEqual(self.registry.warm(), 1)
+        self.assertEqual(len(queries), 1)
+
+        model_schema = get_model_schema(self.model_schema.id)
+        with CaptureQueriesContext(connection) as queries:
+            dynamic_model = self.registry.get_model(model_schema)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(self.registry.stats()['hits'], 1)
+        self.assertEqual([f.name for f in dynamic_model._meta.fields], ['id', 'field1', 'field2'])
+        self.assertEqual(dynamic_model._meta.get_field('field1').max_length, 255)
+
+    def test_version_bump_from_another_worker_invalidates_cached_class(self):
+        self.create_registry_table('RegistryTable3')
+        before = self.registry.get_model(get_model_schema(self.model_schema.id))
+
+        # Another worker changing the table only touches the shared version row
+        TableVersion.objects.filter(model_schema=self.model_schema).update(schema_version=F('schema_version') + 1)
+
+        after = self.registry.get_model(get_model_schema(self.model_schema.id))
+        self.assertIsNot(before, after)
+        self.assertEqual(self.registry.stats()['misses'], 2)
@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.db import transaction
+
+from .indexes import build_indexes, sync_indexes
+from .jobs import job_handler
+from .models import ColumnMigration, Job
+from .online import start_column_migration
+from .registry import get_model_schema, model_registry
+from .schema import SchemaUpdatePlan
+from .deletes import sync_retention_policy
+from .search import sync_search
+
+
+class SchemaUpdateResult:
+    def __init__(self, dynamic_model, migration=None, migration_job=None, pending_indexes=()):
+        self.dynamic_model = dynamic_model
+        self.migration = migration
+        self.migration_job = migration_job
+        self.pending_indexes = list(pending_indexes)
+
+
+def apply_schema_update(plan, indexes=None, retention=None):
+    """
+    Apply a planned schema update and record the index changes, in one transaction.
+
+    Type changes of an online plan are queued as a column migration job.
+    ``indexes`` is the requested list of indexes, or None to keep the
+    current ones. New indexes are returned unbuilt: they are built with
+    build_indexes() once the schema change is committed. The search objects
+    of the table follow the ``searchable`` and ``trigram`` options of its
+    fields. ``retention`` is the requested retention policy, an empty object
+    to remove it, or None to keep the current one.
+    """
+    model_schema = plan.model_schema
+    with transaction.atomic():
+        # Search objects would block changes to the columns they cover; they are created again below
+        if plan.search_columns_changed:
+            sync_search(model_schema, plan.dynamic_model, None)
+        plan.apply()
+
+        migration = migration_job = None
+        if plan.online and plan.altered:
+            migration, migration_job = start_column_migration(plan)
+
+        # Regenerate the model class after the update
+        model_registry.invalidate(model_schema)
+        dynamic_model = model_registry.get_model(model_schema)
+
+        sync_search(model_schema, dynamic_model, plan.search)
+        if retention is not None:
+            sync_retention_policy(model_schema, dynamic_model, retention)
+
+        pending_indexes = []
+        if indexes is not None:
+            pending_indexes = sync_indexes(model_schema, dynamic_model, indexes)
+    return SchemaUpdateResult(dynamic_model, migration, migration_job, pending_indexes)
+
+
+@job_handler(Job.SCHEMA_UPDATE)
+def run_schema_update_job(job):
+    """
+    Plan and apply a schema update queued by the update endpoint.
+
+    The plan is made again from the requested fields, so a job that runs
+    again after an interruption only applies what is still missing.
+    """
+    model_schema = get_model_schema(job.model_schema_id)
+    if model_schema.column_migrations.filter(state__in=ColumnMigration.ACTIVE_STATES).exists():
+        raise RuntimeError('A column migration is still running for this table.')
+
+    dynamic_model = model_registry.get_model(model_schema)
+    plan = SchemaUpdatePlan(
+        model_schema, dynamic_model, job.payload['fields'], settings.ALLOW_FIELD_DELETION,
+        online=job.payload.get('online', False)
+    )
+    # A table rewrite is a single statement; its rows only count as done once it finishes
+    rows = (plan.estimate_row_count() or 0) if plan.rewrites_table else 0
+    job.report_progress(0, rows)
+    update = apply_schema_update(plan, job.payload.get('indexes'), job.payload.get('retention'))
+    job.report_progress(rows)
+    build_indexes(update.dynamic_model, update.pending_indexes)
+    return {
+        'changes': plan.describe(),
+        'migration_id': update.migration.id if update.migration else None,
+        'migration_job_id': update.migration_job.id if update.migration_job else None,
+    }
@@ -1,10 +1,25 @@
 from django.urls import path
-from .views import create_dynamic_table, update_dynamic_table, add_row_to_dynamic_table, get_all_rows_in_dynamic_table
+from .async_views import add_row_to_dynamic_table_async, dynamic_table_changes, get_all_rows_in_dynamic_table_async
+from .views import (
+    create_dynamic_table, update_dynamic_table, add_row_to_dynamic_table, bulk_add_rows_to_dynamic_table,
+    get_all_rows_in_dynamic_table, aggregate_dynamic_table, dynamic_table_stats, get_column_migration,
+    dynamic_table_partitions, get_job, get_metrics,
+)
 
 urlpatterns = [
     # Define your app's API endpoints here
     path('table/', create_dynamic_table, name='create_dynamic_table'),
     path('table/<int:id>/', update_dynamic_table, name='update_dynamic_table'),
     path('table/<int:id>/row/', add_row_to_dynamic_table, name='add_row_to_dynamic_table'),
+    path('table/<int:id>/rows/bulk/', bulk_add_rows_to_dynamic_table, name='bulk_add_rows_to_dynamic_table'),
     path('table/<int:id>/rows/', get_all_rows_in_dynamic_table, name='get_all_rows_in_dynamic_table'),
+    path('table/<int:id>/aggregate/', aggregate_dynamic_table, name='aggregate_dynamic_table'),
+    path('table/<int:id>/stats/', dynamic_table_stats, name='dynamic_table_stats'),
+    path('table/<int:id>/migrations/<int:migration_id>/', get_column_migration, name='get_column_migration'),
+    path('table/<int:id>/partitions/', dynamic_table_partitions, name='dynamic_table_partitions'),
+    path('table/<int:id>/changes/', dynamic_table_changes, name='dynamic_table_changes'),
+    path('async/table/<int:id>/row/', add_row_to_dynamic_table_async, name='add_row_to_dynamic_table_async'),
+    path('async/table/<int:id>/rows/', get_all_rows_in_dynamic_table_async, name='get_all_rows_in_dynamic_table_async'),
+    path('jobs/<int:id>/', get_job, name='get_job'),
+    path('metrics/', get_metrics, name='get_metrics'),
 ]
\ No newline at end of file
@@ -1,3 +1,6 @@
+import io
+import itertools
+
 from django.db import models
 from django.contrib import admin
 
@@ -29,4 +32,72 @@ def create_model(name, fields=None, app_label='', module='', options=None, admin
             setattr(Admin, key, value)
         admin.site.register(model, Admin)
 
-    return model
\ No newline at end of file
+    return model
+
+
+def iter_batches(iterable, size):
+    """
+    Yield lists of at most ``size`` items from any iterable
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+async def aiter_batches(aiterable, size):
+    """
+    Yield lists of at most ``size`` items from an async iterable
+    """
+    batch = []
+    async for item in aiterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def is_psycopg3(connection):
+    """
+    Tell whether a Postgres connection uses psycopg 3 rather than psycopg2
+    """
+    return connection.vendor == 'postgresql' and connection.Database.__name__ == 'psycopg'
+
+
+def copy_from_stdin(cursor, sql, data):
+    """
+    Run a ``COPY ... FROM STDIN`` statement with ``data`` as its input, with either driver
+    """
+    if is_psycopg3(cursor.db):
+        with cursor.copy(sql) as copy:
+            copy.write(data)
+    else:
+        cursor.copy_expert(sql, io.StringIO(data))
+
+
+def copy_to_stdout(cursor, sql):
+    """
+    Run a ``COPY ... TO STDOUT`` statement and return its output, with either driver
+    """
+    if is_psycopg3(cursor.db):
+        with cursor.copy(sql) as copy:
+            return b''.join(bytes(data) for data in copy).decode()
+    buffer = io.StringIO()
+    cursor.copy_expert(sql, buffer)
+    return buffer.getvalue()
+
+
+def mogrify(cursor, sql, params):
+    """
+    Return ``sql`` with ``params`` inlined by the driver, with either driver
+    """
+    if is_psycopg3(cursor.db):
+        # Cursors binding parameters on the server cannot inline them
+        from psycopg import ClientCursor
+
+        return ClientCursor(cursor.db.connection).mogrify(sql, params)
+    return cursor.mogrify(sql, params).decode()
@@ -0,0 +1,143 @@
+from django.db import connection
+
+from .filters import BOOLEAN_VALUES, RowQueryError, coerce_datetime, get_data_type
+
+
+class InvalidValue(ValueError):
+    """
+    Raised by a column check for a value that does not fit the column.
+    """
+
+
+class RowValidator:
+    """
+    Validation and coercion of rows for one version of a table schema.
+
+    The checks of every column are compiled once into small functions, so
+    validating a row is a walk over its keys, without building a model
+    instance or sending a query. Unknown fields, types, nullability and
+    maximum lengths are checked; uniqueness is left to the database.
+    """
+
+    def __init__(self, dynamic_model):
+        self.checks = {}
+        self.required = []
+        for field in dynamic_model._meta.concrete_fields:
+            self.checks[field.attname] = compile_check(field)
+            if not field.primary_key and not field.null and not field.has_default():
+                self.required.append(field.attname)
+
+    def validate(self, row, partial=False):
+        """
+        Return the coerced values of a row and None, or None and a dict of errors keyed by field name.
+
+        A ``partial`` row may leave out required fields, e.g. to update some
+        columns of an existing row.
+        """
+        if not isinstance(row, dict):
+            return None, {'non_field_errors': ['Expected a dictionary with field names and values.']}
+
+        checks = self.checks
+        values = {}
+        errors = {}
+        for name, value in row.items():
+            check = checks.get(name)
+            if check is None:
+                errors[name] = ['Unknown field.']
+                continue
+            try:
+                values[name] = check(value)
+            except InvalidValue as e:
+                errors[name] = [str(e)]
+        if not partial:
+            for name in self.required:
+                if name not in row:
+                    errors[name] = ['This field is required.']
+
+        if errors:
+            return None, errors
+        return values, None
+
+
+def compile_check(field):
+    """
+    Return a function converting a JSON value to the Python value of a model field.
+    """
+    data_type = get_data_type(field)
+    if data_type in ('character', 'text'):
+        convert = _compile_string_check(field.max_length if data_type == 'character' else None)
+    elif data_type == 'integer':
+        convert = _compile_integer_check(*connection.ops.integer_field_range(field.get_internal_type()))
+    elif data_type == 'float':
+        convert = _check_float
+    elif data_type == 'boolean':
+        convert = _check_boolean
+    else:
+        convert = _check_datetime
+
+    nullable = field.null
+
+    def check(value):
+        if value is None:
+            if nullable:
+                return None
+            raise InvalidValue('This field cannot be null.')
+        return convert(value)
+    return check
+
+
+def _compile_string_check(max_length):
+    def check(value):
+        if type(value) is not str:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise InvalidValue('Expected a string.')
+            value = str(value)
+        if max_length is not None and len(value) > max_length:
+            raise InvalidValue(f'Ensure this value has at most {max_length} characters (it has {len(value)}).')
+        return value
+    return check
+
+
+def _compile_integer_check(min_value, max_value):
+    def check(value):
+        if type(value) is not int:
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            elif isinstance(value, str):
+                try:
+                    value = int(value.strip())
+                except ValueError:
+                    raise InvalidValue('Expected an integer.')
+            else:
+                raise InvalidValue('Expected an integer.')
+        if (min_value is not None and value < min_value) or (max_value is not None and value > max_value):
+            raise InvalidValue(f'Ensure this value is between {min_value} and {max_value}.')
+        return value
+    return check
+
+
+def _check_float(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise InvalidValue('Expected a number.')
+    try:
+        return float(value)
+    except ValueError:
+        raise InvalidValue('Expected a number.')
+
+
+def _check_boolean(value):
+    if type(value) is bool:
+        return value
+    try:
+        return BOOLEAN_VALUES[str(value).lower()]
+    except KeyError:
+        raise InvalidValue('Expected true or false.')
+
+
+def _check_datetime(value):
+    if not isinstance(value, str):
+        raise InvalidValue('Expected an ISO 8601 date and time.')
+    try:
+        return coerce_datetime('', value)
+    except RowQueryError:
+        raise InvalidValue('Expected an ISO 8601 date and time.')
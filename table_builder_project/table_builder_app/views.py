@@ -1,17 +1,46 @@
 # Create your views here.
+from types import GeneratorType
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, parser_classes, renderer_classes
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
 from rest_framework.response import Response
 from dynamic_models.models import ModelSchema, FieldSchema
 from django.core.exceptions import ValidationError
-from django.db import transaction, connection, models
+from django.db import DatabaseError, transaction, connection, models
 from django.conf import settings
-
-FIELD_TYPE_MAPPING = {
-    'string': 'character',
-    'integer': 'integer',
-    'boolean': 'boolean'
-}
+from django.http import HttpResponse
+from django.urls import reverse
+from .models import ColumnMigration, Job, TableChange, TableVersion
+from .registry import model_registry, get_model_schema
+from .parsers import NDJSONParser
+from .bulk import bulk_insert_rows, bulk_upsert_rows, get_job_payload, get_upsert_key
+from .indexes import build_indexes, sync_indexes
+from .schema import FIELD_TYPE_MAPPING, SchemaUpdatePlan
+from .filters import RowQuery, RowQueryError, coerce_value, get_data_type, keyset_condition
+from .aggregates import AggregateQuery
+from .pagination import get_cursor, get_keyset_params, get_page
+from .streaming import STREAM_CONTENT_TYPES, streaming_rows_response
+from .exports import EXPORT_RENDERERS, ExportRenderer, ExportUnavailable, export_rows_response
+from .caching import (
+    get_etag, get_not_modified_response, get_page_cache, get_page_cache_key, get_table_version,
+    set_conditional_headers,
+)
+from .stats import get_table_stats
+from .search import get_table_search, parse_search_options, sync_search
+from .deletes import enqueue_delete_rows, parse_delete_filters, sync_retention_policy
+from .buffering import row_write_buffer
+from .changes import record_rows_added, record_rows_upserted
+from .metrics import (
+    buffered_rows_failed, connections_opened, get_pool_samples, get_startup_samples, render_metrics, timed,
+)
+from .routers import reads_from_replica
+from .online import describe_migration
+from .jobs import describe_job, enqueue_job
+from .updates import apply_schema_update
+from .partitions import (
+    drop_partitions, ensure_partitions, get_partitioning, list_partitions, parse_partitioning, partition_table,
+)
 
 @api_view(['POST'])
 def create_dynamic_table(request):
@@ -35,25 +64,48 @@ def create_dynamic_table(request):
     try:
         with transaction.atomic():
             model_schema = ModelSchema.objects.create(name=table_name)
-            dynamic_model = model_schema.as_model()
             for field in fields:
                 name = field.get('name')
                 field_type = field.get('type')
                 data_type = FIELD_TYPE_MAPPING.get(field_type)
                 if not data_type:
-                    raise ValidationError(f'Invalid field type: {field_type}. Supported types are "string", "integer", and "boolean".')
+                    raise ValidationError(f'Invalid field type: {field_type}. Supported types are "string", "integer", "boolean" and "datetime".')
                 
                 FieldSchema.objects.create(model_schema=model_schema, name=name, data_type=data_type)
 
             # Regenerate the model class after new fields are added
             try:
-                dynamic_model = model_schema.as_model()
+                model_registry.invalidate(model_schema)
+                dynamic_model = model_registry.get_model(model_schema)
             except ValidationError as e:
                 return Response(
                     {'error': f'Invalid model fields: {e}'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-                            
+
+            # Partition the table before anything is built on it
+            partition = request.data.get('partition')
+            if partition:
+                if connection.vendor != 'postgresql':
+                    raise ValidationError('Partitioned tables require PostgreSQL.')
+                partitioning = parse_partitioning(dynamic_model, partition)
+                partitioning.model_schema = model_schema
+                partition_table(dynamic_model, partitioning)
+
+            # Searchable and trigram indexed string fields
+            table_search = parse_search_options(fields)
+            if table_search is not None:
+                sync_search(model_schema, dynamic_model, table_search)
+
+            retention = request.data.get('retention')
+            if retention is not None:
+                sync_retention_policy(model_schema, dynamic_model, retention)
+
+            # Build the declared indexes right away, the new table is still empty
+            indexes = request.data.get('indexes')
+            if indexes:
+                build_indexes(dynamic_model, sync_indexes(model_schema, dynamic_model, indexes))
+
     except ValidationError as e:
         return Response(
             {'error': str(e)},
@@ -73,7 +125,7 @@ def create_dynamic_table(request):
 @api_view(['PUT'])
 def update_dynamic_table(request, id):
     try:
-        model_schema = ModelSchema.objects.get(id=id)
+        model_schema = get_model_schema(id)
     except ModelSchema.DoesNotExist:
         return Response(
             {'error': 'Table with the provided ID does not exist.'},
@@ -87,69 +139,99 @@ def update_dynamic_table(request, id):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    online = request.query_params.get('online') in ('1', 'true')
+    if online and connection.vendor != 'postgresql':
+        return Response(
+            {'error': 'Online column type changes require PostgreSQL.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # The table structure is frozen while shadow columns are being backfilled
+    if model_schema.column_migrations.filter(state__in=ColumnMigration.ACTIVE_STATES).exists():
+        return Response(
+            {'error': 'A column migration is still running for this table. Try again once it has finished.'},
+            status=status.HTTP_409_CONFLICT
+        )
+
+    # Compare the requested fields with the stored ones and plan all column changes at once
     try:
-        with transaction.atomic():
-            # Get the existing field names in the model schema
-            existing_field_names = set(model_schema.fields.values_list('name', flat=True))
+        dynamic_model = model_registry.get_model(model_schema)
+        plan = SchemaUpdatePlan(model_schema, dynamic_model, fields, settings.ALLOW_FIELD_DELETION, online=online)
+    except ValidationError as e:
+        return Response(
+            {'error': '; '.join(e.messages)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
-            for field in fields:
-                name = field.get('name')
-                field_type = field.get('type')
-                if not name or not field_type:
-                    return Response(
-                        {'error': 'Invalid field data. Each field should have a name and a type.'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
+    if request.query_params.get('dry_run') in ('1', 'true'):
+        return Response(
+            {
+                'changes': plan.describe(),
+                'statements': plan.get_statements(),
+                'rewrites_table': plan.rewrites_table,
+                'estimated_rows': plan.estimate_row_count(),
+            },
+            status=status.HTTP_200_OK
+        )
 
-                data_type = FIELD_TYPE_MAPPING.get(field_type)
-                if not data_type:
-                    return Response(
-                        {'error': f'Invalid field type: {field_type}. Supported types are "string", "integer", and "boolean".'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-                # Check if the field already exists in the model schema
-                existing_field = FieldSchema.objects.filter(model_schema=model_schema, name=name).first()
-                if existing_field:
-                    # Update existing field's type if it has changed
-                    if existing_field.data_type != data_type:
-                        existing_field.data_type = data_type
-                        existing_field.save()
-                    # Remove the field name from the existing_field_names set as it's already handled
-                    existing_field_names.discard(name)
-                else:
-                    # Create a new field if it doesn't exist
-                    FieldSchema.objects.create(model_schema=model_schema, name=name, data_type=data_type)
-
-            # Remove any fields that are present in the model schema but not in the request data
-            if settings.ALLOW_FIELD_DELETION:
-                FieldSchema.objects.filter(model_schema=model_schema, name__in=existing_field_names).delete()
-
-                dynamic_model = model_schema.as_model()
-                with connection.schema_editor() as schema_editor:
-                    for field_name_to_remove in existing_field_names:
-                        schema_editor.remove_field(dynamic_model, dynamic_model._meta.get_field(field_name_to_remove))
-
-            # Regenerate the model class after the update
-            try:
-                dynamic_model = model_schema.as_model()
-            except ValidationError as e:
-                return Response(
-                    {'error': f'Invalid model fields: {e}'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
+    # Long schema changes can run as a job; the response links to its status
+    indexes = request.data.get('indexes') if 'indexes' in request.data else None
+    retention = request.data.get('retention')
+    if request.query_params.get('async') in ('1', 'true'):
+        job = enqueue_job(
+            Job.SCHEMA_UPDATE, model_schema, {'fields': fields, 'online': online, 'indexes': indexes, 'retention': retention}
+        )
+        return job_accepted_response(job, f'Update of table with ID {id} queued.')
+
+    # Type changes of an online update are backfilled by a job once committed
+    try:
+        update = apply_schema_update(plan, indexes, retention)
+    except ValidationError as e:
+        return Response(
+            {'error': '; '.join(e.messages)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     except Exception as e:
         return Response(
             {'error': f'Error updating table: {e}'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+    # Outside of a transaction this uses CREATE INDEX CONCURRENTLY on Postgres
+    try:
+        build_indexes(update.dynamic_model, update.pending_indexes)
+    except DatabaseError as e:
+        return Response(
+            {'error': f'Table structure updated, but an index could not be created: {e}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if update.migration:
+        return Response(
+            {
+                'message': f'Table structure for table with ID {id} updated. Column types are being changed online.',
+                'migration': describe_migration(update.migration),
+                'job': describe_job(update.migration_job),
+                'status_url': reverse('get_column_migration', args=[id, update.migration.id]),
+            },
+            status=status.HTTP_202_ACCEPTED
+        )
+
     return Response(
         {'message': f'Table structure for table with ID {id} updated successfully!'},
         status=status.HTTP_200_OK
     )
 
+def job_accepted_response(job, message):
+    return Response(
+        {
+            'message': message,
+            'job': describe_job(job),
+            'status_url': reverse('get_job', args=[job.id]),
+        },
+        status=status.HTTP_202_ACCEPTED
+    )
+
 @api_view(['POST'])
 def add_row_to_dynamic_table(request, id):
     try:
@@ -163,18 +245,45 @@ def add_row_to_dynamic_table(request, id):
 
         # Get the dynamic model
         try:
-            model_schema = ModelSchema.objects.get(id=id)
+            model_schema = get_model_schema(id)
         except ModelSchema.DoesNotExist:
             return Response(
                 {'error': 'Table with the provided ID does not exist.'},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        dynamic_model = model_schema.as_model()
+        dynamic_model = model_registry.get_model(model_schema)
 
-        # Step 4: Create the new row
-        new_row = dynamic_model(**fields_data)
-        new_row.save()
+        # Check the values against the table schema before sending any SQL
+        values, errors = model_registry.get_validator(model_schema).validate(fields_data)
+        if errors:
+            return Response(
+                {'error': 'Invalid fields data. The values do not match the table schema.', 'errors': errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Concurrent inserts can share one transaction through the write buffer
+        if settings.ROW_WRITE_BUFFER:
+            pending = row_write_buffer.add(model_schema, dynamic_model, values)
+            if settings.ROW_WRITE_BUFFER == 'async':
+                return Response(
+                    {'message': 'New row accepted and will be added shortly.'},
+                    status=status.HTTP_202_ACCEPTED
+                )
+            pending.wait()
+            if pending.error is not None:
+                raise pending.error
+            return Response(
+                {'message': 'New row added successfully!'},
+                status=status.HTTP_201_CREATED
+            )
+
+        # Step 4: Create the new row, also filling shadow columns of a running column migration
+        new_row = dynamic_model(**values)
+        ensure_partitions(get_partitioning(model_schema), dynamic_model, [new_row])
+        with transaction.atomic():
+            new_row.save()
+            record_rows_added(model_schema, dynamic_model, [new_row.pk])
 
         # Step 6: Return the response
         return Response(
@@ -182,6 +291,11 @@ def add_row_to_dynamic_table(request, id):
             status=status.HTTP_201_CREATED
         )
 
+    except ValidationError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     except Exception as e:
         # Step 5: Handle errors
         return Response(
@@ -189,40 +303,423 @@ def add_row_to_dynamic_table(request, id):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-@api_view(['GET'])
+@api_view(['POST'])
+@parser_classes([JSONParser, NDJSONParser])
+def bulk_add_rows_to_dynamic_table(request, id):
+    try:
+        model_schema = get_model_schema(id)
+    except ModelSchema.DoesNotExist:
+        return Response(
+            {'error': 'Table with the provided ID does not exist.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    # A JSON array arrives as a list, an NDJSON body as a lazy generator of rows
+    rows = request.data
+    if not isinstance(rows, (list, GeneratorType)):
+        return Response(
+            {'error': 'Invalid rows data. Expected a JSON array or an NDJSON stream of row objects.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Large payloads can be inserted by a job; the rows are read in full before responding
+    if request.query_params.get('async') in ('1', 'true'):
+        payload = get_job_payload(rows)
+        if not payload['rows']:
+            return Response(
+                {'error': 'Please provide at least one row in the request body.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        job = enqueue_job(Job.BULK_INSERT, model_schema, payload)
+        return job_accepted_response(job, f'Insert of {len(payload["rows"])} rows queued.')
+
+    try:
+        dynamic_model = model_registry.get_model(model_schema)
+        result = bulk_insert_rows(
+            dynamic_model, rows, partitioning=get_partitioning(model_schema),
+            validator=model_registry.get_validator(model_schema),
+            written=lambda pks: record_rows_added(model_schema, dynamic_model, pks)
+        )
+    except Exception as e:
+        return Response(
+            {'error': f'Error adding rows: {e}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    if not result.total:
+        return Response(
+            {'error': 'Please provide at least one row in the request body.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if not result.errors:
+        response_status = status.HTTP_201_CREATED
+    elif result.inserted:
+        response_status = status.HTTP_207_MULTI_STATUS
+    else:
+        response_status = status.HTTP_400_BAD_REQUEST
+
+    return Response(
+        {
+            'message': f'{result.inserted} of {result.total} rows added.',
+            'inserted': result.inserted,
+            'errors': result.errors,
+        },
+        status=response_status
+    )
+
+@reads_from_replica
+@api_view(['GET', 'PATCH', 'DELETE'])
+@renderer_classes([JSONRenderer, BrowsableAPIRenderer, *EXPORT_RENDERERS])
 def get_all_rows_in_dynamic_table(request, id):
+    # Only safe methods are routed to a replica, so writes reach the primary
+    if request.method == 'PATCH':
+        return upsert_rows_in_dynamic_table(request, id)
+    if request.method == 'DELETE':
+        return delete_rows_in_dynamic_table(request, id)
+
     try:
-        model_schema = ModelSchema.objects.get(id=id)
+        model_schema = get_model_schema(id)
     except ModelSchema.DoesNotExist:
         return Response(
             {'error': 'Table with the provided ID does not exist.'},
             status=status.HTTP_404_NOT_FOUND
         )
 
-    # Regenerate the model class to ensure any changes to the table structure are reflected
+    # Answer polls of an unchanged table from its change token, without reading any rows
+    table_version = get_table_version(model_schema)
+    etag = get_etag(table_version, request.accepted_renderer.format)
+    not_modified = get_not_modified_response(request, table_version, etag)
+    if not_modified is not None:
+        return set_conditional_headers(not_modified, table_version, etag)
+
+    # Serve JSON pages from the page cache when it is enabled
+    page_cache = None
+    if isinstance(request.accepted_renderer, JSONRenderer) and 'stream' not in request.query_params:
+        page_cache = get_page_cache()
+    if page_cache is not None:
+        cache_key = get_page_cache_key(model_schema, table_version, 'json', request.query_params)
+        cached_page = page_cache.get(cache_key)
+        if cached_page is not None:
+            response = HttpResponse(cached_page['content'], content_type='application/json', headers=cached_page['headers'])
+            return set_conditional_headers(response, table_version, etag)
+
+    # Fetch the model class, rebuilt only if the table structure has changed
     try:
-        dynamic_model = model_schema.as_model()
+        dynamic_model = model_registry.get_model(model_schema)
     except Exception as e:
         return Response(
             {'error': f'Error regenerating dynamic model: {e}'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-    # Retrieve all rows from the database for the dynamically generated model
+    # Compile filters, ordering, projection and pagination into a single query
+    try:
+        row_query = RowQuery(dynamic_model, request.query_params, get_table_search(model_schema))
+        after, limit = get_keyset_params(request.query_params)
+        cursor = get_cursor(request.query_params, len(row_query.ordering))
+    except ValueError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if after is not None and not row_query.is_default_ordering:
+        return Response(
+            {'error': 'The "after" parameter only applies to rows ordered by id. Use "cursor" together with "ordering".'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    stream_format = request.query_params.get('stream')
+    if stream_format is not None and stream_format not in STREAM_CONTENT_TYPES:
+        return Response(
+            {'error': f'Invalid stream format: {stream_format}. Supported formats are "json" and "ndjson".'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # CSV, Arrow and Parquet are picked with the Accept header or ?format=
+    renderer = request.accepted_renderer
+    export_format = renderer.format if isinstance(renderer, ExportRenderer) else None
+
+    paginated = limit is not None and not stream_format and not export_format
+    rows = row_query.get_queryset(include_ordering_fields=paginated)
+    if after is not None:
+        rows = rows.filter(pk__gt=after)
+    if cursor is not None:
+        rows = rows.filter(keyset_condition(row_query.ordering, cursor))
+
+    if export_format:
+        try:
+            response = export_rows_response(row_query, rows, export_format, model_schema.name, limit=limit)
+        except ExportUnavailable as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_406_NOT_ACCEPTABLE
+            )
+        return set_conditional_headers(response, table_version, etag)
+
+    if stream_format:
+        if limit is not None:
+            rows = rows[:limit]
+        return set_conditional_headers(streaming_rows_response(rows, stream_format), table_version, etag)
+
+    # Retrieve the requested rows, one page at a time when a limit is given
+    headers = {}
     try:
-        rows = dynamic_model.objects.all()
+        if limit is None:
+            serialized_rows = list(rows)
+        else:
+            serialized_rows, link = get_page(request, row_query, rows, limit)
+            if link:
+                headers['Link'] = link
     except Exception as e:
         return Response(
             {'error': f'Error retrieving rows from the dynamic model: {e}'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-    # Serialize the rows and return the response
-    serialized_rows = []
-    for row in rows:
-        serialized_row = {
-            field.name: getattr(row, field.name) for field in dynamic_model._meta.fields
-        }
-        serialized_rows.append(serialized_row)
+    if page_cache is not None:
+        with timed('serialize'):
+            content = JSONRenderer().render(serialized_rows)
+        page_cache.set(cache_key, {'content': content, 'headers': headers})
+        response = HttpResponse(content, content_type='application/json', headers=headers)
+    else:
+        response = Response(serialized_rows, status=status.HTTP_200_OK, headers=headers)
+    return set_conditional_headers(response, table_version, etag)
+
+
+def upsert_rows_in_dynamic_table(request, id):
+    try:
+        model_schema = get_model_schema(id)
+    except ModelSchema.DoesNotExist:
+        return Response(
+            {'error': 'Table with the provided ID does not exist.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    if connection.vendor != 'postgresql':
+        return Response(
+            {'error': 'Upserts require PostgreSQL.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    rows = request.data.get('rows') if isinstance(request.data, dict) else None
+    if not rows or not isinstance(rows, list):
+        return Response(
+            {'error': 'Please provide the rows to insert or update as a list in "rows".'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        dynamic_model = model_registry.get_model(model_schema)
+        key_fields = get_upsert_key(model_schema, dynamic_model, request.data.get('key', 'id'))
+    except ValidationError as e:
+        return Response(
+            {'error': '; '.join(e.messages)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        result = bulk_upsert_rows(
+            dynamic_model, key_fields, rows, partitioning=get_partitioning(model_schema),
+            validator=model_registry.get_validator(model_schema),
+            written=lambda pks: record_rows_upserted(model_schema, dynamic_model, pks)
+        )
+    except Exception as e:
+        return Response(
+            {'error': f'Error writing rows: {e}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    if not result.errors:
+        response_status = status.HTTP_200_OK
+    elif result.pks:
+        response_status = status.HTTP_207_MULTI_STATUS
+    else:
+        response_status = status.HTTP_400_BAD_REQUEST
+
+    return Response(
+        {
+            'message': f'{result.inserted} rows inserted and {result.updated} rows updated, out of {result.total}.',
+            'inserted': result.inserted,
+            'updated': result.updated,
+            'errors': result.errors,
+        },
+        status=response_status
+    )
+
+def delete_rows_in_dynamic_table(request, id):
+    try:
+        model_schema = get_model_schema(id)
+    except ModelSchema.DoesNotExist:
+        return Response(
+            {'error': 'Table with the provided ID does not exist.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    # The filters of the rows endpoint select the rows to delete
+    try:
+        dynamic_model = model_registry.get_model(model_schema)
+        filters, _ = parse_delete_filters(dynamic_model, request.query_params)
+    except ValidationError as e:
+        return Response(
+            {'error': '; '.join(e.messages)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except ValueError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Rows are deleted in throttled batches by a job; the response links to its status
+    job = enqueue_delete_rows(model_schema, dynamic_model, filters)
+    return job_accepted_response(job, f'Deletion of rows from table with ID {id} queued.')
+
+@reads_from_replica
+@api_view(['GET'])
+def aggregate_dynamic_table(request, id):
+    try:
+        model_schema = get_model_schema(id)
+    except ModelSchema.DoesNotExist:
+        return Response(
+            {'error': 'Table with the provided ID does not exist.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    # Compile aggregates, grouping and filters into a single query
+    try:
+        dynamic_model = model_registry.get_model(model_schema)
+        aggregate_query = AggregateQuery(dynamic_model, request.query_params)
+    except ValueError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
-    return Response(serialized_rows, status=status.HTTP_200_OK)
\ No newline at end of file
+    try:
+        result = aggregate_query.execute()
+    except Exception as e:
+        return Response(
+            {'error': f'Error aggregating rows of the dynamic model: {e}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    return Response(result, status=status.HTTP_200_OK)
+
+@reads_from_replica
+@api_view(['GET'])
+def dynamic_table_stats(request, id):
+    try:
+        model_schema = get_model_schema(id)
+    except ModelSchema.DoesNotExist:
+        return Response(
+            {'error': 'Table with the provided ID does not exist.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    # Estimates come from the planner statistics; exact=1 counts every row
+    exact = request.query_params.get('exact', '').lower() in ('1', 'true')
+    try:
+        dynamic_model = model_registry.get_model(model_schema)
+        stats = get_table_stats(dynamic_model, exact=exact)
+    except Exception as e:
+        return Response(
+            {'error': f'Error reading table statistics: {e}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    return Response({'table_id': model_schema.id, **stats}, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+def get_column_migration(request, id, migration_id):
+    try:
+        migration = ColumnMigration.objects.get(id=migration_id, model_schema_id=id)
+    except ColumnMigration.DoesNotExist:
+        return Response(
+            {'error': 'Column migration with the provided ID does not exist.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    return Response(describe_migration(migration), status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+def get_job(request, id):
+    try:
+        job = Job.objects.get(id=id)
+    except Job.DoesNotExist:
+        return Response(
+            {'error': 'Job with the provided ID does not exist.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    return Response(describe_job(job), status=status.HTTP_200_OK)
+
+@api_view(['GET', 'DELETE'])
+def dynamic_table_partitions(request, id):
+    try:
+        model_schema = get_model_schema(id)
+    except ModelSchema.DoesNotExist:
+        return Response(
+            {'error': 'Table with the provided ID does not exist.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    partitioning = get_partitioning(model_schema)
+    if partitioning is None:
+        return Response(
+            {'error': 'The table is not partitioned.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    dynamic_model = model_registry.get_model(model_schema)
+    if request.method == 'GET':
+        return Response(
+            {
+                'field': partitioning.field,
+                'interval': partitioning.period or partitioning.interval,
+                'partitions': list_partitions(partitioning, dynamic_model),
+            },
+            status=status.HTTP_200_OK
+        )
+
+    # Drop (or detach) whole partitions below the given key, instead of deleting their rows
+    before = request.query_params.get('before')
+    if before is None:
+        return Response(
+            {'error': 'Please provide the "before" parameter.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        before = coerce_value(get_data_type(dynamic_model._meta.get_field(partitioning.field)), 'before', before)
+    except RowQueryError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    detach = request.query_params.get('detach', '').lower() in ('1', 'true')
+    with transaction.atomic():
+        removed = drop_partitions(partitioning, dynamic_model, before, detach=detach)
+        if removed:
+            TableChange.record(model_schema, TableChange.DELETE, details={'partitions': removed})
+            TableVersion.bump_data_version(model_schema)
+
+    return Response(
+        {
+            'message': f'{len(removed)} partitions {"detached" if detach else "dropped"}.',
+            'partitions': removed,
+        },
+        status=status.HTTP_200_OK
+    )
+
+@api_view(['GET'])
+def get_metrics(request):
+    registry_stats = model_registry.stats()
+    content = render_metrics([
+        ('table_builder_model_cache_hits_total', 'counter', 'Model class lookups served from the registry.', registry_stats['hits']),
+        ('table_builder_model_cache_misses_total', 'counter', 'Model class lookups that built a new class.', registry_stats['misses']),
+        ('table_builder_model_cache_size', 'gauge', 'Model classes held by the registry.', registry_stats['size']),
+        ('table_builder_db_connections_opened_total', 'counter', 'Database connections opened by this process.', connections_opened.value),
+        ('table_builder_row_buffer_failed_rows_total', 'counter', 'Buffered rows that could not be written.', buffered_rows_failed.value),
+        *get_pool_samples(connection),
+        *get_startup_samples(),
+    ])
+    return HttpResponse(content, content_type='text/plain; version=0.0.4; charset=utf-8')
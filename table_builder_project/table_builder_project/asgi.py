@@ -8,9 +8,15 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
 
 import os
+import time
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'table_builder_project.settings')
 
+start = time.perf_counter()
 application = get_asgi_application()
+
+from table_builder_app.startup import warm_up  # noqa: E402
+
+warm_up(setup_duration=time.perf_counter() - start)
@@ -8,9 +8,15 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/wsgi/
 """
 
 import os
+import time
 
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'table_builder_project.settings')
 
+start = time.perf_counter()
 application = get_wsgi_application()
+
+from table_builder_app.startup import warm_up  # noqa: E402
+
+warm_up(setup_duration=time.perf_counter() - start)